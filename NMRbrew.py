@@ -1,4 +1,7 @@
 #!/usr/bin/env python3
 
-from nmrbrew.nmrbrew import main
-main() 
+# Import worker processes are spawned, and re-import this script as __mp_main__; only
+# start the application (and load Qt) when run directly
+if __name__ == '__main__':
+    from nmrbrew.nmrbrew import main
+    main()
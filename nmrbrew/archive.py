@@ -0,0 +1,175 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading archive.py')
+
+import io
+import os
+import posixpath
+import tarfile
+import zipfile
+from functools import partial
+
+import nmrglue as ng
+
+from .header_index import acqus_header
+
+# Separates the archive file from the experiment folder within it in experiment paths,
+# e.g. /data/study.zip!study/10
+ARCHIVE_SEPARATOR = '!'
+
+ARCHIVE_FILTER = 'Archives (*.zip *.tar *.tar.gz *.tgz *.tar.bz2 *.tbz2 *.tar.xz)'
+
+
+def is_archive(path):
+    '''
+    Return True if path is a zip or tar (optionally compressed) file.
+    '''
+    return os.path.isfile(path) and (zipfile.is_zipfile(path) or tarfile.is_tarfile(path))
+
+
+def archive_path(archive, folder):
+    return archive + ARCHIVE_SEPARATOR + folder
+
+
+def split_archive_path(path):
+    '''
+    Split an experiment path into (archive, folder within the archive). For experiments
+    on disk the archive is None.
+    '''
+    start = 0
+    while True:
+        i = path.find(ARCHIVE_SEPARATOR, start)
+        if i == -1:
+            return None, path
+        if os.path.isfile(path[:i]):
+            return path[:i], path[i + 1:]
+        start = i + 1
+
+
+def parse_jcamp(raw):
+    '''
+    Parse the contents of a Bruker JCAMP-DX file (e.g. acqus) read from an archive.
+    '''
+    try:
+        text = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        text = raw.decode('cp1252')
+
+    dic = {'_coreheader': [], '_comments': []}
+    return ng.bruker.parse_jcamp_file(io.StringIO(text), dic)
+
+
+class BrukerArchive(object):
+    '''
+    Read-only access to the Bruker experiments in a zip or tar (optionally compressed)
+    archive, without extracting it to disk.
+
+    Tar archives are read as a stream, one sequential pass per call, so compressed tarballs
+    are never seeked (nor extracted); zip members are read directly. An import takes two
+    passes: headers reads only the acqus members, then read_experiments streams the fids.
+
+    :param path: Archive filename
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.is_zip = zipfile.is_zipfile(path)
+
+    def members(self):
+        '''
+        Generator yielding (name, read) for each file in the archive, in archive order;
+        read() returns the member contents and must be called before the next member.
+        '''
+        if self.is_zip:
+            with zipfile.ZipFile(self.path) as zf:
+                for info in zf.infolist():
+                    if not info.filename.endswith('/'):
+                        yield info.filename, partial(zf.read, info)
+
+        else:
+            with tarfile.open(self.path, 'r|*') as tf:
+                for info in tf:
+                    if info.isfile():
+                        yield info.name, lambda info=info: tf.extractfile(info).read()
+
+    def headers(self):
+        '''
+        Return the acqus headers (as for scan_bruker_experiments) of the experiment folders
+        in the archive (those containing a fid). Only acqus members are read. Paths are of
+        the form archive!folder.
+
+        Zip experiments are sorted as when walking a folder; tar experiments are kept in
+        archive order, so reading them back never holds more than one in memory.
+        '''
+        mtime = os.path.getmtime(self.path)
+        fids = []
+        acqus = {}
+        for name, read in self.members():
+            folder, f = posixpath.split(name)
+            if 'pdata' in folder.split('/'):
+                continue  # Processed data never holds further experiments
+
+            if f == 'fid':
+                fids.append(folder)
+            elif f == 'acqus':
+                try:
+                    acqus[folder] = parse_jcamp(read())
+                except Exception as e:
+                    logging.warning("Could not read %s: %s" % (name, e))
+
+        if self.is_zip:
+            fids.sort(key=lambda folder: folder.split('/'))
+
+        headers = []
+        for folder in fids:
+            scan = posixpath.basename(folder)
+            if scan == '99999' or scan == '9999':  # Dummy Bruker thing
+                continue
+
+            if folder not in acqus:
+                logging.warning("No acqus for %s" % folder)
+                continue
+
+            header = acqus_header(acqus[folder])
+            header['path'] = archive_path(self.path, folder)
+            header['mtime'] = mtime
+            headers.append(header)
+
+        return headers
+
+    def read_experiments(self, folders, names=('acqus', 'fid')):
+        '''
+        Generator yielding (folder, files) for each of folders, in the given order, where
+        files is a dict of the contents of the named members of that folder; None if any
+        are missing. Experiments that complete ahead of their turn are held until yielded.
+        '''
+        if self.is_zip:
+            with zipfile.ZipFile(self.path) as zf:
+                for folder in folders:
+                    try:
+                        files = dict((f, zf.read(posixpath.join(folder, f))) for f in names)
+                    except KeyError:
+                        files = None
+                    yield folder, files
+            return
+
+        wanted = set(folders)
+        partial_files = {}
+        complete = {}
+        n = 0
+        for name, read in self.members():
+            folder, f = posixpath.split(name)
+            if folder not in wanted or f not in names:
+                continue
+
+            files = partial_files.setdefault(folder, {})
+            files[f] = read()
+            if len(files) == len(names):
+                complete[folder] = partial_files.pop(folder)
+
+                while n < len(folders) and folders[n] in complete:
+                    yield folders[n], complete.pop(folders[n])
+                    n += 1
+
+        for folder in folders[n:]:
+            yield folder, complete.pop(folder, None)
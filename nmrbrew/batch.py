@@ -0,0 +1,128 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading batch.py')
+
+import os
+import sys
+import json
+import time
+import argparse
+
+from .processing import (import_spectra, remove_solvent, phase_correct,
+    peak_alignment, baseline_correction,
+    peak_scaling, exclude_regions,
+    icoshift_, filter_noise,
+    binning, compress_bins, normalisation, variance_stabilisation, export_spectra
+    )
+from .processing.executor import Executor, BACKENDS
+
+# Tools (by the name used in .nmrbrew files) in the order of the main window, with the
+# kernel each runs. PCA is left out as its result is only viewed.
+PIPELINE = [
+    ('ImportSpectra', import_spectra.load_bruker),
+
+    ('RemoveSolvent', remove_solvent.solvent),
+    ('PhaseCorrect', phase_correct.autophase),
+
+    ('PeakAlignment', peak_alignment.shift),
+    ('BaselineCorrection', baseline_correction.baseline),
+    ('PeakScaling', peak_scaling.scale),
+
+    ('ExcludeRegions', exclude_regions.exclude),
+
+    ('Icoshift', icoshift_.shift),
+
+    ('FilterNoise', filter_noise.noise),
+    ('Binning', binning.binning),
+    ('CompressBins', compress_bins.exclude),
+
+    ('Normalisation', normalisation.normalise),
+    ('VarianceStabilisation', variance_stabilisation.variance),
+
+    ('ExportSpectra', export_spectra.export),
+]
+
+# Tools whose kernels take an executor (ToolBase.is_row_parallel)
+ROW_PARALLEL = ['PhaseCorrect', 'PeakAlignment', 'BaselineCorrection', 'PeakScaling', 'Binning']
+
+
+def load_configuration(filename):
+    '''
+    Read a .nmrbrew configuration file (as written by MainWindow.onSaveConfig).
+    '''
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def run_pipeline(configuration, folder, output, progress_callback=None, executor=None):
+    '''
+    Run every active tool of a configuration in turn, importing the experiments under folder
+    (or an archive) and exporting the result to output. Tools not in the configuration are
+    skipped, as when loading it in the main window; import and export always run. Per-spectrum
+    tools are run with executor (default serially).
+
+    Returns the final spectra.
+    '''
+    tool_configs = configuration['tools']
+
+    spc = None
+    for name, kernel in PIPELINE:
+        tool_config = dict(tool_configs.get(name, {}))
+
+        if name == 'ImportSpectra':
+            tool_config['filename'] = folder
+        elif name == 'ExportSpectra':
+            tool_config['filename'] = output
+            tool_config['format'] = os.path.splitext(output)[1]
+        elif not tool_config.get('is_active', False):
+            logging.info("Skipping %s" % name)
+            continue
+
+        logging.info("Running %s" % name)
+        t = time.time()
+        kwargs = {'executor': executor} if name in ROW_PARALLEL else {}
+        result = kernel(spc, tool_config, progress_callback or (lambda p: None), **kwargs)
+        spc = result['spc']
+        if executor is not None and executor.backend == 'process':
+            spc.share()  # Workers attach to the spectra rather than be sent a copy
+        logging.info("%s finished in %.1fs" % (name, time.time() - t))
+
+    return spc
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='nmrbrew-batch',
+        description='Process a folder of Bruker experiments with a saved NMRBrew configuration, without the user interface.',
+    )
+    parser.add_argument('configuration', help='NMRBrew configuration file (.nmrbrew)')
+    parser.add_argument('input', help='Folder (or archive) of Bruker experiments')
+    parser.add_argument('-o', '--output', help='Export filename (.csv, .tsv or .txt); defaults to the export filename in the configuration')
+    parser.add_argument('-e', '--executor', choices=BACKENDS, default='serial', help='How per-spectrum tools are run (default: serial)')
+    parser.add_argument('-w', '--workers', type=int, default=0, help='Workers for the thread or process executor (default: one per CPU)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Log each tool as it runs')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    configuration = load_configuration(args.configuration)
+
+    output = args.output or configuration['tools'].get('ExportSpectra', {}).get('filename')
+    if not output:
+        parser.error('no output filename given, and none in the configuration')
+
+    executor = Executor(args.executor, args.workers)
+    try:
+        spc = run_pipeline(configuration, args.input, output, executor=executor)
+    except Exception as e:
+        logging.error(e)
+        return 1
+    finally:
+        executor.close()
+
+    print("Exported %d spectra to %s" % (spc.data.shape[0], output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1010 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading bruker.py')
+
+'''
+Bruker reading and transform helpers for the import tool.
+
+Kept free of any Qt imports so the functions can be shipped to (and imported by)
+worker processes cheaply; everything here must remain picklable at module level.
+'''
+
+import os
+import re
+import mmap
+import threading
+import itertools
+import multiprocessing
+from collections import deque
+from functools import partial
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import numpy as np
+import nmrglue as ng
+
+from .archive import BrukerArchive, is_archive, split_archive_path, parse_jcamp
+from .cache import FidCache
+from .header_index import HeaderIndex, read_acqus_header
+from .qc import fid_truncation, quality_control, qc_pass
+from .processing.cancel import check_cancelled
+
+try:
+    import scipy.fft as fftpack
+except ImportError:  # scipy < 1.4; numpy has no workers argument
+    fftpack = None
+
+# Storage dtype of imported spectra for each import 'precision' setting. Once the imaginary
+# part is discarded the data is the matching real type (float64/float32).
+SPECTRA_DTYPES = {
+    'double': np.complex128,
+    'single': np.complex64,
+}
+
+
+def spectra_dtype(config):
+    '''
+    Return the complex dtype imported spectra are stored as, from config['precision'].
+    '''
+    return np.dtype(SPECTRA_DTYPES.get(config.get('precision'), np.complex128))
+
+
+def transform_fid(dic, data, config={}):
+
+    # remove the digital filter
+    if config.get('remove_digital_filter'):
+        data = ng.bruker.remove_digital_filter(dic, data)
+
+    # process the spectrum
+    if config.get('zero_fill'):
+        data = ng.proc_base.zf_size(data, config.get('zero_fill_to'))    # zero fill to 32768 points
+
+    #data = ng.process.proc_bl.sol_boxcar(data, w=16, mode='same')  # Solvent removal
+
+    data = ng.proc_base.fft(data)               # Fourier transform
+
+    # data = ng.proc_base.di(data)                # discard the imaginaries
+
+    if config.get('reverse_spectra'):
+        data = ng.proc_base.rev(data)               # reverse the data
+
+    return data.astype(spectra_dtype(config), copy=False)
+
+
+def load_bruker_fid(fn, config={}):
+    dic, data = read_bruker_fid(fn)
+    if data is None:
+        return None, None
+
+    return dic, transform_fid(dic, data, config)
+
+
+def read_bruker_fid(fn):
+    '''
+    Read the raw (untransformed) fid for a single experiment folder. Returns (None, None)
+    if the experiment can't be read, matching load_bruker_fid.
+    '''
+    try:
+        logging.debug("Reading %s" % fn)
+        return ng.bruker.read(fn)
+    except Exception as e:
+        logging.warning(e)
+        return None, None
+
+
+def read_bruker_fid_mmap(fn):
+    '''
+    Read the raw fid for a single experiment folder by memory mapping the fid file, rather
+    than through an intermediate read buffer. Only acqus is parsed for parameters. Returns
+    (None, None) if the experiment can't be read.
+    '''
+    try:
+        logging.debug("Reading %s" % fn)
+        dic = ng.bruker.read_acqus_file(fn)
+        acqus = dic['acqus']
+
+        with open(os.path.join(fn, 'fid'), 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        try:
+            if hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            # This copies out of the mapping so it can be closed
+            data = fid_from_buffer(acqus, mm)
+        finally:
+            mm.close()
+
+    except Exception as e:
+        logging.warning(e)
+        return None, None
+
+    return dic, data
+
+
+def fid_from_buffer(acqus, buf):
+    '''
+    Convert the raw contents of a fid file (any buffer) to complex data, using the data type
+    and byte order given in acqus.
+    '''
+    dtype = np.dtype('f8' if acqus.get('DTYPA') == 2 else 'i4')
+    dtype = dtype.newbyteorder('>' if acqus.get('BYTORDA') == 1 else '<')
+
+    raw = np.frombuffer(buf, dtype=dtype)
+    # Complexify (interleaved real, imag). Files may be padded beyond TD, so trim to it.
+    data = raw[0:acqus['TD']:2] + 1j * raw[1:acqus['TD']:2]
+    del raw
+    return data
+
+
+def read_archive_fids(fids):
+    '''
+    Generator yielding raw (dic, data) reads of experiments stored in archives (paths of the
+    form archive!folder), in order. Each run of experiments from the same archive is
+    streamed from it in one pass. (None, None) for experiments that can't be read.
+    '''
+    for archive, group in itertools.groupby(fids, key=lambda fid: split_archive_path(fid)[0]):
+        folders = [split_archive_path(fid)[1] for fid in group]
+        logging.info("Reading %d experiments from %s" % (len(folders), archive))
+
+        for folder, files in BrukerArchive(archive).read_experiments(folders):
+            if files is None:
+                logging.warning("Could not read %s from %s" % (folder, archive))
+                yield None, None
+                continue
+
+            try:
+                acqus = parse_jcamp(files['acqus'])
+                yield {'acqus': acqus}, fid_from_buffer(acqus, files['fid'])
+            except Exception as e:
+                logging.warning(e)
+                yield None, None
+
+
+def digital_filter_key(dic):
+    '''
+    The acquisition parameters that determine the digital filter correction; FIDs sharing
+    these (and TD) can be corrected together as a single block.
+    '''
+    acqus = dic['acqus']
+    return acqus.get('DECIM'), acqus.get('DSPFVS'), acqus.get('GRPDLY', 0)
+
+
+def transform_block(dic, block, config, workers=-1):
+    '''
+    Apply the import transform (digital filter, zero fill, FFT, reverse) to a 2D block of
+    FIDs that share the same TD and digital filter parameters, taken from dic.
+
+    The block is zero filled into a single preallocated buffer and transformed with one
+    FFT call across all rows (threaded via scipy.fft where available), rather than one
+    small allocation and FFT per spectrum.
+    '''
+    if config.get('remove_digital_filter'):
+        block = ng.bruker.remove_digital_filter(dic, block)
+
+    n, size = block.shape
+    if config.get('zero_fill'):
+        size = max(size, config.get('zero_fill_to'))
+
+    # scipy.fft transforms single precision input without promoting to double
+    buf = np.zeros((n, size), dtype=spectra_dtype(config))
+    buf[:, :block.shape[1]] = block
+    del block
+
+    if fftpack is not None:
+        buf = fftpack.fft(buf, axis=-1, overwrite_x=True, workers=workers)
+    else:
+        buf = np.fft.fft(buf, axis=-1).astype(buf.dtype, copy=False)
+    buf = np.fft.fftshift(buf, axes=-1)
+
+    if config.get('reverse_spectra'):
+        buf = buf[:, ::-1]
+
+    return buf
+
+
+def transform_fids(raw, config, workers=-1):
+    '''
+    Transform a list of raw (dic, data) experiments. If config['batch_transform'] is set FIDs
+    that share TD and digital filter parameters are grouped into blocks and transformed
+    together, otherwise one at a time. Returns a list of (dic, data) in the same order;
+    (None, None) for experiments that could not be read.
+
+    The truncation of each FID (see qc.fid_truncation) is stored in dic['qc'], as it can't
+    be measured once transformed.
+    '''
+    if not config.get('batch_transform'):
+        results = []
+        for dic, data in raw:
+            if data is None:
+                results.append((None, None))
+                continue
+            dic['qc'] = {'truncation': fid_truncation(data[np.newaxis, :])[0]}
+            results.append((dic, transform_fid(dic, data, config)))
+        return results
+
+    groups = {}
+    for n, (dic, data) in enumerate(raw):
+        if data is None:
+            continue
+        try:
+            key = (data.shape, digital_filter_key(dic))
+        except KeyError:
+            logging.warning("Missing acquisition parameters")
+            continue
+        groups.setdefault(key, []).append(n)
+
+    results = [(None, None)] * len(raw)
+    for idx in groups.values():
+        block = np.vstack([raw[n][1] for n in idx])
+        for n, truncation in zip(idx, fid_truncation(block)):
+            raw[n][0]['qc'] = {'truncation': truncation}
+
+        block = transform_block(raw[idx[0]][0], block, config, workers)
+        for n, data in zip(idx, block):
+            results[n] = raw[n][0], data
+
+    return results
+
+
+def load_bruker_chunk(fids, config, workers=-1):
+    '''
+    Read and transform a chunk of experiments (see transform_fids).
+    '''
+    return transform_fids([read_bruker_fid(fn) for fn in fids], config, workers)
+
+
+def read_ahead(fids, threads=4, buffer_size=64):
+    '''
+    Generator yielding (dic, data) raw reads of fids, in order, from a small pool of I/O
+    threads that memory map and read the next experiments while the caller is busy with
+    the current ones. At most buffer_size experiments are read (or being read) beyond those
+    already yielded, however slow any one read is. The readers stop once the generator is
+    closed, including when the caller stops early (e.g. cancelled).
+    '''
+    results = queue.Queue()
+    todo = queue.Queue()
+    for n, fid in enumerate(fids):
+        todo.put((n, fid))
+
+    # A slot is taken for each read and given back as it is yielded
+    slots = threading.Semaphore(max(1, buffer_size))
+    stop = threading.Event()
+
+    def reader():
+        while not stop.is_set():
+            if not slots.acquire(timeout=0.1):
+                continue
+            if stop.is_set():
+                return
+            try:
+                n, fid = todo.get_nowait()
+            except queue.Empty:
+                return
+            results.put((n, read_bruker_fid_mmap(fid)))
+
+    readers = []
+    for _ in range(min(threads, len(fids))):
+        t = threading.Thread(target=reader)
+        t.daemon = True
+        t.start()
+        readers.append(t)
+
+    # Reads are started in order, but finish out of order; hold early arrivals
+    pending = {}
+    try:
+        for n in range(len(fids)):
+            while n not in pending:
+                m, raw = results.get()
+                pending[m] = raw
+            slots.release()
+            yield pending.pop(n)
+
+    finally:
+        stop.set()
+        for t in readers:
+            t.join()
+
+
+def import_processes(config):
+    '''
+    Number of worker processes to use for the import; 0 (or unset) means one per CPU.
+    '''
+    processes = config.get('import_processes', 0)
+    if not processes:
+        processes = multiprocessing.cpu_count()
+    return processes
+
+
+def bounded_imap(pool, fn, iterable, window):
+    '''
+    As pool.imap(fn, iterable), but with at most window items submitted and not yet
+    returned, so iterable (e.g. reads streamed from an archive) is consumed only as fast
+    as the results are. Results come back in order.
+    '''
+    pending = deque()
+    for item in iterable:
+        pending.append(pool.apply_async(fn, (item,)))
+        if len(pending) >= max(1, window):
+            yield pending.popleft().get()
+
+    while pending:
+        yield pending.popleft().get()
+
+
+def _load_bruker_fids(fids, config):
+    '''
+    Generator yielding (fid, dic, data) for each experiment folder in fids, in the
+    same order as given. Experiments are handled in chunks (of config['batch_size'] when
+    batch transforming); if config['parallel_import'] is set the chunks are spread across
+    a process pool, otherwise they run here one after another, with fids prefetched by
+    I/O threads if config['read_ahead'] is set.
+    '''
+    total_fids = len(fids)
+    if total_fids == 0:
+        return
+
+    batch_size = max(1, config.get('batch_size', 128)) if config.get('batch_transform') else 1
+
+    if config.get('parallel_import') and total_fids > 1:
+        processes = min(import_processes(config), total_fids)
+        # Keep chunks small enough to give regular progress, large enough to amortise IPC
+        chunksize = max(1, min(batch_size, total_fids // (processes * 4)))
+        chunks = [fids[i:i + chunksize] for i in range(0, total_fids, chunksize)]
+        # One FFT thread per process; the pool already occupies the cores
+        fn = partial(load_bruker_chunk, config=config, workers=1)
+
+        # Spawn rather than fork; forking a process with live Qt threads can deadlock
+        pool = multiprocessing.get_context('spawn').Pool(processes)
+        try:
+            # imap preserves input ordering, so results come back in scan order
+            results = pool.imap(fn, chunks)
+            for chunk, chunk_results in zip(chunks, results):
+                for fid, (dic, data) in zip(chunk, chunk_results):
+                    yield fid, dic, data
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+    elif config.get('read_ahead'):
+        # Two stage pipeline: I/O threads fetch upcoming fids while this thread transforms
+        reads = read_ahead(fids, config.get('read_ahead_threads', 4), batch_size * 2)
+        for i in range(0, total_fids, batch_size):
+            chunk = fids[i:i + batch_size]
+            raw = [next(reads) for _ in chunk]
+            logging.info("Loading %d-%d/%d" % (i+1, i+len(chunk), total_fids))
+            for fid, (dic, data) in zip(chunk, transform_fids(raw, config)):
+                yield fid, dic, data
+
+    else:
+        for i in range(0, total_fids, batch_size):
+            chunk = fids[i:i + batch_size]
+            logging.info("Loading %d-%d/%d" % (i+1, i+len(chunk), total_fids))
+            for fid, (dic, data) in zip(chunk, load_bruker_chunk(chunk, config)):
+                yield fid, dic, data
+
+
+def load_bruker_archive_fids(fids, config, progress_callback=None):
+    '''
+    Generator yielding (fid, dic, data) for experiments stored in archives, in the same
+    order as given. FIDs are streamed from the archive here and transformed in chunks as
+    for folders: across a process pool if config['parallel_import'] is set, otherwise batched
+    in this process.
+    '''
+    total_fids = len(fids)
+    if total_fids == 0:
+        return
+
+    batch_size = max(1, config.get('batch_size', 128)) if config.get('batch_transform') else 1
+
+    reads = read_archive_fids(fids)
+    chunks = ([next(reads) for _ in range(i, min(i + batch_size, total_fids))] for i in range(0, total_fids, batch_size))
+
+    pool = None
+    if config.get('parallel_import') and total_fids > 1:
+        processes = min(import_processes(config), total_fids)
+        # Spawn rather than fork; forking a process with live Qt threads can deadlock
+        pool = multiprocessing.get_context('spawn').Pool(processes)
+        # Two chunks in flight per process keeps them busy without reading the whole
+        # archive into memory ahead of them
+        results = bounded_imap(pool, partial(transform_fids, config=config, workers=1), chunks, processes * 2)
+    else:
+        results = (transform_fids(raw, config) for raw in chunks)
+
+    try:
+        n = 0
+        for chunk_results in results:
+            for dic, data in chunk_results:
+                yield fids[n], dic, data
+                n += 1
+
+                if progress_callback:
+                    progress_callback(float(n) / total_fids)
+
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+
+def load_bruker_fids(fids, config, progress_callback=None):
+    '''
+    Generator yielding (fid, dic, data) for each experiment folder in fids, in the
+    same order as given. Experiments found in the on-disk cache (if enabled) are
+    returned from there; everything else is read and transformed, then cached.
+    '''
+    total_fids = len(fids)
+
+    cache = FidCache.from_config(config)
+    if cache is not None:
+        keys = [cache.key(fid, config) for fid in fids]
+        hits = [key in cache for key in keys]
+    else:
+        keys = [None] * total_fids
+        hits = [False] * total_fids
+
+    misses = _load_bruker_fids([fid for fid, hit in zip(fids, hits) if not hit], config)
+
+    for n, (fid, key, hit) in enumerate(zip(fids, keys, hits)):
+        cached = cache.get(key) if hit else None
+
+        if cached is not None:
+            dic, data = cached
+
+        elif hit:
+            # Entry vanished (evicted or unreadable) since we checked; load it directly
+            dic, data = load_bruker_chunk([fid], config)[0]
+            cache.put(key, dic, data)
+
+        else:
+            _, dic, data = next(misses)
+            if cache is not None:
+                cache.put(key, dic, data)
+
+        yield fid, dic, data
+
+        if progress_callback:
+            progress_callback(float(n) / total_fids)
+
+    if cache is not None:
+        cache.evict()
+
+
+def read_bruker_pdata(fn, config):
+    '''
+    Read the processed real (and, if config['pdata_imaginary'] is set, imaginary) spectrum
+    of an experiment folder from pdata/<config['pdata_number']>, without applying the
+    NC_proc intensity scaling. Returns (dic, data); data is a list of the raw component
+    arrays, and (None, None) if the experiment has no readable processed data.
+    '''
+    pdata = os.path.join(fn, 'pdata', str(config.get('pdata_number', 1)))
+    try:
+        logging.debug("Reading %s" % pdata)
+        dic = ng.bruker.read_acqus_file(fn)
+        dic['procs'] = ng.bruker.read_jcamp(os.path.join(pdata, 'procs'))
+        procs = dic['procs']
+
+        dtype = np.dtype('f8' if procs.get('DTYPP') == 2 else 'i4')
+        dtype = dtype.newbyteorder('>' if procs.get('BYTORDP') == 1 else '<')
+
+        components = ['1r', '1i'] if config.get('pdata_imaginary') else ['1r']
+        data = [np.fromfile(os.path.join(pdata, c), dtype=dtype) for c in components]
+
+    except Exception as e:
+        logging.warning(e)
+        return None, None
+
+    return dic, data
+
+
+def scale_pdata(raw, config):
+    '''
+    Combine and scale a list of raw (dic, components) pdata reads. Experiments with the same
+    size are stacked and scaled by their 2**NC_proc factors in one vectorized operation, in
+    the import precision.
+    Returns a list of (dic, data) in the same order; (None, None) for unreadable experiments.
+    '''
+    groups = {}
+    for n, (dic, data) in enumerate(raw):
+        if data is not None:
+            groups.setdefault((len(data), data[0].shape), []).append(n)
+
+    dtype = spectra_dtype(config)
+    real_dtype = np.finfo(dtype).dtype
+
+    results = [(None, None)] * len(raw)
+    for idx in groups.values():
+        scale = np.array([2.0 ** float(raw[n][0]['procs'].get('NC_proc', 0)) for n in idx], dtype=real_dtype)[:, np.newaxis]
+
+        if len(raw[idx[0]][1]) > 1:
+            block = np.empty((len(idx), raw[idx[0]][1][0].shape[0]), dtype=dtype)
+            block.real = [raw[n][1][0] for n in idx]
+            block.imag = [raw[n][1][1] for n in idx]
+        else:
+            block = np.array([raw[n][1][0] for n in idx], dtype=real_dtype)
+        block *= scale
+
+        for n, data in zip(idx, block):
+            results[n] = raw[n][0], data
+
+    return results
+
+
+def load_bruker_pdatas(fids, config, progress_callback=None):
+    '''
+    Generator yielding (fid, dic, data) of the already processed (pdata) spectrum for each
+    experiment folder in fids, in the same order as given. No transform is applied.
+    '''
+    total_fids = len(fids)
+    batch_size = max(1, config.get('batch_size', 128))
+
+    for i in range(0, total_fids, batch_size):
+        chunk = fids[i:i + batch_size]
+        raw = [read_bruker_pdata(fn, config) for fn in chunk]
+        for fid, (dic, data) in zip(chunk, scale_pdata(raw, config)):
+            yield fid, dic, data
+
+        if progress_callback:
+            progress_callback(float(i + len(chunk)) / total_fids)
+
+
+def pdata_axis(dic, size):
+    '''
+    Calculate the ppm axis of a processed spectrum from its procs parameters.
+    '''
+    # OFFSET ppm of the first point; SW_p width in Hz; SF spectrometer frequency in MHz
+    procs = dic['procs']
+    step = float(procs['SW_p']) / float(procs['SF']) / size
+    return float(procs['OFFSET']) - step * np.arange(size)
+
+
+def pdata_axis_key(dic, size):
+    procs = dic['procs']
+    return float(procs['OFFSET']), float(procs['SW_p']), float(procs['SF']), size
+
+
+def ppm_axis(dic, size, reverse=True):
+    '''
+    Calculate the ppm axis of a transformed experiment of size points from its acquisition
+    parameters. reverse should match the 'reverse_spectra' import setting.
+    '''
+    # SW total ppm 11.9877
+    # SW_h total Hz 7194.244
+    # TD number of data points 32768
+    # O1 Hz offset (shift) of spectra 2822.5 centre!
+    # BF1 ? 600Mhz
+    # O1/BF1 = centre of the spectra
+    # OFFSET = (SW/2) - (O1/BF1)
+    sw = float(dic['acqus']['SW'])
+    offset = (sw / 2) - (float(dic['acqus']['O1']) / float(dic['acqus']['BF1']))
+    start = sw - offset
+    step = sw / size
+
+    ppm = start - step * np.arange(size)
+    if not reverse:
+        ppm = ppm[::-1]
+
+    return ppm
+
+
+def axis_key(dic, size, reverse=True):
+    '''
+    The parameters that define an experiment's ppm axis; experiments with equal keys share an axis.
+    '''
+    acqus = dic['acqus']
+    return float(acqus['SW']), float(acqus['O1']), float(acqus['BF1']), size, bool(reverse)
+
+
+def resample_block(block, axis, target):
+    '''
+    Linearly interpolate every row of block (sampled on axis) onto the target axis in a
+    single vectorized operation. Points of target outside axis are set to zero.
+    '''
+    if axis[0] > axis[-1]:
+        # searchsorted needs ascending values; NMR axes normally run high to low
+        axis = axis[::-1]
+        block = block[:, ::-1]
+
+    # Interpolation indices and weights are shared by every row in the block
+    idx = np.clip(np.searchsorted(axis, target), 1, len(axis) - 1)
+    x0, x1 = axis[idx - 1], axis[idx]
+    w = ((target - x0) / (x1 - x0)).astype(np.finfo(block.dtype).dtype)  # Keep the block precision
+
+    out = block[:, idx - 1] * (1 - w) + block[:, idx] * w
+    out[:, (target < axis[0]) | (target > axis[-1])] = 0
+    return out
+
+
+def resample_to_axis(data, axes, target):
+    '''
+    Bring a list of spectra, each sampled on the matching entry of axes, onto the common
+    target axis. Spectra are grouped by their (shared) axis array and each group resampled
+    as one 2D block; spectra already on target are returned as-is.
+    '''
+    groups = {}
+    for n, axis in enumerate(axes):
+        if axis is not target:
+            groups.setdefault(id(axis), []).append(n)
+
+    data = list(data)
+    for idx in groups.values():
+        if np.array_equal(axes[idx[0]], target):
+            continue
+        block = resample_block(np.array([data[n] for n in idx]), axes[idx[0]], target)
+        for n, row in zip(idx, block):
+            data[n] = row
+
+    return data
+
+
+def find_bruker_fids(folder, path_filter_regexp=None):
+    '''
+    Walk folder and return the experiment folders (those containing a fid) that match
+    path_filter_regexp, in (sorted) walk order.
+    '''
+    fids = []
+    logging.info("Searching for Bruker files in: %s" % folder)
+    for r, d, files in os.walk(folder):  # filename contains a folder for Bruker data
+        d.sort()  # Walk in a stable order, so spectra keep their positions between imports
+        if 'fid' in files:
+            if 'pdata' in d:
+                d.remove('pdata')  # Processed data never holds further experiments
+
+            scan = os.path.basename(r)
+            logging.debug('Found Bruker: %s %s' % (r, scan))
+            if scan == '99999' or scan == '9999':  # Dummy Bruker thing
+                continue
+
+            if path_filter_regexp:
+                m = path_filter_regexp.search(r)
+                if not m:
+                    continue
+
+            # The following is a hack; need some interface for choosing between processed/raw data
+            # and for various formats of NMR data input- but simple
+            fids.append(r)
+
+    return fids
+
+
+def compile_regexp(regexp):
+    if regexp:
+        return re.compile(regexp)
+    return None
+
+
+def scan_bruker_experiments(folder, config):
+    '''
+    Find the experiments below folder and return their acqus headers (dicts with path, exp,
+    td, sw, o1, bf1 and mtime), filtered by the path and experiment name regexps in config.
+    No fid data is read. With config['use_header_index'] headers come from (and update) the
+    folder's HeaderIndex, so only new or changed acqus files are parsed.
+
+    folder may also be a zip or tar archive of experiments, which is read without extracting.
+    '''
+    headers = None
+    if is_archive(folder):
+        headers = BrukerArchive(folder).headers()
+        fids = []
+    else:
+        fids = find_bruker_fids(folder)
+
+    if headers is None and config.get('use_header_index'):
+        try:
+            index = HeaderIndex(folder)
+            try:
+                headers = index.headers(fids)
+            finally:
+                index.close()
+        except Exception as e:
+            logging.warning("Could not use header index: %s" % e)
+
+    if headers is None:
+        headers = []
+        for fid in fids:
+            try:
+                header = read_acqus_header(fid)
+            except Exception as e:
+                logging.warning(e)
+                header = None
+            else:
+                header['path'] = fid
+            headers.append(header)
+
+    path_filter_regexp = compile_regexp(config.get('path_filter_regexp'))
+    exp_filter_regexp = compile_regexp(config.get('exp_filter_regexp'))
+
+    experiments = []
+    for header in headers:
+        if header is None:
+            continue
+
+        if path_filter_regexp and not path_filter_regexp.search(header['path']):
+            continue
+
+        if exp_filter_regexp and not exp_filter_regexp.search(header['exp']):
+            continue
+
+        experiments.append(header)
+
+    return experiments
+
+
+def sample_label(config, regexp, n, fid, exp):
+    # Generate sample id for this spectra
+    # ['Scan number', 'Experiment name', 'Experiment (regexp)', 'Path (regexp)']
+    if config['sample_id_from'] == 'Scan number':
+        label = os.path.basename(fid)
+
+    elif config['sample_id_from'] == 'Sequential':
+        label = str(n + 1)
+
+    elif config['sample_id_from'] == 'Experiment (regexp)':
+        if regexp is None:
+            label = exp
+
+        else:
+            m = regexp.search(exp)
+            if m:
+                label = m.group(0) if m.lastindex is None else m.group(m.lastindex)
+
+            else:  # Fallback
+                label = exp
+
+    elif config['sample_id_from'] == 'Path (regexp)':
+        if regexp is None:
+            label = os.path.basename(fid)
+
+        else:
+            m = regexp.search(fid)
+            if m:
+                label = m.group(0) if m.lastindex is None else m.group(m.lastindex)
+
+            else:  # Fallback
+                label = fid
+
+    else:
+        label = os.path.basename(fid)
+
+    return label
+
+
+def sample_class(config, regexp, fid, exp):
+    # Generate sample class for this spectra
+    # ['None', 'Experiment (regexp)', 'Path (regexp)']
+    if config['class_from'] == 'None':
+        classn = ''
+
+    elif config['class_from'] == 'Experiment (regexp)':
+        if regexp is None:
+            classn = exp
+
+        else:
+            m = regexp.search(exp)
+            if m:
+                classn = m.group(0) if m.lastindex is None else m.group(m.lastindex)
+
+            else:  # Fallback
+                classn = exp
+
+    elif config['class_from'] == 'Path (regexp)':
+        if regexp is None:
+            classn = os.path.basename(fid)
+
+        else:
+            m = regexp.search(fid)
+            if m:
+                classn = m.group(0) if m.lastindex is None else m.group(m.lastindex)
+
+            else:  # Fallback
+                classn = fid
+
+    else:
+        classn = ''
+
+    return classn
+
+
+def experiment_mtime(header):
+    '''
+    Latest modification time of the experiment described by header: of the archive holding
+    it, or of its acqus and fid files (None if neither exists yet).
+    '''
+    if split_archive_path(header['path'])[0] is not None:
+        return header.get('mtime')
+
+    mtimes = []
+    for f in ('acqus', 'fid'):
+        try:
+            mtimes.append(os.path.getmtime(os.path.join(header['path'], f)))
+        except OSError:
+            pass
+    return max(mtimes) if mtimes else None
+
+
+def new_experiments():
+    return {
+        'data': [],
+        'dic': [],
+        'labels': [],
+        'classes': [],
+        'paths': [],
+        'axes': [],
+    }
+
+
+def iter_bruker_experiments(headers, config, progress_callback=None, offset=0, chunk_size=None, cancel_token=None):
+    '''
+    Generator loading the experiments described by headers (from scan_bruker_experiments)
+    in chunks of chunk_size (default config['batch_size']) experiments. Sample labels and
+    classes are assigned from the headers before any fid is read. Experiments that fail to
+    load are skipped. offset is the number of spectra already loaded, for sequential sample
+    ids when appending.
+
+    Each chunk is a dict of equal-length lists: data, dic, labels, classes, paths and axes
+    (the ppm axis of each experiment, one shared array per distinct set of acquisition
+    parameters across all chunks).
+
+    Stops with Cancelled, between experiments, once cancel_token is cancelled.
+    '''
+    sample_id_regexp = compile_regexp(config['sample_id_regexp'])
+    class_regexp = compile_regexp(config['class_regexp'])
+    chunk_size = max(1, chunk_size or config.get('batch_size', 128))
+
+    fids = [header['path'] for header in headers]
+    labels = [sample_label(config, sample_id_regexp, n + offset, header['path'], header['exp']) for n, header in enumerate(headers)]
+    classes = [sample_class(config, class_regexp, header['path'], header['exp']) for header in headers]
+
+    experiments = new_experiments()
+
+    axes = {}
+    reverse = config.get('reverse_spectra')
+
+    from_archive = bool(fids) and split_archive_path(fids[0])[0] is not None
+
+    if config.get('source') == 'pdata':
+        if from_archive:
+            raise Exception("Processed data can't be imported from archives; import the raw FIDs")
+
+        # Already processed by TopSpin; read the spectra directly, skipping the transform
+        loader = load_bruker_pdatas
+        get_axis_key = lambda dic, size: pdata_axis_key(dic, size)
+        get_axis = lambda dic, size: pdata_axis(dic, size)
+    else:
+        loader = load_bruker_archive_fids if from_archive else load_bruker_fids
+        get_axis_key = lambda dic, size: axis_key(dic, size, reverse)
+        get_axis = lambda dic, size: ppm_axis(dic, size, reverse)
+
+    for n, (fid, dic, data) in enumerate(loader(fids, config, progress_callback)):
+        check_cancelled(cancel_token)
+
+        if data is not None:
+            #if 'AUTOPOS' in dic['acqus']:
+            #    label = label + " %s" % dic['acqus']['AUTOPOS']
+
+            experiments['labels'].append(labels[n])
+            experiments['classes'].append(classes[n])
+
+            experiments['data'].append(data)
+            experiments['dic'].append(dic)
+            experiments['paths'].append(fid)
+
+            key = get_axis_key(dic, data.shape[-1])
+            if key not in axes:
+                axes[key] = get_axis(dic, data.shape[-1])
+            experiments['axes'].append(axes[key])
+
+            if len(experiments['data']) == chunk_size:
+                yield experiments
+                experiments = new_experiments()
+
+    if experiments['data']:
+        yield experiments
+
+
+def load_bruker_experiments(headers, config, progress_callback=None, offset=0):
+    '''
+    Load the experiments described by headers, as for iter_bruker_experiments, returning a
+    single dict of equal-length lists for all of them.
+    '''
+    experiments = new_experiments()
+    for chunk in iter_bruker_experiments(headers, config, progress_callback, offset):
+        for k, v in chunk.items():
+            experiments[k].extend(v)
+
+    return experiments
+
+
+def stream_bruker_spectra(headers, config, progress_callback=None, offset=0, target=None, cancel_token=None):
+    '''
+    Generator yielding (block, target, chunk) for the experiments described by headers: block
+    is a 2D array of the spectra in each chunk from iter_bruker_experiments, all on the target
+    ppm axis (by default the axis of the first experiment loaded). Spectra on other axes are
+    resampled if config['resample_to_common_axis'] is set, otherwise they must match the
+    target size. The data in each chunk is released once stacked into the block.
+
+    If config['qc'] is set the QC measures of each block (see qc.quality_control) are added
+    to the chunk as per-spectrum lists. With config['qc_exclude'] spectra failing the QC
+    thresholds are dropped from the block and chunk, and their paths listed in
+    chunk['rejected'].
+
+    Consumers can process (or store) each block as soon as it is read, rather than waiting
+    for the whole import.
+    '''
+    for chunk in iter_bruker_experiments(headers, config, progress_callback, offset, cancel_token=cancel_token):
+        if target is None:
+            target = chunk['axes'][0]
+
+        data = chunk['data']
+        if any(axis is not target for axis in chunk['axes']):
+            if config.get('resample_to_common_axis'):
+                data = resample_to_axis(data, chunk['axes'], target)
+            elif any(d.shape[-1] != len(target) for d in data):
+                raise Exception("Spectra have differing sizes; enable resampling to a common axis to import them together")
+            elif any(not np.array_equal(axis, target) for axis in chunk['axes']):
+                logging.warning("Spectra have differing acquisition parameters; using the ppm axis of %s" % chunk['paths'][0])
+
+        block = np.array(data, dtype=data[0].dtype)
+        chunk['data'] = None
+        del data
+
+        if config.get('qc'):
+            chunk.update(quality_control(block, target, chunk['dic'], config))
+
+            keep = qc_pass(chunk, config) if config.get('qc_exclude') else None
+            if keep is not None and not keep.all():
+                chunk['rejected'] = [path for path, ok in zip(chunk['paths'], keep) if not ok]
+                logging.info("QC rejected: %s" % ', '.join(chunk['rejected']))
+                for k, v in chunk.items():
+                    if k not in ('data', 'rejected'):
+                        chunk[k] = [x for x, ok in zip(v, keep) if ok]
+                block = block[keep]
+
+        yield block, target, chunk
+
+
+def read_bruker_spectra(headers, config, progress_callback=None, offset=0, target=None, store=None, cancel_token=None):
+    '''
+    Read the experiments described by headers into a single 2D array, filling it chunk by
+    chunk from stream_bruker_spectra. The array is preallocated for every header (and trimmed
+    if some fail to load), or created as an out-of-core .npy memmap at store if given, so the
+    spectra are never held as a list and stacked a second time.
+
+    Returns (data, ppm, experiments) where experiments is as for load_bruker_experiments,
+    without the data but with any QC lists and rejected paths, and experiments['failed'] a
+    dict of the paths of experiments that could not be loaded to their experiment_mtime;
+    (None, None, experiments) if nothing could be loaded.
+    '''
+    experiments = new_experiments()
+    data = None
+    n = 0
+
+    for block, target, chunk in stream_bruker_spectra(headers, config, progress_callback, offset, target, cancel_token):
+        if data is None:
+            shape = (len(headers), block.shape[1])
+            if store:
+                data = np.lib.format.open_memmap(store, mode='w+', dtype=block.dtype, shape=shape)
+            else:
+                data = np.empty(shape, dtype=block.dtype)
+
+        data[n:n + block.shape[0]] = block
+        n += block.shape[0]
+
+        for k, v in chunk.items():
+            if k != 'data':
+                experiments.setdefault(k, []).extend(v)
+
+    done = set(experiments['paths']) | set(experiments.get('rejected', []))
+    experiments['failed'] = dict((header['path'], experiment_mtime(header)) for header in headers if header['path'] not in done)
+    if experiments['failed']:
+        logging.info("Could not load: %s" % ', '.join(experiments['failed']))
+
+    if data is None or n == 0:
+        return None, None, experiments
+
+    return data[:n], target, experiments
@@ -0,0 +1,132 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading cache.py')
+
+import os
+import json
+import hashlib
+import pickle
+import tempfile
+
+from . import utils
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.nmrbrew', 'cache')
+
+# Import settings that change the transformed output; anything else can share a cache entry
+FID_CACHE_CONFIG_KEYS = ['remove_digital_filter', 'zero_fill', 'zero_fill_to', 'reverse_spectra', 'precision']
+
+
+class FidCache(object):
+    '''
+    Persistent on-disk cache of processed experiments, as returned by load_bruker_fid.
+
+    Entries are content addressed by the experiment path, the size/mtime of its fid and
+    acqus files and the import config values that affect the transform. Total size on disk
+    is bounded; when exceeded the least recently used entries are removed.
+
+    :param path: Folder to store cache entries in
+    :param max_size: Maximum total size of the cache, in bytes
+    '''
+
+    suffix = '.fid.pkl'
+
+    def __init__(self, path=None, max_size=2048 * 1024 * 1024):
+        self.path = path or DEFAULT_CACHE_DIR
+        self.max_size = max_size
+        utils.mkdir_p(self.path)
+
+    @classmethod
+    def from_config(cls, config):
+        '''
+        Return a cache built from the import tool config, or None if caching is disabled.
+        '''
+        if not config.get('use_cache'):
+            return None
+
+        try:
+            return cls(config.get('cache_dir'), config.get('cache_size', 2048) * 1024 * 1024)
+        except OSError as e:
+            logging.warning("Could not create FID cache: %s" % e)
+            return None
+
+    def key(self, fn, config):
+        '''
+        Build the cache key for an experiment folder; None if it can't be fingerprinted.
+        '''
+        fingerprint = [os.path.abspath(fn)]
+        for f in ['fid', 'acqus']:
+            try:
+                st = os.stat(os.path.join(fn, f))
+            except OSError:
+                return None
+            fingerprint.extend([st.st_size, st.st_mtime])
+
+        fingerprint.extend([config.get(k) for k in FID_CACHE_CONFIG_KEYS])
+        return hashlib.sha1(json.dumps(fingerprint).encode('utf-8')).hexdigest()
+
+    def filename(self, key):
+        return os.path.join(self.path, key + self.suffix)
+
+    def __contains__(self, key):
+        return key is not None and os.path.exists(self.filename(key))
+
+    def get(self, key):
+        '''
+        Return the cached (dic, data) for key, or None on a miss.
+        '''
+        if key is None:
+            return None
+
+        fn = self.filename(key)
+        try:
+            with open(fn, 'rb') as f:
+                dic, data = pickle.load(f)
+        except Exception:
+            return None
+
+        # Touch the entry so eviction is least-recently-used rather than oldest
+        try:
+            os.utime(fn, None)
+        except OSError:
+            pass
+
+        return dic, data
+
+    def put(self, key, dic, data):
+        if key is None or data is None:
+            return
+
+        # Write to a temporary file and move into place, so concurrent importers never
+        # see a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump((dic, data), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.filename(key))
+        except Exception as e:
+            logging.warning("Could not write FID cache entry: %s" % e)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def evict(self):
+        '''
+        Remove least recently used entries until the cache fits within max_size.
+        '''
+        entries = []
+        for fn in os.listdir(self.path):
+            if fn.endswith(self.suffix):
+                try:
+                    st = os.stat(os.path.join(self.path, fn))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, fn))
+
+        total = sum(e[1] for e in entries)
+        for _, size, fn in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.path, fn))
+            except OSError:
+                continue
+            total -= size
@@ -16,7 +16,8 @@ STATUS_COLORS = {
     'active': 'orange',
     'error': 'red',
     'inactive': 'white',
-    'complete': 'green'
+    'complete': 'green',
+    'stale': 'yellow',
 }
 
 # ReadTheDocs
@@ -31,6 +32,12 @@ if not ON_RTD:
         'core/latest_version': '0.0.1',
         'core/last_time_version_checked': 0,
         'core/offered_registration': False,
+        'memory/budget': 0,  # MB; 0 for unlimited
+        'memory/scratch_dir': '',
+        'memory/result_cache': 512,  # MB; 0 to always recalculate
+        'processing/executor': 'serial',  # serial, thread or process
+        'processing/workers': 0,  # 0 for one per CPU
+        'processing/shared_memory': False,  # Keep tool outputs in shared memory, for process workers
     })
 
     # GLobal processing settings (e.g. peak annotations, class groups, etc.)
@@ -48,6 +55,7 @@ if not ON_RTD:
         'error': QColor(255, 0, 0),
         'inactive': QColor(255, 255, 255),
         'complete': QColor(0, 255, 0),
+        'stale': QColor(255, 255, 0),
     }
 
     def _get_QLineEdit(self):
@@ -0,0 +1,127 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading header_index.py')
+
+import os
+import hashlib
+import sqlite3
+
+import nmrglue as ng
+
+from . import utils
+from .cache import DEFAULT_CACHE_DIR
+
+
+def acqus_header(acqus):
+    '''
+    Extract the acquisition parameters needed for scanning (EXP, TD, SW, O1, BF1) from a
+    parsed acqus dict.
+    '''
+    return {
+        'exp': acqus.get('EXP', ''),
+        'td': acqus.get('TD'),
+        'sw': acqus.get('SW'),
+        'o1': acqus.get('O1'),
+        'bf1': acqus.get('BF1'),
+    }
+
+
+def read_acqus_header(path):
+    '''
+    Read the acquisition parameters needed for scanning from the acqus file of an
+    experiment folder, without touching the fid.
+    '''
+    return acqus_header(ng.bruker.read_jcamp(os.path.join(path, 'acqus')))
+
+
+class HeaderIndex(object):
+    '''
+    Index of the acqus headers of every experiment below a folder, stored in a local SQLite
+    file next to the data (or in the cache folder if the data folder is read only).
+
+    Headers are only re-read from acqus when its mtime or size changes, so rescanning a
+    large, mostly unchanged tree needs a directory walk and a stat per experiment.
+
+    :param folder: Root folder of the Bruker experiments
+    '''
+
+    filename = '.nmrbrew_index.sqlite'
+
+    def __init__(self, folder):
+        self.folder = os.path.abspath(folder)
+
+        if os.access(self.folder, os.W_OK):
+            self.path = os.path.join(self.folder, self.filename)
+        else:
+            utils.mkdir_p(DEFAULT_CACHE_DIR)
+            name = hashlib.sha1(self.folder.encode('utf-8')).hexdigest()
+            self.path = os.path.join(DEFAULT_CACHE_DIR, name + '.index.sqlite')
+
+        self.db = sqlite3.connect(self.path)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS experiments (
+            path TEXT PRIMARY KEY,
+            exp TEXT,
+            td INTEGER,
+            sw REAL,
+            o1 REAL,
+            bf1 REAL,
+            mtime REAL,
+            size INTEGER
+        )''')
+
+    def close(self):
+        self.db.close()
+
+    def headers(self, paths):
+        '''
+        Return the header for each experiment folder in paths (absolute, below the index
+        folder), re-reading acqus only for new or changed experiments. Experiments whose
+        acqus can't be read get None.
+        '''
+        stored = {}
+        for row in self.db.execute('SELECT path, exp, td, sw, o1, bf1, mtime, size FROM experiments'):
+            stored[row[0]] = row
+
+        headers = []
+        updated = []
+        for path in paths:
+            rel = os.path.relpath(path, self.folder)
+            try:
+                st = os.stat(os.path.join(path, 'acqus'))
+            except OSError:
+                headers.append(None)
+                continue
+
+            row = stored.get(rel)
+            if row is None or row[6] != st.st_mtime or row[7] != st.st_size:
+                try:
+                    header = read_acqus_header(path)
+                except Exception as e:
+                    logging.warning("Could not read the header of %s: %s" % (path, e))
+                    headers.append(None)
+                    continue
+
+                row = (rel, header['exp'], header['td'], header['sw'], header['o1'], header['bf1'], st.st_mtime, st.st_size)
+                updated.append(row)
+
+            headers.append({
+                'path': path,
+                'exp': row[1],
+                'td': row[2],
+                'sw': row[3],
+                'o1': row[4],
+                'bf1': row[5],
+                'mtime': row[6],
+            })
+
+        if updated:
+            self.db.executemany('INSERT OR REPLACE INTO experiments VALUES (?, ?, ?, ?, ?, ?, ?, ?)', updated)
+
+        # Forget experiments that have disappeared from the folder
+        seen = set(os.path.relpath(path, self.folder) for path in paths)
+        removed = [(rel,) for rel in stored if rel not in seen]
+        if removed:
+            self.db.executemany('DELETE FROM experiments WHERE path = ?', removed)
+
+        self.db.commit()
+        return headers
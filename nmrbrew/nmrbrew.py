@@ -4,6 +4,7 @@ import os
 import sys
 import logging
 import json
+import multiprocessing
 import datetime as dt
 from copy import deepcopy
 
@@ -40,6 +41,10 @@ from .globals import settings, config
 from . import ui
 from . import utils
 from . import spectra
+from .store import StageStore, ResultCache
+from .threads import Worker
+from .processing.executor import Executor
+from .processing.cancel import Generation
 
 # Translation (@default context)
 from .translate import tr
@@ -51,6 +56,9 @@ import pyqtgraph.exporters
 
 pg.setConfigOption('background', 'w')
 
+# Delay after the last config change before stale tools are re-run (ms)
+AUTO_RUN_DELAY = 500
+
 __version__ = open(os.path.join(utils.basedir, 'VERSION'), 'rU').read()
 
 from . import tools
@@ -177,6 +185,12 @@ class MainWindow(QMainWindow):
 
         self.addToolBar(self.t)
 
+        preferencesAction = QAction(tr('Preferences…'), self)
+        preferencesAction.setStatusTip('Set memory budget and scratch folder')
+        preferencesAction.setMenuRole(QAction.PreferencesRole)
+        preferencesAction.triggered.connect(self.onPreferences)
+        self.menuBars['file'].addAction(preferencesAction)
+
         # INIT PLUGINS AND TOOLS
         # We pass a copy of main window object in to the plugin manager so it can
         # be available for loading
@@ -189,6 +203,27 @@ class MainWindow(QMainWindow):
 
         self.current_tool = None
 
+        # Output of every tool, with unchanged arrays shared between them
+        self.store = StageStore(
+            budget=settings.get('memory/budget') * 1024 * 1024,
+            scratch_dir=settings.get('memory/scratch_dir') or None,
+            shared=settings.get('processing/shared_memory'),
+        )
+
+        # Earlier results of each tool, reused when its input and config are unchanged
+        self.results = ResultCache(max_size=settings.get('memory/result_cache') * 1024 * 1024)
+
+        # Runs per-spectrum tools; its worker pool is kept between runs
+        self.executor = Executor(settings.get('processing/executor'), settings.get('processing/workers'))
+
+        # Config changes make the tool and those after it stale; they are re-run in order
+        # once edits pause. The generation identifies runs started before the latest change.
+        self.generation = Generation()
+        self._auto_run_timer_ = QTimer()
+        self._auto_run_timer_.setSingleShot(True)
+        self._auto_run_timer_.setInterval(AUTO_RUN_DELAY)
+        self._auto_run_timer_.timeout.connect(self.run_stale)
+
         self.tools = [
             tools.import_spectra.ImportSpectra(self),
 
@@ -267,6 +302,10 @@ class MainWindow(QMainWindow):
         self.progressBar.setRange(0, 100)
         self.statusBar().addPermanentWidget(self.progressBar)
 
+        self.memoryLabel = QLabel()
+        self.statusBar().addPermanentWidget(self.memoryLabel)
+        self.update_memory_status()
+
         # We need two viewers; one for the scatter plot (PCA) to avoid weird scaling issues
         # when clicking back to spectra
         self.spectraViewer = spectra.SpectraViewer()
@@ -304,6 +343,70 @@ class MainWindow(QMainWindow):
         # Trigger finalise once we're back to the event loop
         self._init_timer1 = QTimer.singleShot(500, self.post_start_test)
 
+    def invalidate_from(self, tool):
+        '''
+        Mark tool, and every later active tool with a result, as stale and (re)start the
+        countdown to re-running them. Runs already in progress are cancelled.
+        '''
+        self.generation.advance()
+
+        for t in self.tools[self.tools.index(tool):]:
+            if t is tool or (t.is_auto_rerunnable and t.current_status != 'inactive' and t._result_key_ is not None):
+                t.is_stale = True
+                if t._worker_thread_lock_:
+                    t.cancel()  # Its result would be discarded anyway
+                else:
+                    t.status.emit('stale')
+
+        self._auto_run_timer_.start()
+
+    def run_stale(self):
+        '''
+        Run the first stale tool; as each finishes this is called again, until none are left.
+        '''
+        if self._auto_run_timer_.isActive():
+            return  # Still editing
+
+        if any(t._worker_thread_lock_ for t in self.tools):
+            return  # Continued when the running tool finishes
+
+        for t in self.tools:
+            if t.is_stale and t.config.get('is_active'):
+                t.run_manual()
+                return
+
+    def stop_auto_run(self):
+        self._auto_run_timer_.stop()
+        for t in self.tools:
+            t.is_stale = False
+
+    def enforce_budget(self):
+        '''
+        Spill stages over the memory budget to disk, in the background.
+        '''
+        if not self.store.budget:
+            return
+
+        def spill():
+            self.store.enforce_budget()
+            return {}
+
+        worker = Worker(fn=spill)
+        worker.signals.finished.connect(self.update_memory_status)
+        self.threadpool.start(worker)
+
+    def update_memory_status(self):
+        '''
+        Show the resident size of each stage (on the tool tooltips) and the total.
+        '''
+        sizes = self.store.sizes([tool.__class__.__name__ for tool in self.tools])
+        for tool in self.tools:
+            size = sizes[tool.__class__.__name__]
+            spilled = ' (spilled to disk)' if tool.__class__.__name__ in self.store.spilled else ''
+            tool.item.setToolTip('%s\nResident: %.1f MB%s' % (tool.description, size / 1048576., spilled))
+
+        self.memoryLabel.setText('Memory: %.1f MB' % (sum(sizes.values()) / 1048576.))
+
     # FIXME: Fugly wrapper to allow set tool on change
     def update_current_tool_from_item(self, item):
         self.current_tool = item.tool
@@ -431,6 +534,31 @@ class MainWindow(QMainWindow):
         self.onRefreshCurrentToolPlot()
 
 
+    def onPreferences(self):
+        dlg = ui.Preferences(self, config=settings.as_dict())
+        if dlg.exec_():
+            settings.set('memory/budget', dlg.config.get('memory/budget'))
+            settings.set('memory/scratch_dir', dlg.config.get('memory/scratch_dir'))
+            settings.set('memory/result_cache', dlg.config.get('memory/result_cache'))
+            settings.set('processing/executor', dlg.config.get('processing/executor'))
+            settings.set('processing/workers', dlg.config.get('processing/workers'))
+            settings.set('processing/shared_memory', dlg.config.get('processing/shared_memory'))
+
+            # Takes effect for newly spilled outputs; the current scratch folder is kept
+            self.store.budget = settings.get('memory/budget') * 1024 * 1024
+            self.store.scratch_dir = settings.get('memory/scratch_dir') or None
+            self.store.shared = settings.get('processing/shared_memory')  # For newly stored outputs
+            self.enforce_budget()
+            self.results.max_size = settings.get('memory/result_cache') * 1024 * 1024
+            self.results.evict()
+            self.update_memory_status()
+
+            executor = (settings.get('processing/executor'), settings.get('processing/workers'))
+            if executor != (self.executor.backend, self.executor.workers):
+                # Runs in progress finish on the old pool
+                self.executor.close(terminate=False)
+                self.executor = Executor(*executor)
+
     def onRefreshCurrentToolPlot(self, *args, **kwargs):
         self.current_tool.plot()
 
@@ -473,6 +601,11 @@ class MainWindow(QMainWindow):
     def onExit(self):
         self.Close(True)  # Close the frame.
 
+    def closeEvent(self, e):
+        self.store.close()  # Remove spilled outputs
+        self.executor.close()
+        super(MainWindow, self).closeEvent(e)
+
     def setTitle(self, configuration_filename=None, data_filename=None):
         if configuration_filename:
             self.window_title_metadata['configuration_filename'] = configuration_filename
@@ -505,6 +638,8 @@ def setIcons(app, path, filename):
 
 
 def main():
+    # Frozen (e.g. Windows installer) builds must hand spawned worker processes off here
+    multiprocessing.freeze_support()
 
     locale = QLocale.system().name()
 
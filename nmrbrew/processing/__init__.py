@@ -0,0 +1,6 @@
+'''
+Qt-free processing core: the Spectra container and the numerical kernel of each tool, one
+module per stage. Every kernel takes (spc, config, progress_callback) and returns a dict of
+results including 'spc'. The GUI tools wrap these, and they can be used directly from
+scripts, batch jobs and worker processes without importing PyQt.
+'''
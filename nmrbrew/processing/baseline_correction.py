@@ -0,0 +1,125 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/baseline_correction.py')
+
+import numpy as np
+import scipy as sp
+import scipy.interpolate
+import scipy.signal
+import scipy.sparse.linalg
+import nmrglue as ng
+
+from .executor import Executor
+
+
+def baseline_als(y, lam, p, niter=10):
+    L = len(y)
+    D = sp.sparse.csc_matrix(np.diff(np.eye(L), 2))
+    w = np.ones(L)
+
+    for i in range(niter):
+        W = sp.sparse.spdiags(w, 0, L, L)
+        Z = W + lam * D.dot(D.transpose())
+        z = sp.sparse.linalg.spsolve(Z, w * y)
+        w = p * (y > z) + (1 - p) * (y < z)
+
+    return z
+
+
+def baseline_rows(rows, algorithm, ppm, idx, config):
+    '''
+    Baseline correct a block of (real) spectra.
+    '''
+    # Medium algorithm vars
+    med_mw = config.get("med_mw")
+    med_sf = config.get("med_sf")
+    med_sigma = config.get("med_sigma")
+
+    # Cbf pc algorithm vars
+    cbf_last_pc = config.get("cbf_last_pc")
+
+    # Cbf explicit algorithm vars
+    cbf_explicit_start = config.get("cbf_explicit_start")
+    cbf_explicit_end = config.get("cbf_explicit_start")
+
+    out = np.empty_like(rows)
+    for n, di in enumerate(rows):
+        if algorithm == "median":
+            dr = ng.process.proc_bl.med(di, mw=med_mw, sf=med_sf, sigma=med_sigma)
+
+        elif algorithm == "cbf_pc":
+            dr = ng.process.proc_bl.cbf(di, last=cbf_last_pc)
+
+        elif algorithm == "cbf_explicit":
+            dr = ng.process.proc_bl.cbf_explicit(
+                di, calc=slice(cbf_explicit_start, cbf_explicit_end)
+            )
+
+        elif algorithm == "als":
+            # Find n minima in the spectra; using 0.05 threshold + filtering to step size 64
+            bl = baseline_als(di[idx], lam=10**5, p=0.01)
+            # Interpolate the line back to the correct size using spline function
+            tck = sp.interpolate.splrep(ppm[idx][::-1], bl[::-1], s=0)
+            bl = sp.interpolate.splev(ppm, tck, der=0)
+
+            # fn = sp.interpolate.interp1d(ppm[idx], bl, kind='slinear', bounds_error=False)
+            # bl = fn(ppm)
+            dr = di - bl
+
+        out[n, :] = dr
+
+    return out
+
+
+def baseline(spc, config, progress_callback, cancel_token=None, executor=None):
+    executor = executor or Executor()
+
+    algorithm = config.get("algorithm")
+
+    # Remove imaginaries
+    spc.data = np.real(spc.data)
+    idx = None
+
+    # Calculate points for ALS
+    if algorithm == "als":
+        # FIXME: This should be
+        point_step_size = 256
+        # Find the indices of the smallest values in the sum of all spectra
+        idx = np.arange(0, spc.data.shape[1], point_step_size)
+
+        # Skip water region
+        def locate_nearest(array, value):
+            idx = (np.abs(array - value)).argmin()
+            return idx
+
+        start_idx = locate_nearest(spc.ppm, 4.5)
+        end_idx = locate_nearest(spc.ppm, 5)
+
+        if start_idx > end_idx:
+            start_idx, end_idx = end_idx, start_idx
+
+        print(idx, start_idx, end_idx)
+
+        MASK_UP = idx > end_idx
+        MASK_DOWN = idx < start_idx
+        idx = idx[MASK_UP | MASK_DOWN]
+
+        print(idx)
+
+    input_data = spc.data
+    spc.data = executor.map_rows(
+        baseline_rows, input_data, (algorithm, spc.ppm, idx, config), progress_callback, cancel_token
+    )
+
+    result = {"spc": spc}
+    if algorithm == "als":
+        # The fitted baselines, for visualisation
+        bls = input_data - spc.data
+        print(np.mean(bls[:, idx], axis=0))
+        result.update({
+            "baseline": bls,
+            "baseline_point_idx": idx,
+            "baseline_point_y": np.mean(bls[:, idx], axis=0),
+        })
+
+    return result
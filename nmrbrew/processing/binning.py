@@ -0,0 +1,50 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/binning.py')
+
+import numpy as np
+
+from .executor import Executor
+
+
+def bin_rows(rows, scale, bins):
+    '''
+    Sum the points of each row of a block of spectra into bins (edges) on scale.
+    '''
+    out = np.zeros((rows.shape[0], len(bins) - 1), dtype=rows.dtype)
+    for n, d in enumerate(rows):
+        d = np.where(np.isnan(d), 0, d)
+        binned_data = np.histogram(scale, bins=bins, weights=d)
+        out[n, :] = binned_data[0]  # / np.histogram(scale, bins=bins)[0]  # Mean
+
+    return out
+
+
+def binning(spc, config, progress_callback, cancel_token=None, executor=None):
+    executor = executor or Executor()
+
+    # Remove imaginaries
+    spc.data = np.real(spc.data)
+
+    scale = spc.ppm
+
+    bin_size, bin_offset = config.get('bin_size'), config.get('bin_offset')
+
+    r = min(scale), max(scale)
+
+    bins = np.arange(r[0] + bin_offset, r[1] + bin_offset, bin_size)
+    number_of_bins = len(bins) - 1
+
+    # Can't increase the size of data, if bins > current size return the original
+    if number_of_bins >= len(scale):
+        pass
+
+    else:
+        spc.data = executor.map_rows(bin_rows, spc.data, (scale, bins), progress_callback, cancel_token)
+
+        new_scale = [float(x) for x in bins[:-1]]
+
+        spc.ppm = np.array(new_scale)
+
+
+    return {'spc':spc}
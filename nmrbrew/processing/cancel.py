@@ -0,0 +1,57 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/cancel.py')
+
+import threading
+
+
+class Cancelled(Exception):
+    '''
+    Raised inside a tool function when its run has been cancelled.
+    '''
+    pass
+
+
+class CancelToken(object):
+    '''
+    Cooperative cancellation flag shared between the GUI and a running tool function. The
+    function calls check_cancelled between spectra (or chunks) and stops at the next check
+    after cancel() is called.
+    '''
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    def is_cancelled(self):
+        return self._event.is_set()
+
+
+def check_cancelled(cancel_token):
+    '''
+    Raise Cancelled if cancel_token (which may be None) has been cancelled.
+    '''
+    if cancel_token is not None and cancel_token.is_cancelled():
+        raise Cancelled()
+
+
+class Generation(object):
+    '''
+    Counter of pipeline config changes. A run notes the generation it was started in; once
+    the config changes again (advance) the run's result is out of date, and is discarded
+    rather than stored.
+    '''
+
+    def __init__(self):
+        self._value = 0
+
+    def advance(self):
+        self._value += 1
+
+    def current(self):
+        return self._value
+
+    def is_current(self, generation):
+        return generation == self._value
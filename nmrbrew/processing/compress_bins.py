@@ -0,0 +1,52 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/compress_bins.py')
+
+
+def exclude(spc, config, progress_callback, cancel_token=None):
+    import numpy as np
+
+    max_ppm = max(spc.ppm)
+    min_ppm = min(spc.ppm)
+
+    regions = []
+    spc.detach('data', 'ppm')  # Regions are averaged in place
+    index_mask = np.arange(spc.data.shape[1])
+
+    def locate_nearest(array, value):
+        idx = (np.abs(array-value)).argmin()
+        return idx
+
+    for region in config['selected_data_regions']:
+        _, start_ppm, end_ppm = region
+
+        if start_ppm < min_ppm:
+            start_ppm = min_ppm
+
+        if end_ppm > max_ppm:
+            end_ppm = max_ppm
+
+        if start_ppm < end_ppm:
+            start_ppm, end_ppm = end_ppm, start_ppm
+
+        # Convert ppm to nearest index
+        start_idx = locate_nearest(spc.ppm, start_ppm)
+        end_idx = locate_nearest(spc.ppm, end_ppm)
+
+        if start_idx > end_idx:
+            start_idx, end_idx = end_idx, start_idx
+
+        # Calculate the sum of the region; apply it to the start_idx position
+        current_mask = np.logical_and(index_mask >= start_idx, index_mask <= end_idx)
+        spc.data[:, start_idx] = np.mean(spc.data[:, current_mask], axis=1)
+
+        # set the ppm to the average
+        spc.ppm[start_idx] = np.mean(spc.ppm[current_mask])
+
+        # filter the remainder out (add to the mask)
+        index_mask = index_mask[~np.logical_and(index_mask > start_idx, index_mask <= end_idx)]
+
+    spc.ppm = spc.ppm[index_mask]
+    spc.data = spc.data[:, index_mask]
+
+    return {'spc': spc }
@@ -0,0 +1,46 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/exclude_regions.py')
+
+
+def exclude(spc, config, progress_callback, cancel_token=None):
+    import numpy as np
+
+    max_ppm = max(spc.ppm)
+    min_ppm = min(spc.ppm)
+
+    regions = []
+    index_mask = np.arange(spc.data.shape[1])
+
+    def locate_nearest(array, value):
+        idx = (np.abs(array - value)).argmin()
+        return idx
+
+    for region in config["selected_data_regions"]:
+        _, start_ppm, end_ppm = region
+
+        if start_ppm < min_ppm:
+            start_ppm = min_ppm
+
+        if end_ppm > max_ppm:
+            end_ppm = max_ppm
+
+        if start_ppm < end_ppm:
+            start_ppm, end_ppm = end_ppm, start_ppm
+
+        # Convert ppm to nearest index
+        start_idx = locate_nearest(spc.ppm, start_ppm)
+        end_idx = locate_nearest(spc.ppm, end_ppm)
+
+        if start_idx > end_idx:
+            start_idx, end_idx = end_idx, start_idx
+
+        index_mask = index_mask[
+            ~np.logical_and(index_mask > start_idx, index_mask < end_idx)
+        ]
+        regions.append((start_ppm, end_ppm))
+
+    spc.ppm = spc.ppm[index_mask]
+    spc.data = spc.data[:, index_mask]
+
+    return {"spc": spc, "regions": regions}
@@ -0,0 +1,183 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/executor.py')
+
+import os
+import threading
+import multiprocessing
+import multiprocessing.pool
+from functools import partial
+
+import numpy as np
+
+from .cancel import check_cancelled
+from . import shared
+
+BACKENDS = ['serial', 'thread', 'process']
+
+# Rows are always split into (up to) this many chunks, whatever the backend, so results
+# that depend on the order rows are processed in (e.g. warm-started fits) are the same
+# however they are run
+DEFAULT_CHUNKS = 64
+
+
+def row_chunks(n, chunk_size=None):
+    chunk_size = chunk_size or max(1, -(-n // DEFAULT_CHUNKS))
+    return [(i, min(i + chunk_size, n)) for i in range(0, n, chunk_size)]
+
+
+def chunk_args(args, row_args, start, stop):
+    return tuple(args) + tuple(a[start:stop] for a in row_args)
+
+
+def _map_shared_chunk(bounds, fn, src, dst, args, row_args=()):
+    # Runs in a worker process: read rows from, and write results to, shared memory
+    start, stop = bounds
+    shm_src, data = shared.attach(src)
+    shm_dst, out = shared.attach(dst)
+    try:
+        out[start:stop] = fn(data[start:stop], *chunk_args(args, row_args, start, stop))
+    finally:
+        del data, out
+        shm_src.close()
+        shm_dst.close()
+
+
+def make_pool(backend, workers=0):
+    '''
+    Return a new pool for backend ('thread' or 'process') of workers, 0 for one per CPU.
+    '''
+    workers = workers or os.cpu_count() or 1
+    if backend == 'process':
+        # Spawn rather than fork; forking a process with live Qt threads can deadlock
+        return multiprocessing.get_context('spawn').Pool(workers)
+    return multiprocessing.pool.ThreadPool(workers)
+
+
+def map_rows(fn, data, args=(), backend='serial', workers=0, chunk_size=None, progress_callback=None, cancel_token=None, pool=None, row_args=()):
+    '''
+    Apply a per-row kernel to the rows of a 2D array, chunk by chunk, and return the results
+    as a new 2D array. fn(rows, *args) takes a 2D block of rows and returns an array with a
+    row for each of them; the number of columns and dtype of the output are set by the
+    first chunk. row_args are (small) arrays with a row for each row of data, passed to fn
+    after args sliced to the rows of the chunk, e.g. a starting point for each chunk.
+
+    backend is 'serial', 'thread' (a thread pool sharing the arrays) or 'process' (a spawned
+    process pool; data and results are passed through shared memory, so only the chunk
+    bounds and args are pickled, and fn must be importable: a module level function). For
+    the process backend data is only copied if not already in shared memory, and the result
+    is returned in shared memory, ready for the next stage.
+    workers is the pool size, 0 for one per CPU. pool is an existing pool of the backend
+    (see make_pool) to use; otherwise one is started and stopped for this call. Stops with
+    Cancelled, between chunks, once cancel_token is cancelled.
+    '''
+    n = data.shape[0]
+    chunks = row_chunks(n, chunk_size)
+    if not chunks:
+        return np.empty((0,) + data.shape[1:], dtype=data.dtype)
+
+    workers = min(workers or os.cpu_count() or 1, len(chunks) - 1)
+    if backend == 'process' and not shared.is_available():
+        logging.warning("Shared memory is not available; running in threads")
+        backend = 'thread'
+    if workers < 1:
+        backend = 'serial'
+
+    # The first chunk is run here, to size the output
+    start, stop = chunks[0]
+    first = np.asarray(fn(data[start:stop], *chunk_args(args, row_args, start, stop)))
+
+    if backend == 'process':
+        data = shared.share(data)
+        out = shared.empty((n,) + first.shape[1:], first.dtype)
+    else:
+        out = np.empty((n,) + first.shape[1:], dtype=first.dtype)
+    out[start:stop] = first
+
+    def report(bounds):
+        check_cancelled(cancel_token)
+        if progress_callback:
+            progress_callback(float(bounds[1]) / n)
+
+    report(chunks[0])
+
+    own_pool = pool is None and backend != 'serial'
+    if own_pool:
+        pool = make_pool(backend, workers)
+
+    try:
+        if backend == 'serial':
+            for start, stop in chunks[1:]:
+                out[start:stop] = fn(data[start:stop], *chunk_args(args, row_args, start, stop))
+                report((start, stop))
+
+        else:
+            if backend == 'process':
+                chunk_fn = partial(_map_shared_chunk, fn=fn, src=shared.spec(data), dst=shared.spec(out), args=args, row_args=row_args)
+            else:
+                def chunk_fn(bounds):
+                    out[bounds[0]:bounds[1]] = fn(data[bounds[0]:bounds[1]], *chunk_args(args, row_args, *bounds))
+
+            # imap preserves ordering, so progress follows the rows
+            for bounds, _ in zip(chunks[1:], pool.imap(chunk_fn, chunks[1:])):
+                report(bounds)
+
+    finally:
+        if own_pool:
+            pool.terminate()
+            pool.join()
+
+    return out
+
+
+class Executor(object):
+    '''
+    How per-row kernels are run; passed to tool functions that declare them (see
+    ToolBase.is_row_parallel). Without one they run serially.
+
+    The pool is started on first use and kept for later runs, so worker processes are only
+    spawned (and import the kernels) once. If a run fails or is cancelled the pool is
+    stopped, abandoning its queued chunks, and a new one started next time. Call close
+    once finished with the executor.
+
+    :param backend: 'serial', 'thread' or 'process'
+    :param workers: Pool size; 0 for one per CPU
+    '''
+
+    def __init__(self, backend='serial', workers=0):
+        self.backend = backend if backend in BACKENDS else 'serial'
+        if self.backend == 'process' and not shared.is_available():
+            logging.warning("Shared memory is not available; running in threads")
+            self.backend = 'thread'
+        self.workers = workers
+
+        self._pool_ = None
+        self._lock_ = threading.Lock()
+
+    def pool(self):
+        with self._lock_:
+            if self._pool_ is None and self.backend != 'serial':
+                self._pool_ = make_pool(self.backend, self.workers)
+            return self._pool_
+
+    def map_rows(self, fn, data, args=(), progress_callback=None, cancel_token=None, row_args=()):
+        try:
+            return map_rows(fn, data, args, self.backend, self.workers, progress_callback=progress_callback, cancel_token=cancel_token, pool=self.pool(), row_args=row_args)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self, terminate=True):
+        '''
+        Stop the pool. Unless terminate, chunks already queued (e.g. for a run still in
+        progress) are finished first, in the background.
+        '''
+        with self._lock_:
+            pool, self._pool_ = self._pool_, None
+
+        if pool is not None:
+            if terminate:
+                pool.terminate()
+                pool.join()
+            else:
+                pool.close()
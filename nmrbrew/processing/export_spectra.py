@@ -0,0 +1,18 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/export_spectra.py')
+
+
+def export(spc, config, progress_callback, cancel_token=None):
+    import numpy as np
+
+    if config['format'] in ['.tsv', '.txt']:
+        delimiter = '\t'
+    else:
+        delimiter = ','
+
+    out = np.vstack([spc.ppm, spc.data])
+
+    np.savetxt(config.get('filename'), out, delimiter=delimiter)
+
+    return {'spc': spc}
@@ -0,0 +1,32 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/filter_noise.py')
+
+
+def noise(spc, config, progress_callback, cancel_token=None):
+    import numpy as np
+    import scipy as sp
+    import scipy.signal
+    import math
+
+    def estimate_noise(s):
+
+        h, w = s.shape
+
+        m = [[1, -2, 1],
+           [-2, 4, -2],
+           [1, -2, 1]]
+
+        sigma = np.sum(np.sum(np.absolute(sp.signal.convolve2d(s, m))))
+        sigma = sigma * math.sqrt(0.5 * math.pi) / (6 * (w-2) * (h-2))
+
+        return sigma
+
+    noise = estimate_noise(spc.data)
+
+    spc.detach('data')
+    spc.data[ spc.data < noise ] = 0
+
+
+
+    return {'spc':spc}
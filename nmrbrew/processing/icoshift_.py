@@ -0,0 +1,64 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/icoshift_.py')
+
+
+def shift(spc, config, progress_callback, cancel_token=None):
+    from icoshift import icoshift
+    import pandas as pd
+    import numpy as np
+
+    # Remove imaginaries
+    spc.data = np.real(spc.data)
+
+    if config['intervals'] == 'whole':
+        intervals = 'whole'
+
+    elif config['intervals'] == 'number_of_intervals':
+        intervals = config['number_of_intervals']
+
+    elif config['intervals'] == 'length_of_intervals':
+        intervals = config['length_of_intervals']
+
+    elif config['intervals'] == 'selected_intervals':
+        regions = config['selected_data_regions']
+        if regions is None or regions == []:
+            intervals = 'whole'
+        else:
+            intervals = []
+
+            def find_index_of_nearest(l, v):
+                return min(range(len(l)), key=lambda i: abs(l[i] - v))
+
+            scal
+
+            for r in regions:
+                if r[0] == 'View':
+                    x0, y0, x1, y1 = r[1:]
+                    # Convert from data points to indexes
+                    intervals.append((find_index_of_nearest(spc.ppm, x0), find_index_of_nearest(spc.ppm, x1)))
+
+    if config['maximum_shift'] == 'n':
+        maximum_shift = config['maximum_shift_n']
+    else:
+        maximum_shift = config['maximum_shift']
+
+
+    if config['target'] == 'spectra_number':
+        target = spc[config['spectra_number'], :].reshape(1, -1)
+
+    else:
+        target = config['target']
+
+    xCS, ints, ind, target = icoshift(target, spc.data,
+                                      inter=intervals,
+                                      n=maximum_shift,
+                                      coshift_preprocessing=config['coshift_preprocessing'],
+                                      coshift_preprocessing_max_shift=config['coshift_preprocessing_max_shift'],
+                                      average2_multiplier=config['average2_multiplier'],
+                                      fill_with_previous=config['fill_with_previous'],
+                                                                   )
+
+    spc.data = xCS.astype(spc.data.dtype, copy=False)
+
+    return {'spc': spc}
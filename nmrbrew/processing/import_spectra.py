@@ -0,0 +1,192 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/import_spectra.py')
+
+import os
+import atexit
+import weakref
+
+from .. import utils
+
+# Out-of-core store files that could not be removed yet (e.g. on Windows, while still
+# mapped); retried on the next import and at exit
+_unremoved = set()
+
+
+def row_metadata(experiments, config):
+    '''
+    Collect the per-spectrum fields of an import (path, ppm axis and any QC measures) as
+    columns for Spectra.row_metadata.
+    '''
+    import numpy as np
+
+    columns = {
+        'path': experiments['paths'],
+        'axis': experiments['axes'],
+    }
+    if config.get('qc'):
+        for k in ['snr', 'linewidth', 'truncation']:
+            columns[k] = np.array(experiments[k], dtype=float)
+
+    return columns
+
+
+def spectra_store(config):
+    '''
+    Return the path of a new out-of-core store for imported spectra, or None to hold
+    them in memory.
+    '''
+    import tempfile
+    from ..cache import DEFAULT_CACHE_DIR
+
+    if not config.get('out_of_core'):
+        return None
+
+    folder = os.path.join(config.get('cache_dir') or DEFAULT_CACHE_DIR, 'spectra')
+    utils.mkdir_p(folder)
+    fd, path = tempfile.mkstemp(dir=folder, suffix='.npy')
+    os.close(fd)
+    return path
+
+
+def remove_stores(*paths):
+    '''
+    Remove out-of-core store files (see spectra_store), and any left from before.
+    '''
+    _unremoved.update(paths)
+    for path in list(_unremoved):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError:
+            continue
+        _unremoved.discard(path)
+
+
+atexit.register(remove_stores)
+
+
+def load_bruker(spc, config, progress_callback, cancel_token=None):
+    from .spectra import Spectra
+    from ..bruker import scan_bruker_experiments, read_bruker_spectra
+    from ..store import array_root
+
+    # We should have a folder name; so find all files named fid underneath it (together with path)
+    # Filtering, sample ids and classes all use the acqus headers, before any fid is read
+    headers = scan_bruker_experiments(config['filename'], config)
+
+    # Spectra are streamed in chunks into a preallocated array (or on-disk store), using
+    # the axis of the first experiment as the common axis for all spectra
+    store = spectra_store(config)
+    try:
+        nmr_data, nmr_ppms, experiments = read_bruker_spectra(headers, config, progress_callback, store=store, cancel_token=cancel_token)
+    except BaseException:
+        if store:
+            remove_stores(store)
+        raise
+
+    if store:
+        if nmr_data is None:
+            remove_stores(store)
+        else:
+            # Kept for as long as the spectra are; removed once the mapping is released
+            weakref.finalize(array_root(nmr_data), remove_stores, store)
+
+    if nmr_data is not None:
+        spectra = Spectra(
+            data=nmr_data,
+            ppm=nmr_ppms,
+            labels=experiments['labels'],
+            classes=experiments['classes'],
+            row_metadata=row_metadata(experiments, config),
+        )
+
+        dic = experiments['dic'][-1]
+        spectra.metadata = {
+            'experiment_name': '%s (%s)' % (dic['acqus']['EXP'], config['filename']),
+            'qc_rejected': experiments.get('rejected', []),
+            'load_failed': experiments['failed'],
+        }
+
+        return {'spc': spectra }
+
+
+    else:
+        raise Exception("No valid data found")
+
+
+def load_bruker_new(spc, config, progress_callback, cancel_token=None):
+    '''
+    Incremental import: load only experiments under the import folder that are not
+    already in spc, and append them to it.
+
+    If nothing new is loaded the result has no spectra, only new (0) and, if any experiments
+    failed to load or were rejected, the updated spc metadata; so an idle poll of a watched
+    folder does no work over the spectra already loaded.
+    '''
+    import numpy as np
+    from .spectra import Spectra
+    from ..bruker import scan_bruker_experiments, read_bruker_spectra, experiment_mtime
+    from ..store import append_rows
+
+    if spc is None or 'path' not in (spc.row_metadata.dtype.names or ()):
+        # Nothing loaded yet (or loaded without path tracking); do a full import
+        return load_bruker(spc, config, progress_callback, cancel_token)
+
+    # Experiments rejected by QC earlier are not retried, nor are those that failed to load
+    # unless they have changed since (e.g. were still being acquired)
+    metadata = spc.metadata or {}
+    loaded = set(spc.row_metadata['path']) | set(metadata.get('qc_rejected', []))
+    failed = metadata.get('load_failed', {})
+    headers = scan_bruker_experiments(config['filename'], config)
+    headers = [
+        header for header in headers
+        if header['path'] not in loaded and (header['path'] not in failed or failed[header['path']] != experiment_mtime(header))
+    ]
+
+    if not headers:
+        return {'new': 0}
+
+    new_data, _, experiments = read_bruker_spectra(headers, config, progress_callback, offset=len(spc), target=spc.ppm, cancel_token=cancel_token)
+
+    failed = dict(failed)
+    for header in headers:
+        failed.pop(header['path'], None)
+    failed.update(experiments['failed'])
+
+    if new_data is None:
+        # Nothing to append, but record what failed (or was rejected) so it isn't retried
+        metadata = dict(metadata)
+        metadata['qc_rejected'] = metadata.get('qc_rejected', []) + experiments.get('rejected', [])
+        metadata['load_failed'] = failed
+        return {'new': 0, 'metadata': metadata}
+
+    if new_data.shape[1:] != spc.data.shape[1:]:
+        raise Exception("New spectra do not match the size of the loaded spectra")
+
+    # Fields missing from the spectra already loaded (e.g. QC turned on since) are NaN
+    columns = row_metadata(experiments, config)
+    for k, v in columns.items():
+        if k in spc.row_metadata.dtype.names:
+            previous = spc.row_metadata[k]
+        else:
+            previous = np.full(len(spc), np.nan)
+        columns[k] = list(previous) + list(v)
+
+    spectra = Spectra(
+        # Match the precision of the loaded spectra; grown in place where possible, so
+        # regular appends don't copy every spectrum loaded each time
+        data=append_rows(spc.data, new_data.astype(spc.data.dtype, copy=False)),
+        ppm=spc.ppm,
+        labels=list(spc.labels) + experiments['labels'],
+        classes=list(spc.classes) + experiments['classes'],
+        outliers=list(spc.outliers) + [0] * new_data.shape[0],
+        row_metadata=columns,
+    )
+
+    spectra.metadata = dict(metadata)
+    spectra.metadata['qc_rejected'] = metadata.get('qc_rejected', []) + experiments.get('rejected', [])
+    spectra.metadata['load_failed'] = failed
+
+    return {'spc': spectra, 'new': new_data.shape[0]}
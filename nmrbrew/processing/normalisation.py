@@ -0,0 +1,47 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/normalisation.py')
+
+
+def normalise(spc, config, progress_callback, cancel_token=None):
+
+    import numpy as np
+    import pandas as pd
+
+    # Remove imaginaries
+    spc.data = np.real(spc.data)
+
+    # Abs the data (so account for negative peaks also)
+    data_a = np.abs(spc.data)
+    # Sum each spectra (TSA)
+    data_as = np.sum(data_a, axis=1)
+    # Identify median
+    median_s = np.median(data_as)
+    # Scale others to match (*(median/row))
+    scaling = median_s / data_as
+    # Scale the spectra
+    tsa_data = spc.data.T * scaling
+    tsa_data = tsa_data.T
+
+    if config['algorithm'] == 'TSA':
+        output_data = tsa_data
+
+    elif config['algorithm'] == 'PQN':
+        # Take result of TSA normalization
+        # Calculate median spectrum (median of each variable)
+        median_s = np.median(tsa_data, axis=0)
+        # For each variable of each spectrum, calculate ratio between median spectrum variable and that of the considered spectrum
+        spectra_r = median_s / np.abs(spc.data)
+        # Take the median of these scaling factors
+        scaling = np.median(spectra_r, axis=1)
+        #Apply to the entire considered spectrum
+        output_data = spc.data.T * scaling
+        spc.data = output_data.T
+
+    # Clean up numeric extremities in data
+    spc.detach('data')
+    spc.data[np.isnan(spc.data)] = 0
+    spc.data[np.isinf(spc.data)] = 0
+    spc.data[np.isneginf(spc.data)] = 0
+
+    return {'spc':spc}
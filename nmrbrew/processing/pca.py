@@ -0,0 +1,19 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/pca.py')
+
+
+def pca(spc, config, progress_callback, cancel_token=None):
+    from sklearn.decomposition import PCA
+
+    number_of_components = 2 # No way to view > 2
+
+    pca = PCA(n_components=number_of_components)
+    pca.fit(spc.data)
+
+    pca = {
+        'scores': pca.transform(spc.data),
+        'weights': pca.components_
+    }
+
+    return {'spc': spc, 'pca': pca}
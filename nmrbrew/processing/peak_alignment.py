@@ -0,0 +1,79 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/peak_alignment.py')
+
+import numpy as np
+import nmrglue as ng
+
+from .executor import Executor
+
+
+def target_region(scale, config):
+    '''
+    Return (start, end, d, pcentre) for the target peak region of config on scale: the
+    region is data[:, start:end:d], pcentre the index of the target within it.
+    '''
+    target_ppm = config.get('peak_target_ppm')
+    tolerance_ppm = config.get('peak_target_ppm_tolerance')
+    start_ppm = target_ppm - tolerance_ppm
+    end_ppm = target_ppm + tolerance_ppm
+
+    start = min(list(range(len(scale))), key=lambda i: abs(scale[i]-start_ppm))
+    end = min(list(range(len(scale))), key=lambda i: abs(scale[i]-end_ppm))
+
+    d = 1 if end>start else -1
+    region_scales = scale[start:end:d]
+
+    pcentre = min(list(range(len(region_scales))), key=lambda i: abs(region_scales[i]-target_ppm))  # Base centre point to shift all spectra to
+
+    return start, end, d, pcentre
+
+
+def reference_peak_rows(rows):
+    '''
+    Pick the reference peak in each row of a block of target regions. Returns an array with
+    a row of (location, scale, amplitude) for each, NaN where no peak was found.
+    '''
+    out = np.full((rows.shape[0], 3), np.nan)
+    for n, sdata in enumerate(rows):
+        baseline = sdata.max() * .9 # 90% baseline of maximum peak within target region
+        locations, scales, amps = ng.analysis.peakpick.pick(sdata, pthres=baseline, algorithm='connected', est_params = True, cluster=False, table=False)
+        if len(locations) > 0:
+            out[n] = locations[0][0], scales[0][0], amps[0] #FIXME: better behaviour when >1 peak
+
+    return out
+
+
+def shift(spc, config, progress_callback, cancel_token=None, executor=None):
+    executor = executor or Executor()
+
+    # Get the target region from the spectra (will be using this for all calculations;
+    # then applying the result to the original data)
+
+    # Remove imaginaries
+    spc.data = np.real(spc.data)
+    spc.detach('data')  # Modified in place below
+
+    start, end, d, pcentre = target_region(spc.ppm, config)
+
+    # Shift first; then scale
+    data = spc.data[:,start:end:d]
+    reference_peaks = executor.map_rows(reference_peak_rows, data, (), progress_callback, cancel_token)
+
+    # Take a np array for speed on shifting
+    shift_array = spc.data
+    # Now shift the original spectra to fi
+    for n,location in enumerate(reference_peaks[:, 0]):
+        if not np.isnan(location):
+            # Shift the spectra
+            shift = (pcentre-int(location)) * d
+            # FIXME: This is painfully slow
+            if shift > 0:
+                shift_array[n, shift:-1] = shift_array[n, 0:-(shift+1)]
+            elif shift < 0:
+                shift_array[n, 0:shift-1] = shift_array[n, abs(shift):-1]
+
+    spc.data = shift_array
+
+
+    return {'spc': spc}
@@ -0,0 +1,35 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/peak_scaling.py')
+
+import numpy as np
+
+from .executor import Executor
+from .peak_alignment import target_region, reference_peak_rows
+
+
+def scale(spc, config, progress_callback, cancel_token=None, executor=None):
+    executor = executor or Executor()
+
+    # Get the target region from the spectra (will be using this for all calculations;
+    # then applying the result to the original data)
+
+    # Remove imaginaries
+    spc.data = np.real(spc.data)
+    spc.detach('data')  # Modified in place below
+
+    start, end, d, pcentre = target_region(spc.ppm, config)
+
+    data = spc.data[:, start:end:d]
+    reference_peaks = executor.map_rows(reference_peak_rows, data, (), progress_callback, cancel_token)
+    found = ~np.isnan(reference_peaks[:, 0])
+
+    # Get mean reference peak size
+    reference_peak_mean = np.mean(reference_peaks[found, 1])
+    print("Reference peak mean %s" % reference_peak_mean)
+
+    # Now scale; using the same peak regions & information (so we don't have to worry about something
+    # being shifted out of the target region in the first step)
+    spc.data[found] *= (reference_peak_mean / reference_peaks[found, 2])[:, np.newaxis]
+
+    return {"spc": spc}
@@ -0,0 +1,118 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/phase_correct.py')
+
+import numpy as np
+import scipy.optimize
+import nmrglue as ng
+
+from .executor import Executor, row_chunks
+from .cancel import check_cancelled
+
+
+def autophase_ACME(x, s):
+    # Based on the ACME algorithm by Chen Li et al. Journal of Magnetic Resonance 158 (2002) 164-168
+
+    stepsize = 1
+
+    n, l = s.shape
+    phc0, phc1 = x
+
+    s0 = ng.process.proc_base.ps(s, p0=phc0, p1=phc1)
+    s = np.real(s0)
+    maxs = np.max(s)
+
+    # Calculation of first derivatives
+    ds1 = np.abs((s[2:l] - s[0:l - 1]) / (stepsize * 2))
+    p1 = ds1 / np.sum(ds1)
+
+    # Calculation of entropy
+    m, k = p1.shape
+
+    for i in range(0, m):
+        for j in range(0, k):
+            if (p1[i, j] == 0):  # %in case of ln(0)
+                p1[i, j] = 1
+
+    h1 = -p1 * np.log(p1)
+    h1s = np.sum(h1)
+
+    # Calculation of penalty
+    pfun = 0.0
+    as_ = s - np.abs(s)
+    sumas = np.sum(as_)
+
+    if (sumas < 0):
+        pfun = pfun + np.sum((as_ / 2) ** 2)
+
+    p = 1000 * pfun
+
+    # The value of objective function
+    return h1s + p
+
+
+def autophase_PeakMinima(x, s):
+
+    stepsize = 1
+
+    phc0, phc1 = x
+
+    s0 = ng.process.proc_base.ps(s, p0=phc0, p1=phc1)
+    s = np.real(s0).flatten()
+
+    i = np.argmax(s)
+    peak = s[i]
+    mina = np.min(s[i - 100:i])
+    minb = np.min(s[i:i + 100])
+
+    return np.abs(mina - minb)
+
+
+AUTOPHASE_ALGORITHMS = {
+    'acme': autophase_ACME,
+    'peak_minima': autophase_PeakMinima,
+}
+
+
+def autophase_fit(s, algorithm, x0=(0, 0)):
+    return scipy.optimize.fmin(AUTOPHASE_ALGORITHMS[algorithm], x0=x0, args=(s.reshape(1, -1)[:500], ), disp=False)
+
+
+def autophase_rows(rows, algorithm, x0=None):
+    '''
+    Phase correct a block of spectra, each fit starting from the result for the one before;
+    the first from x0[0] (the starting point for the block), or zero.
+    '''
+    out = np.empty_like(rows)
+    opt = x0[0] if x0 is not None else [0, 0]
+    for n, s in enumerate(rows):
+        opt = autophase_fit(s, algorithm, opt)
+        logging.debug("Phase correction optimised to: %s" % opt)
+
+        out[n] = ng.process.proc_base.ps(s, p0=opt[0], p1=opt[1])
+
+    return out
+
+
+def autophase_seeds(data, algorithm, cancel_token=None):
+    '''
+    Starting points for phasing data chunk by chunk (as map_rows splits it): the fit of the
+    first spectrum of each chunk, each starting from the fit for the chunk before. So every
+    chunk starts warm, near where fitting all the spectra in one run would have got to,
+    rather than from zero. Returns an array with the starting point of each row's chunk.
+    '''
+    x0 = np.zeros((data.shape[0], 2))
+    opt = [0, 0]
+    for start, stop in row_chunks(data.shape[0]):
+        check_cancelled(cancel_token)
+        opt = autophase_fit(data[start], algorithm, opt)
+        x0[start:stop] = opt
+    return x0
+
+
+def autophase(spc, config, progress_callback, cancel_token=None, executor=None):
+    executor = executor or Executor()
+    x0 = autophase_seeds(spc.data, config['algorithm'], cancel_token)
+    spc.data = executor.map_rows(autophase_rows, spc.data, (config['algorithm'], ), progress_callback, cancel_token, row_args=(x0, ))
+
+    return {'spc': spc}
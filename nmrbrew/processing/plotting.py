@@ -0,0 +1,82 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/plotting.py')
+
+import numpy as np
+
+# Points per plotted spectrum; more than a screen can show, as (min, max) pairs per bucket
+MAX_PLOT_POINTS = 2048
+
+# Rows downsampled at a time, to bound the temporary copies of large matrices
+ROW_BLOCK = 256
+
+
+def downsample_rows(x, data, max_points=MAX_PLOT_POINTS):
+    '''
+    Downsample the (real part of the) rows of data on axis x for plotting, keeping the
+    minimum and maximum of each bucket of points so peaks survive. Returns (x, y), with y a
+    float32 array of a row for each row of data; unchanged (but real) if no more than
+    max_points long.
+    '''
+    data = np.atleast_2d(data)
+    n, m = data.shape
+    if m <= max_points:
+        return np.asarray(x, dtype=float), np.real(data).astype(np.float32)
+
+    k = -(-m // max(1, max_points // 2))  # Points per bucket
+
+    nb = -(-m // k)
+    pad = nb * k - m
+
+    xs = np.repeat(np.asarray(x, dtype=float)[::k], 2)
+    y = np.empty((n, nb, 2), dtype=np.float32)
+    for start in range(0, n, ROW_BLOCK):
+        block = np.real(data[start:start + ROW_BLOCK])
+        if pad:
+            # Fill the last bucket with its last point
+            block = np.concatenate([block, np.repeat(block[:, -1:], pad, axis=1)], axis=1)
+        block = block.reshape(block.shape[0], nb, k)
+        y[start:start + ROW_BLOCK, :, 0] = block.min(axis=2)
+        y[start:start + ROW_BLOCK, :, 1] = block.max(axis=2)
+
+    return xs, y.reshape(n, nb * 2)
+
+
+def visible_bounds(x, xmin, xmax, margin=0.25):
+    '''
+    Return (start, stop), the range of indices of points of axis x (ascending or descending)
+    between xmin and xmax, widened by margin (a fraction of the span) either side so small
+    pans don't show the edges. (0, 0) if none are visible.
+    '''
+    x = np.asarray(x)
+    pad = (xmax - xmin) * margin
+    visible = np.flatnonzero((x >= xmin - pad) & (x <= xmax + pad))
+    if not len(visible):
+        return 0, 0
+    return int(visible[0]), int(visible[-1]) + 1
+
+
+def plot_buffers(spc, max_points=MAX_PLOT_POINTS):
+    '''
+    Prepare everything needed to plot spectra, so it can be done off the GUI thread:
+
+    - ppm, data: the downsampled axis and spectra (see downsample_rows)
+    - mean: the downsampled mean spectrum, for the overview
+    - xlim, ylim: the plot limits (see Spectra.xlim and Spectra.ylim)
+    '''
+    ppm, data = downsample_rows(spc.ppm, spc.data, max_points)
+
+    mean = np.mean(np.real(spc.data), axis=0) if len(data) else np.zeros(spc.data.shape[1])
+    _, mean = downsample_rows(spc.ppm, mean, max_points)
+
+    with np.errstate(invalid='ignore'):
+        ymin, ymax = (float(np.nanmin(data)), float(np.nanmax(data))) if data.size else (0., 0.)
+    fuzz = max([abs(ymin), abs(ymax)]) * 0.1
+
+    return {
+        'ppm': ppm,
+        'data': data,
+        'mean': mean[0],
+        'xlim': spc.xlim(),
+        'ylim': (ymin - fuzz, ymax + fuzz),
+    }
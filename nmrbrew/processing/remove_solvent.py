@@ -0,0 +1,30 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/remove_solvent.py')
+
+
+def solvent(spc, config, progress_callback, cancel_token=None):
+    import numpy as np
+    import scipy as sp
+    import nmrglue as ng
+
+    fn = {
+        'boxcar': ng.process.proc_bl.sol_boxcar,
+        'sine': ng.process.proc_bl.sol_sine,
+        'sine2': ng.process.proc_bl.sol_sine2,
+        'gaussian': ng.process.proc_bl.sol_gaussian,
+    }[config['algorithm']]
+
+    def locate_nearest(array, value):
+        idx = (np.abs(array-value)).argmin()
+        return idx
+
+    # Locate the water region by ppm 4.75..4.65
+    start, end = locate_nearest(spc.ppm, 4.75), locate_nearest(spc.ppm, 4.65)
+    print("Removing water from %d:%d" % (start, end ))
+    spc.detach('data')
+    spc.data[:,start:end] = fn(spc.data[:,start:end], w=16, mode='same')
+
+    print(spc.data[start:end, :])
+
+    return {'spc': spc}
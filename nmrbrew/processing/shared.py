@@ -0,0 +1,110 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/shared.py')
+
+import weakref
+
+import numpy as np
+
+from ..store import array_root
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+# Arrays held in named shared memory blocks, so worker processes can attach to them (by
+# name) and read or write rows in place, rather than have them pickled through a pipe.
+#
+# A block lives as long as the array allocated in it (and any views of it): once that is
+# garbage collected the block is unlinked, and its mapping closed on the next collect.
+
+_blocks = {}  # name -> SharedMemory, for blocks allocated by this process
+_roots = weakref.WeakValueDictionary()  # id(array) -> array, for arrays allocated in blocks
+_names = {}  # id(array) -> block name
+_released = []  # Names of blocks whose arrays have been freed, to close
+
+
+def is_available():
+    return shared_memory is not None
+
+
+def empty(shape, dtype):
+    '''
+    Return a new (uninitialised) array of shape and dtype in a shared memory block.
+    '''
+    collect()
+
+    dtype = np.dtype(dtype)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(shape)) * dtype.itemsize))
+    a = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+    _blocks[shm.name] = shm
+    _roots[id(a)] = a
+    _names[id(a)] = shm.name
+    weakref.finalize(a, _free, id(a), shm.name)
+    return a
+
+
+def _free(key, name):
+    # Called as the array is freed; its buffer is still held, so it can't be closed yet
+    _names.pop(key, None)
+    try:
+        _blocks[name].unlink()
+    except (KeyError, FileNotFoundError):
+        pass
+    _released.append(name)
+
+
+def collect():
+    '''
+    Close the blocks of arrays that have been freed.
+    '''
+    while _released:
+        shm = _blocks.pop(_released.pop(), None)
+        if shm is not None:
+            shm.close()
+
+
+def is_shared(a):
+    '''
+    True if the memory of array a is a shared memory block allocated here.
+    '''
+    root = array_root(a)
+    return _roots.get(id(root)) is root
+
+
+def share(a):
+    '''
+    Return array a in shared memory: a itself if it already is, or else a copy (read-only if
+    a is). None passes through.
+    '''
+    if a is None or is_shared(a):
+        return a
+
+    out = empty(a.shape, a.dtype)
+    out[...] = a
+    if not a.flags.writeable:
+        out = out.view()
+        out.flags.writeable = False
+    return out
+
+
+def spec(a):
+    '''
+    Return a picklable description of shared array a (which may be a view into a block),
+    for attach: (block name, offset, shape, strides, dtype).
+    '''
+    root = array_root(a)
+    offset = a.__array_interface__['data'][0] - root.__array_interface__['data'][0]
+    return _names[id(root)], offset, a.shape, a.strides, a.dtype.str
+
+
+def attach(spec):
+    '''
+    Attach to the shared array described by spec, as from spec (e.g. in a worker process).
+    Returns (shm, array); close shm once finished with the array.
+    '''
+    name, offset, shape, strides, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset, strides=strides)
@@ -0,0 +1,187 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/spectra.py')
+
+import numpy as np
+
+from ..store import readonly, is_resident
+from . import shared
+
+
+class Spectra(object):
+    '''
+    A set of spectra sharing a ppm axis, with per-spectrum (row) annotations held as NumPy
+    arrays aligned with the rows of data:
+
+    - labels: sample labels
+    - class_codes: integer codes into the classmap lookup table (classes gives the values)
+    - outliers: float outlier score, the fraction of points that are outliers
+    - row_metadata: a record array of further per-row fields (e.g. path, QC measures)
+
+    metadata is a dict of anything that applies to the set as a whole.
+
+    Spectra passed between tools are copy-on-write views (see view): data and ppm are shared
+    read-only, and a tool that modifies either in place must first call detach.
+    '''
+
+    __slots__ = ['data', 'ppm', 'dic', 'labels', 'class_codes', 'classmap', 'outliers', 'row_metadata', 'metadata', 'peaks']
+
+    def __init__(
+        self,
+        ppm=None,
+        data=None,
+        dic=None,
+        classes=None,
+        labels=None,
+        outliers=None,
+        metadata=None,
+        row_metadata=None,
+    ):
+        self.data = data  # 2d np array
+        self.ppm = ppm
+        self.dic = dic
+
+        self.set_classes(classes)
+        self.set_labels(labels)
+        self.set_outliers(outliers)
+        self.set_row_metadata(row_metadata)
+
+        self.metadata = metadata
+
+        self.peaks = []
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    @property
+    def classes(self):
+        return self.classmap[self.class_codes]
+
+    @classes.setter
+    def classes(self, classes):
+        self.set_classes(classes)
+
+    def set_classes(self, classes):
+        if classes is None:
+            classes = [None] * self.data.shape[0]
+
+        # Categorical: codes index the lookup table of distinct classes, in order of appearance
+        lookup = {}
+        self.class_codes = np.fromiter((lookup.setdefault(c, len(lookup)) for c in classes), dtype=np.intp, count=len(classes))
+        self.classmap = np.empty(len(lookup), dtype=object)
+        self.classmap[:] = list(lookup)
+
+    def set_labels(self, labels):
+        if labels is None:
+            labels = [None] * self.data.shape[0]
+
+        self.labels = np.empty(len(labels), dtype=object)
+        self.labels[:] = list(labels)
+
+    def set_outliers(self, outliers):
+        if outliers is None:
+            self.outliers = np.zeros(self.data.shape[0])
+        else:
+            self.outliers = np.asarray(outliers, dtype=float)
+
+    def set_row_metadata(self, row_metadata):
+        '''
+        Set the per-row metadata from a record array, or a dict of equal-length columns.
+        '''
+        if row_metadata is None:
+            row_metadata = np.zeros(self.data.shape[0], dtype=[])
+
+        elif isinstance(row_metadata, dict):
+            names = list(row_metadata.keys())
+            columns = []
+            for name in names:
+                try:
+                    column = np.asarray(row_metadata[name])
+                except ValueError:  # Ragged, e.g. axes of different lengths
+                    column = None
+
+                if column is None or column.ndim != 1 or column.dtype.kind not in 'biufc':
+                    # Strings, arrays etc. are kept as objects, so columns can be concatenated
+                    column = np.empty(len(row_metadata[name]), dtype=object)
+                    column[:] = list(row_metadata[name])
+                columns.append(column)
+
+            row_metadata = np.rec.fromarrays(columns, names=names) if names else np.zeros(self.data.shape[0], dtype=[])
+
+        self.row_metadata = row_metadata
+
+    def view(self):
+        '''
+        Return a copy-on-write view of the spectra. data and ppm are shared with this object,
+        but read-only in the view; the small per-row arrays and metadata are copied.
+        '''
+        spc = Spectra.__new__(Spectra)
+        spc.data = readonly(self.data)
+        spc.ppm = readonly(self.ppm)
+        spc.dic = self.dic
+        spc.labels = self.labels.copy()
+        spc.class_codes = self.class_codes.copy()
+        spc.classmap = self.classmap
+        spc.outliers = self.outliers.copy()
+        spc.row_metadata = self.row_metadata.copy()
+        spc.metadata = dict(self.metadata) if self.metadata else self.metadata
+        spc.peaks = list(self.peaks)
+        return spc
+
+    def detach(self, *names):
+        '''
+        Make the named arrays ('data', 'ppm') private to this object, copying them if they
+        are shared (read-only), so they can be modified in place. Returns the last array.
+        '''
+        a = None
+        for name in names:
+            a = getattr(self, name)
+            if a is not None and not a.flags.writeable:
+                a = np.array(a)
+                setattr(self, name, a)
+        return a
+
+    def share(self):
+        '''
+        Move data and ppm into shared memory (see processing.shared), so worker processes can
+        attach to them rather than be sent a copy. Memory mapped (spilled) arrays are left.
+        '''
+        if not shared.is_available():
+            return
+
+        for name in ('data', 'ppm'):
+            a = getattr(self, name)
+            if a is not None and is_resident(a) and not a.dtype.hasobject:
+                setattr(self, name, shared.share(a))
+
+    def select(self, mask):
+        '''
+        Return a new Spectra of the rows selected by mask (a boolean mask or index array),
+        with every per-row field subset consistently. The ppm axis and classmap are shared.
+        '''
+        spc = Spectra.__new__(Spectra)
+        spc.data = self.data[mask]
+        spc.ppm = self.ppm
+        spc.dic = self.dic
+        spc.labels = self.labels[mask]
+        spc.class_codes = self.class_codes[mask]
+        spc.classmap = self.classmap
+        spc.outliers = self.outliers[mask]
+        spc.row_metadata = self.row_metadata[mask]
+        spc.metadata = dict(self.metadata) if self.metadata else self.metadata
+        spc.peaks = list(self.peaks)
+        return spc
+
+    @property
+    def mean(self):
+        return np.mean(self.data, axis=0)
+
+    def xlim(self):
+        xmin, xmax = np.min(self.ppm), np.max(self.ppm)
+        fuzz = max([abs(xmin), abs(xmax)]) * 0.1
+        return xmin - fuzz, xmax + fuzz
+
+    def ylim(self):
+        ymin, ymax = np.min(self.data), np.max(self.data)
+        fuzz = max([abs(ymin), abs(ymax)]) * 0.1
+        return ymin - fuzz, ymax + fuzz
@@ -0,0 +1,27 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading processing/variance_stabilisation.py')
+
+
+def variance(spc, config, progress_callback, cancel_token=None):
+    import numpy as np
+    import scipy as sp
+
+    algorithm = config.get('algorithm')
+    if algorithm == 'glog':
+        lam = 10**-13
+        spc.data = np.log(spc.data + np.sqrt(spc.data** + lam))
+
+    elif algorithm == 'autoscale':
+        spc.data = spc.data / np.std(spc.data)
+
+    elif algorithm == 'pareto':
+        spc.data = spc.data / np.sqrt( np.std(spc.data) )
+
+    # Clean up numeric extremities in data
+    spc.detach('data')
+    spc.data[np.isnan(spc.data)] = 0
+    spc.data[np.isinf(spc.data)] = 0
+    spc.data[np.isneginf(spc.data)] = 0
+
+    return {'spc': spc}
@@ -0,0 +1,138 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading qc.py')
+
+import numpy as np
+
+# Search window for the TMSP reference peak (ppm)
+TMSP_REGION = (-0.2, 0.2)
+
+# Residual water; excluded when looking for the strongest signal (ppm)
+WATER_REGION = (4.5, 5.0)
+
+# Fraction of the FID, from the end, averaged for the truncation check
+FID_TAIL_FRACTION = 0.02
+
+
+def region_mask(ppm, start, end):
+    start, end = min(start, end), max(start, end)
+    return (ppm >= start) & (ppm <= end)
+
+
+def fid_truncation(block):
+    '''
+    Truncation of each FID in a 2D block: the mean magnitude of the last points relative to
+    the maximum. A fully decayed FID ends in noise (ratio near zero); an acquisition stopped
+    early, or with too short an acquisition time, still has signal at the end.
+    '''
+    tail = max(8, int(block.shape[1] * FID_TAIL_FRACTION))
+    mag = np.abs(block)
+    peak = mag.max(axis=1)
+    peak[peak == 0] = 1
+    return mag[:, -tail:].mean(axis=1) / peak
+
+
+def snr(block, ppm, noise_region):
+    '''
+    Signal to noise ratio of each spectrum in a 2D block: the maximum of the magnitude
+    spectrum (outside the water and noise regions) over twice the standard deviation of the
+    noise region. Imported spectra aren't phase corrected, so both are measured independent
+    of phase: for a phased spectrum this is the maximum and noise of the real spectrum.
+    '''
+    noise = region_mask(ppm, *noise_region)
+    signal = ~(noise | region_mask(ppm, *WATER_REGION))
+    if not noise.any() or not signal.any():
+        return np.full(block.shape[0], np.nan)
+
+    noise_data = block[:, noise]
+    if np.iscomplexobj(noise_data):
+        # Noise is the same in the real and imaginary parts, whatever the phase
+        sd = np.sqrt((np.real(noise_data).var(axis=1) + np.imag(noise_data).var(axis=1)) / 2)
+    else:
+        sd = noise_data.std(axis=1)
+    sd[sd == 0] = np.nan
+    return np.abs(block[:, signal]).max(axis=1) / (2 * sd)
+
+
+def linewidth(block, ppm, sf):
+    '''
+    Full width at half maximum (Hz) of the TMSP reference peak of each spectrum in a 2D
+    block, with the half maximum crossings linearly interpolated between points. sf is the
+    spectrometer frequency (MHz) of each spectrum. NaN where no peak is found in the window.
+
+    Imported spectra aren't phase corrected, so each window is first zero order phased to
+    put the peak in absorption mode (a dispersive peak is much broader at half height).
+    '''
+    mask = region_mask(ppm, *TMSP_REGION)
+    if mask.sum() < 3:
+        return np.full(block.shape[0], np.nan)
+
+    window = block[:, mask]
+    n, w = window.shape
+    rows = np.arange(n)
+    idx = np.arange(w)
+
+    # Phase of the peak (at the magnitude maximum); rotated onto the real axis
+    peak = np.abs(window).argmax(axis=1)
+    phase = np.angle(window[rows, peak])
+    data = np.real(window * np.exp(-1j * phase)[:, np.newaxis])
+
+    peak = data.argmax(axis=1)
+    half = data[rows, peak] / 2
+    below = data < half[:, np.newaxis]
+
+    # Last point below half maximum left of the peak, first one right of it
+    left = np.where(below & (idx < peak[:, np.newaxis]), idx, -1).max(axis=1)
+    right = np.where(below & (idx > peak[:, np.newaxis]), idx, w).min(axis=1)
+    found = (left >= 0) & (right < w) & (half > 0)
+
+    left, right = np.clip(left, 0, w - 2), np.clip(right, 1, w - 1)
+    yl0, yl1 = data[rows, left], data[rows, left + 1]
+    yr0, yr1 = data[rows, right - 1], data[rows, right]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_left = left + (half - yl0) / (yl1 - yl0)
+        x_right = right - 1 + (yr0 - half) / (yr0 - yr1)
+
+    step = np.abs(np.diff(ppm[mask])).mean()
+    fwhm = (x_right - x_left) * step * np.asarray(sf, dtype=float)
+    fwhm[~found] = np.nan
+    return fwhm
+
+
+def quality_control(block, ppm, dics, config):
+    '''
+    Calculate the QC measures for a 2D block of spectra on the ppm axis, where dics are the
+    matching experiment parameters. Returns a dict of per-spectrum lists: snr, linewidth (Hz)
+    and truncation (NaN if the FID was not available, e.g. for processed data).
+    '''
+    sf = []
+    for dic in dics:
+        if 'acqus' in dic and 'SFO1' in dic['acqus']:
+            sf.append(dic['acqus']['SFO1'])
+        elif 'procs' in dic:
+            sf.append(dic['procs']['SF'])
+        else:
+            sf.append(dic['acqus']['BF1'])
+
+    return {
+        'snr': list(snr(block, ppm, (config['qc_noise_start'], config['qc_noise_end']))),
+        'linewidth': list(linewidth(block, ppm, sf)),
+        'truncation': [dic.get('qc', {}).get('truncation', np.nan) for dic in dics],
+    }
+
+
+def qc_pass(qc, config):
+    '''
+    Return a boolean mask of the spectra that pass the QC thresholds in config. Measures
+    that couldn't be calculated (NaN) don't reject a spectrum.
+    '''
+    snr = np.asarray(qc['snr'], dtype=float)
+    lw = np.asarray(qc['linewidth'], dtype=float)
+    truncation = np.asarray(qc['truncation'], dtype=float)
+
+    with np.errstate(invalid='ignore'):
+        return ~(
+            (snr < config['qc_min_snr']) |
+            (lw > config['qc_max_linewidth']) |
+            (truncation > config['qc_max_truncation'])
+        )
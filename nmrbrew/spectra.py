@@ -5,6 +5,8 @@ import pyqtgraph as pg
 
 from .globals import CLASS_COLORS, OUTLIER_COLOR, SPECTRUM_COLOR, config, settings
 from .qt import *
+from .processing.spectra import Spectra
+from .processing.plotting import plot_buffers, downsample_rows, visible_bounds
 
 SPECTRUM_COLOR = QColor(63, 63, 63, 100)
 OUTLIER_COLOR = QColor(255, 0, 0, 255)
@@ -164,45 +166,76 @@ class SpectraViewer(QWidget):
         self.layout.addWidget(self.overViewer)
 
         self.overview_region = None
+        self.curves = []  # Re-used between plots; setting data is cheaper than new items
+
+        # The spectra plotted, and the range of points the curves currently show
+        self._spc_ = None
+        self._buffers_ = None
+        self._bounds_ = None
+
+        # Re-bucket the visible range once zooming or panning pauses
+        self._zoom_timer_ = QTimer()
+        self._zoom_timer_.setSingleShot(True)
+        self._zoom_timer_.setInterval(100)
+        self._zoom_timer_.timeout.connect(self.update_visible_range)
 
         self.spectraViewer.sigXRangeChanged.connect(self.update_region_overview_plot)
+        self.spectraViewer.sigXRangeChanged.connect(self._zoom_timer_.start)
 
         self.setLayout(self.layout)
 
-    def plot(self, spc, autofit=False):
+    def plot(self, spc, autofit=False, buffers=None):
+        """
+        Plot spectra from their plot buffers (see processing.plotting.plot_buffers), as
+        prepared in the tool's worker thread. Without them they are prepared here.
+        """
         canvas = self.spectraViewer
-        canvas.clear()
+        self.clear_canvas()
+
+        self._spc_ = self._buffers_ = self._bounds_ = None
 
         if spc is None:
+            while self.curves:
+                canvas.removeItem(self.curves.pop())
             return
 
-        pen = QPen()
-        pen.setWidth(0)
+        if buffers is None:
+            buffers = plot_buffers(spc)
+
+        self._spc_ = spc
+        self._buffers_ = buffers
+        self._bounds_ = (0, spc.data.shape[1])
 
         sample_classes = dict(config.get("annotation/sample_classes"))
         class_map = list(set(sample_classes.values()))
         class_colors = {c: CLASS_COLORS[n] for n, c in enumerate(class_map)}
 
-        for n, spectrum in enumerate(spc.data):
-            c = spc.classes[n]
+        n_spectra = buffers["data"].shape[0]
+        while len(self.curves) < n_spectra:
+            self.curves.append(canvas.plot())
+        while len(self.curves) > n_spectra:
+            canvas.removeItem(self.curves.pop())
+
+        for n, curve in enumerate(self.curves):
             l = spc.labels[n]
 
             if settings.get("spectra/highlight_outliers") and spc.outliers[n] > 0.5:
-                pen.setColor(OUTLIER_COLOR)
+                color = OUTLIER_COLOR
 
             elif (
                 settings.get("spectra/highlight_classes") and l in sample_classes.keys()
             ):
-                c = class_colors[sample_classes[l]]
-                pen.setColor(c)
+                color = class_colors[sample_classes[l]]
 
             else:
-                pen.setColor(SPECTRUM_COLOR)
+                color = SPECTRUM_COLOR
 
-            canvas.plot(spc.ppm, np.real(spectrum), pen=pen)
+            pen = QPen(color)
+            pen.setWidth(0)
+            curve.setData(buffers["ppm"], buffers["data"][n], pen=pen)
 
-        xlim = spc.xlim()
-        ylim = spc.ylim()
+        xlim = buffers["xlim"]
+        ylim = buffers["ylim"]
 
         canvas.setLimits(
             xMin=xlim[0],
@@ -232,18 +265,55 @@ class SpectraViewer(QWidget):
 
         pen = QPen(SPECTRUM_COLOR)
         pen.setWidth(0)
-        canvas.plot(spc.ppm, np.mean(np.real(spc.data), axis=0), pen=pen)
+        canvas.plot(buffers["ppm"], buffers["mean"], pen=pen)
 
         self.update_region_overview_plot()
 
+        self.update_visible_range()
+
         if autofit:
             canvas.setRange(
                 xRange=(np.min(spc.ppm), np.max(spc.ppm)),
-                yRange=(np.min(spc.data), np.max(spc.data)),
+                yRange=(np.nanmin(buffers["data"]), np.nanmax(buffers["data"])),
                 padding=0.1,
                 update=True,
             )
 
+    def update_visible_range(self):
+        """
+        Plot buffers cover the whole ppm range at a limited number of points; once zoomed in,
+        re-bucket just the visible range from the spectra, at full resolution if it fits.
+        """
+        spc = self._spc_
+        if spc is None:
+            return
+
+        r = self.spectraViewer.viewRect()
+        bounds = visible_bounds(spc.ppm, r.left(), r.right())
+        if bounds[1] - bounds[0] < 2 or bounds == self._bounds_:
+            return
+
+        if bounds == (0, spc.data.shape[1]):
+            # Everything is visible; the prepared buffers already cover it
+            ppm, data = self._buffers_["ppm"], self._buffers_["data"]
+        else:
+            ppm, data = downsample_rows(spc.ppm[bounds[0]:bounds[1]], spc.data[:, bounds[0]:bounds[1]])
+
+        self._bounds_ = bounds
+        for n, curve in enumerate(self.curves):
+            curve.setData(ppm, data[n])
+
+    def clear_canvas(self):
+        """
+        Remove everything from the spectra plot (e.g. regions and baselines added by tools),
+        other than the spectra curves kept for re-use.
+        """
+        canvas = self.spectraViewer
+        curves = set(id(c) for c in self.curves)
+        for item in list(canvas.getPlotItem().items):
+            if id(item) not in curves:
+                canvas.removeItem(item)
+
     def update_region_overview_plot(self):
         r = self.spectraViewer.viewRect()
         if self.overview_region:
@@ -323,61 +393,3 @@ class PCAViewer(QWidget):
 
         # if autofit:
         #    canvas.setRange(xRange=(-xt, xt), yRange=(-yt, yt), padding=0.1, update=True)
-
-
-class Spectra(object):
-    def __init__(
-        self,
-        ppm=None,
-        data=None,
-        dic=None,
-        classes=None,
-        labels=None,
-        outliers=None,
-        metadata=None,
-    ):
-        self.data = data  # 2d np array
-        self.ppm = ppm
-        self.dic = dic
-
-        self.set_classes(classes)
-        self.set_labels(labels)
-        self.set_outliers(outliers)
-
-        self.metadata = metadata
-
-        self.peaks = []
-
-    def set_classes(self, classes):
-        if classes is None:
-            self.classes = [None] * self.data.shape[0]
-        else:
-            self.classes = classes
-
-        self.classmap = list(set(self.classes))
-
-    def set_labels(self, labels):
-        if labels is None:
-            self.labels = [None] * self.data.shape[0]
-        else:
-            self.labels = labels
-
-    def set_outliers(self, outliers):
-        if outliers is None:
-            self.outliers = [0] * self.data.shape[0]
-        else:
-            self.outliers = outliers
-
-    @property
-    def mean(self):
-        return np.mean(self.data, axis=0)
-
-    def xlim(self):
-        xmin, xmax = np.min(self.ppm), np.max(self.ppm)
-        fuzz = max([abs(xmin), abs(xmax)]) * 0.1
-        return xmin - fuzz, xmax + fuzz
-
-    def ylim(self):
-        ymin, ymax = np.min(self.data), np.max(self.data)
-        fuzz = max([abs(ymin), abs(ymax)]) * 0.1
-        return ymin - fuzz, ymax + fuzz
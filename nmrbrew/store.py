@@ -0,0 +1,448 @@
+from __future__ import unicode_literals
+import logging
+logging.debug('Loading store.py')
+
+import os
+import copy
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+
+import numpy as np
+
+# Spectra attributes holding (potentially large) arrays
+SPECTRA_ARRAYS = ['data', 'ppm']
+
+# Spare rows allocated when growing an array by append_rows, as a fraction of its size
+GROWTH = 0.5
+
+_buffers = weakref.WeakValueDictionary()  # id(buffer) -> buffer, for arrays with spare rows
+_filled = {}  # id(buffer) -> rows of it in use
+
+
+def readonly(a):
+    '''
+    Return a read-only view of array a (None passes through).
+    '''
+    if a is None:
+        return None
+    v = a.view()
+    v.flags.writeable = False
+    return v
+
+
+def array_root(a):
+    '''
+    Return the array that owns the memory of a (a itself if it isn't a view).
+    '''
+    while isinstance(a.base, np.ndarray):
+        a = a.base
+    return a
+
+
+def append_rows(data, rows):
+    '''
+    Return a read-only array of data with rows appended. If data is all the rows in use of a
+    buffer from an earlier append and the buffer has room, rows are written into it in place;
+    otherwise a new buffer is allocated with spare rows (GROWTH) for later appends. Repeated
+    appends so copy the existing rows only occasionally, rather than every time.
+
+    Only the latest array from a buffer is extended in place, so earlier arrays (sharing its
+    first rows) are never changed.
+    '''
+    n, k = data.shape[0], rows.shape[0]
+    root = array_root(data)
+
+    if not (
+        _buffers.get(id(root)) is root and _filled.get(id(root)) == n and
+        n + k <= root.shape[0] and root.dtype == data.dtype and
+        root.shape[1:] == data.shape[1:] and data.flags.c_contiguous and
+        data.__array_interface__['data'][0] == root.__array_interface__['data'][0]
+    ):
+        root = np.empty((int((n + k) * (1 + GROWTH)) + 1,) + data.shape[1:], dtype=data.dtype)
+        root[:n] = data
+        _buffers[id(root)] = root
+        weakref.finalize(root, _filled.pop, id(root), None)
+
+    root[n:n + k] = rows
+    _filled[id(root)] = n + k
+    return readonly(root[:n + k])
+
+
+def array_slots(result):
+    '''
+    Return (obj, name, array) for every array held in a tool result: the Spectra data and
+    ppm arrays and any top level arrays (e.g. a fitted baseline).
+    '''
+    slots = []
+    for k, v in result.items():
+        if isinstance(v, np.ndarray):
+            slots.append((result, k, v))
+
+        elif k == 'spc' and v is not None:
+            for name in SPECTRA_ARRAYS:
+                a = getattr(v, name, None)
+                if isinstance(a, np.ndarray):
+                    slots.append((v, name, a))
+
+    return slots
+
+
+def copy_result(result):
+    '''
+    Return a shallow copy of a tool result: a new dict, and a new Spectra, holding the same
+    arrays. Slots of the copy can be replaced (see set_slot) without changing the original.
+    '''
+    result = dict(result)
+    if result.get('spc') is not None:
+        result['spc'] = copy.copy(result['spc'])
+    return result
+
+
+def get_slot(obj, name):
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+def set_slot(obj, name, value):
+    if isinstance(obj, dict):
+        obj[name] = value
+    else:
+        setattr(obj, name, value)
+
+
+def probably_equal(a, b, samples=1024):
+    '''
+    Compare a sample of points first, so differing arrays are rejected without a full pass.
+    '''
+    step = max(1, a.size // samples)
+    if not np.array_equal(a.reshape(-1)[::step], b.reshape(-1)[::step]):
+        return False
+    return np.array_equal(a, b)
+
+
+def is_resident(a):
+    '''
+    True if the memory of a is held in RAM, rather than mapped from a file.
+    '''
+    return not isinstance(array_root(a), np.memmap)
+
+
+class StageStore(object):
+    '''
+    Central store of the output of each processing stage (tool), owned by the main window.
+
+    Each stage's result is held once. When a result is prepared for storing (see prepare, run
+    in the worker before put) any array equal to one already held by another stage (e.g. the
+    spectra data after a tool that only changed ppm, or one that copied the data but changed
+    nothing) is replaced by a read-only view of the stored array, so unchanged data is shared
+    between stages rather than duplicated.
+
+    If a memory budget is set, enforce_budget spills the arrays of the least recently used
+    stages to .npy files in a scratch folder, memory mapping them (read-only) in their place,
+    until the resident size is within it. A spilled stage stays readable, and is paged back
+    into memory by page_in before it is next processed. Both write or read whole arrays, so
+    are meant to run in the background (or the worker using the stage); get and put only
+    swap references. Arrays are written and read outside the store's lock, and only swapped
+    in if the stage still holds the same ones.
+
+    If shared is set, the spectra data and ppm of each stored stage are kept in shared memory
+    blocks, which process workers attach to by name (see processing.shared). A block is
+    released once no stage (or anything else) holds its array.
+
+    :param budget: Memory budget in bytes; 0 for unlimited
+    :param scratch_dir: Folder for spilled arrays; default a temporary folder
+    :param shared: Keep stage spectra in shared memory
+    '''
+
+    def __init__(self, budget=0, scratch_dir=None, shared=False):
+        self.stages = OrderedDict()
+        self.last_used = OrderedDict()  # Least recently used first
+        self.spilled = {}  # stage -> filenames of spilled arrays
+
+        self.budget = budget
+        self.scratch_dir = scratch_dir
+        self.shared = shared
+        self._scratch_ = None
+
+        self._lock_ = threading.RLock()  # Guards stages, last_used and spilled
+        self._spill_lock_ = threading.Lock()  # One enforce_budget at a time
+
+    def __contains__(self, stage):
+        return stage in self.stages
+
+    def get(self, stage, default=None):
+        '''
+        Return the output of stage, as held: if spilled, its arrays stay memory mapped.
+        '''
+        with self._lock_:
+            if stage not in self.stages:
+                return default
+
+            self.touch(stage)
+            return self.stages[stage]
+
+    def prepare(self, stage, result):
+        '''
+        Deduplicate result against the other stages and, if shared is set, move its spectra
+        into shared memory: the slow part of storing a result, done before put by the worker
+        that made it, so put itself only swaps references.
+        '''
+        self.dedupe(stage, result)
+        if self.shared:
+            self.share(result)
+        return result
+
+    def put(self, stage, result):
+        '''
+        Store result (see prepare) as the output of stage.
+        '''
+        with self._lock_:
+            self.discard_spilled(stage)
+            self.stages[stage] = result
+            self.touch(stage)
+
+    def remove(self, stage):
+        with self._lock_:
+            self.discard_spilled(stage)
+            self.stages.pop(stage, None)
+            self.last_used.pop(stage, None)
+
+    def clear(self):
+        with self._lock_:
+            for stage in list(self.stages):
+                self.remove(stage)
+
+    def close(self):
+        '''
+        Release all stages and remove the scratch folder.
+        '''
+        self.clear()
+        if self._scratch_ is not None:
+            shutil.rmtree(self._scratch_, ignore_errors=True)
+            self._scratch_ = None
+
+    def share(self, result):
+        spc = result.get('spc')
+        if spc is not None:
+            spc.share()
+
+    def touch(self, stage):
+        self.last_used.pop(stage, None)
+        self.last_used[stage] = True
+
+    def scratch(self):
+        if self._scratch_ is None:
+            if self.scratch_dir and not os.path.isdir(self.scratch_dir):
+                os.makedirs(self.scratch_dir)
+            self._scratch_ = tempfile.mkdtemp(prefix='nmrbrew-', dir=self.scratch_dir or None)
+        return self._scratch_
+
+    def resident_size(self):
+        return sum(self.sizes().values())
+
+    def enforce_budget(self):
+        '''
+        Spill least recently used stages until the resident size is within the budget. The
+        most recently used stage is never spilled.
+        '''
+        if not self.budget:
+            return
+
+        with self._spill_lock_:
+            with self._lock_:
+                stages = list(self.last_used)[:-1]
+
+            for stage in stages:
+                if self.resident_size() <= self.budget:
+                    break
+                if stage not in self.spilled:
+                    self.spill(stage)
+
+    def spill(self, stage):
+        '''
+        Write the resident arrays of stage to the scratch folder and replace them with
+        read-only memory maps. Arrays shared with other resident stages are left in memory,
+        as spilling them would free nothing.
+        '''
+        with self._lock_:
+            result = self.stages.get(stage)
+            if result is None or stage in self.spilled:
+                return
+
+            shared = set()
+            for other, r in self.stages.items():
+                if other != stage:
+                    shared.update(id(array_root(a)) for _, _, a in array_slots(r))
+
+            slots = [
+                (obj, name, a) for obj, name, a in array_slots(result)
+                if is_resident(a) and not a.dtype.hasobject and id(array_root(a)) not in shared
+            ]
+
+        written = []
+        filenames = []  # Those swapped in; the rest are removed
+        try:
+            for obj, name, a in slots:
+                fd, fn = tempfile.mkstemp(dir=self.scratch(), suffix='.npy')
+                written.append((obj, name, a, fn))
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, a)
+
+            with self._lock_:
+                if self.stages.get(stage) is result and stage not in self.spilled:
+                    # Only arrays the stage still holds; it may have been replaced meanwhile
+                    for obj, name, a, fn in written:
+                        if get_slot(obj, name) is a:
+                            set_slot(obj, name, np.load(fn, mmap_mode='r'))
+                            filenames.append(fn)
+                    self.spilled[stage] = filenames
+                    logging.info("Spilled stage %s to disk (%d arrays)" % (stage, len(filenames)))
+        finally:
+            for _, _, _, fn in written:
+                if fn not in filenames:
+                    os.remove(fn)
+
+    def page_in(self, stage):
+        '''
+        Read the spilled arrays of stage back into memory, e.g. in the worker about to use it,
+        and return the output of stage.
+        '''
+        with self._lock_:
+            result = self.stages.get(stage)
+            if result is None:
+                return None
+
+            self.touch(stage)
+            filenames = set(self.spilled.get(stage, []))
+            slots = [
+                (obj, name, a) for obj, name, a in array_slots(result)
+                if isinstance(array_root(a), np.memmap) and array_root(a).filename in filenames
+            ]
+
+        if not filenames:
+            return result
+
+        loaded = [(obj, name, a, readonly(np.array(a))) for obj, name, a in slots]
+
+        with self._lock_:
+            if self.stages.get(stage) is not result:
+                return self.stages.get(stage)
+
+            for obj, name, a, b in loaded:
+                if get_slot(obj, name) is a:
+                    set_slot(obj, name, b)
+            self.discard_spilled(stage)
+
+        if self.shared:
+            self.share(result)
+        logging.info("Paged stage %s back into memory" % stage)
+        return result
+
+    def discard_spilled(self, stage):
+        for fn in self.spilled.pop(stage, []):
+            try:
+                os.remove(fn)  # Still open mappings keep the data until released
+            except OSError:
+                pass
+
+    def dedupe(self, stage, result):
+        '''
+        Replace arrays in result equal to arrays held by other stages with shared views.
+        '''
+        held = {}
+        for other, r in list(self.stages.items()):
+            if other != stage:
+                for _, _, a in array_slots(r):
+                    held.setdefault((a.shape, a.dtype.str), []).append(a)
+
+        for obj, name, a in array_slots(result):
+            if a.size == 0:
+                continue
+
+            root = array_root(a)
+            for b in held.get((a.shape, a.dtype.str), []):
+                if array_root(b) is root:
+                    break  # Already shared
+
+                if probably_equal(a, b):
+                    set_slot(obj, name, readonly(b))
+                    break
+
+    def sizes(self, order=None):
+        '''
+        Return an OrderedDict of the resident size (bytes) of each stage, in the given order
+        of stages (default: the order they were first stored). Memory shared with an earlier
+        stage is only counted for that stage; memory mapped (spilled) arrays are not counted.
+        '''
+        with self._lock_:
+            stages = dict(self.stages)
+            order = list(order if order is not None else self.stages.keys())
+
+        seen = set()
+        sizes = OrderedDict()
+        for stage in order:
+            total = 0
+            for _, _, a in array_slots(stages.get(stage) or {}):
+                root = array_root(a)
+                if id(root) not in seen and is_resident(a):
+                    seen.add(id(root))
+                    total += root.nbytes
+            sizes[stage] = total
+
+        return sizes
+
+
+class ResultCache(object):
+    '''
+    Least recently used cache of tool results, keyed by a fingerprint of their input and
+    config (see ToolBase.cache_key), bounded by the total size of the arrays held.
+
+    Arrays are shared with the stage store rather than copied, so a result that is also the
+    current output of a stage costs nothing extra until the stage is re-run. The result dict
+    and Spectra are copied in and out (see copy_result), so the stage store replacing arrays
+    in a stage (deduplicating, spilling or paging in) leaves the cached result as it was.
+
+    :param max_size: Size limit in bytes; 0 disables the cache
+    '''
+
+    def __init__(self, max_size=0):
+        self.results = OrderedDict()  # Least recently used first
+        self.max_size = max_size
+
+    def __contains__(self, key):
+        return key in self.results
+
+    def get(self, key, default=None):
+        if key not in self.results:
+            return default
+
+        result = self.results.pop(key)
+        self.results[key] = result
+        return copy_result(result)
+
+    def put(self, key, result):
+        self.results.pop(key, None)
+        self.results[key] = copy_result(result)
+        self.evict()
+
+    def clear(self):
+        self.results.clear()
+
+    def size(self):
+        seen = set()
+        total = 0
+        for result in self.results.values():
+            for _, _, a in array_slots(result):
+                root = array_root(a)
+                if id(root) not in seen:
+                    seen.add(id(root))
+                    total += root.nbytes
+        return total
+
+    def evict(self):
+        while self.results and self.size() > self.max_size:
+            self.results.popitem(last=False)
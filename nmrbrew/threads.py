@@ -5,6 +5,7 @@ logging.debug('Loading threads.py')
 
 # Import PyQt5 classes
 from .qt import *
+from .processing.cancel import Cancelled
 import sys
 import traceback
 
@@ -26,9 +27,13 @@ class WorkerSignals(QObject):
         
     status
         `str` one of standard status flag message types
+
+    cancelled
+        No data; the function stopped early via its cancel token
         
     '''
     finished = pyqtSignal()
+    cancelled = pyqtSignal()
     error = pyqtSignal(tuple)
     result = pyqtSignal(dict)
     status = pyqtSignal(str)
@@ -65,6 +70,8 @@ class Worker(QRunnable):
         # Retrieve args/kwargs here; and fire processing using them
         try:
             result = self.fn(*self.args, **self.kwargs)
+        except Cancelled:
+            self.signals.cancelled.emit()
         except:
             traceback.print_exc()
             exctype, value = sys.exc_info()[:2]
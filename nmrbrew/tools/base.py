@@ -2,13 +2,17 @@ from ..qt import *
 from .. import utils
 from pyqtconfig import ConfigManager
 import logging
+import json
+import uuid
+import hashlib
+from functools import partial
 from ..threads import Worker
+from ..processing.cancel import CancelToken
+from ..processing.plotting import plot_buffers
 from ..globals import custom_pyqtconfig_hooks
 
 import numpy as np
 
-from copy import deepcopy
-
 SPECTRUM_COLOR = QColor(0, 0, 0, 100)
 
 ''' Brewer colors for spectra labelled by class '''
@@ -38,6 +42,15 @@ class ToolBase(QObject):
     is_auto_rerunnable = True
     is_disableable = True
 
+    # Results are reused when the input and config are unchanged (see cache_key); tools
+    # that read from or write to disk must always run
+    is_cacheable = True
+    uncached_config = ['is_active', 'auto_run_on_config_change']
+
+    # Tool functions that work spectrum by spectrum take an executor, to run across rows in
+    # parallel (see processing.executor)
+    is_row_parallel = False
+
     progress = pyqtSignal(float)
     status = pyqtSignal(str)
 
@@ -69,6 +82,21 @@ class ToolBase(QObject):
         self._worker_thread_ = None
         self._worker_thread_lock_ = False
 
+        # Cancels the running job; a job requested meanwhile waits, replacing any other
+        self._cancel_token_ = CancelToken()
+        self._pending_fn_ = None
+
+        # Fingerprint of the current result, and of the one being calculated
+        self._result_key_ = None
+        self._pending_key_ = None
+
+        # Config of the latest run, and the pipeline generation it was started in; the
+        # result of a run is discarded if the tool was made stale in the meantime
+        self._run_config_ = None
+        self._generation_ = None
+        self.is_stale = False
+
+        # Results are held in the main window's stage store; see data
         self.data = {
             'spc': None,
 
@@ -145,6 +173,8 @@ class ToolBase(QObject):
             buttons.append(auto)
 
         if self.is_manual_runnable:
+            buttons.append(self.cancelButton())
+
             apply = QPushButton(QIcon(os.path.join(utils.scriptdir, 'icons', 'play.png')), 'Apply')
             apply.setToolTip('Apply current settings to spectra')
             apply.pressed.connect(self.run_manual)
@@ -152,6 +182,24 @@ class ToolBase(QObject):
 
         return buttons
 
+    def cancelButton(self):
+        cancel = QPushButton(QIcon(os.path.join(utils.scriptdir, 'icons', 'cross.png')), 'Cancel')
+        cancel.setToolTip('Stop the running calculation')
+        cancel.pressed.connect(self.onCancel)
+        return cancel
+
+    def onCancel(self):
+        # Stop re-running stale tools too, or this one would be restarted straight away
+        self.parent().stop_auto_run()
+        self.cancel()
+
+    def cancel(self):
+        '''
+        Cancel the running job (it stops at its next check) and any job waiting on it.
+        '''
+        self._pending_fn_ = None
+        self._cancel_token_.cancel()
+
     def enable(self):
         if self.current_status == 'inactive':
             self.status.emit('ready')
@@ -176,6 +224,14 @@ class ToolBase(QObject):
     def set_active(self, active):
         self.config.set('is_active', active)
 
+    @property
+    def data(self):
+        return self.parent().store.get(self.__class__.__name__)
+
+    @data.setter
+    def data(self, result):
+        self.parent().store.put(self.__class__.__name__, result)
+
     def get_previous_tool(self):
         # Get the previous ACTIVE tool in the tool table
         n = self.parent().tools.index(self)
@@ -187,6 +243,11 @@ class ToolBase(QObject):
             return None
 
 
+    def get_previous_stage(self):
+        # Name of the stage (see StageStore) the input spectra come from
+        t = self.get_previous_tool()
+        return t.__class__.__name__ if t else None
+
     def get_previous_spc(self):
         t = self.get_previous_tool()
         if t:
@@ -196,15 +257,42 @@ class ToolBase(QObject):
 
     def plot(self, **kwargs):
         if 'spc' in self.data:
-            self.parent().spectraViewer.plot(self.data['spc'], **kwargs)
+            self.parent().spectraViewer.plot(self.data['spc'], buffers=self.data.get('plot', {}).get('spc'), **kwargs)
 
     def get_plotitem(self):
         return self.parent().spectraViewer.spectraViewer.plotItem
 
     def auto_run_on_config_change(self):
-        pass
-        #if self.is_auto_runnable and self.config.get('is_active') and self.config.get('auto_run_on_config_change'):
-        #    self.run_manual()
+        if not (self.is_auto_runnable and self.config.get('is_active') and self.config.get('auto_run_on_config_change')):
+            return
+
+        if self._run_config_ is None or self.run_config() == self._run_config_:
+            return  # Never run, or nothing changed that affects the result
+
+        # Re-run this and the tools after it (debounced, so rapid edits trigger one run)
+        self.parent().invalidate_from(self)
+
+    def run_config(self):
+        '''
+        Config as passed to the tool function, less settings that don't affect the result.
+        '''
+        return {k: v for k, v in self.config.as_dict().items() if k not in self.uncached_config}
+
+    def cache_key(self, fn):
+        '''
+        Fingerprint of a run of fn on the current input: the fingerprint of the previous
+        tool's result (which in turn covers everything upstream) and this tool's config.
+        None if the result can't be reused.
+        '''
+        if not self.is_cacheable:
+            return None
+
+        t = self.get_previous_tool()
+        if t is None or t._result_key_ is None:
+            return None
+
+        fingerprint = json.dumps([self.__class__.__name__, fn.__name__, t._result_key_, self.run_config()], sort_keys=True, default=repr)
+        return hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
 
     def run(self, fn):
         '''
@@ -213,23 +301,48 @@ class ToolBase(QObject):
         :return:
         '''
         if self._worker_thread_lock_:
-            return False # Can't run
+            # Stop the running job; this one replaces any already waiting and starts when it ends
+            self._cancel_token_.cancel()
+            self._pending_fn_ = fn
+            return False
 
         self.progress.emit(0)
         self.status.emit('active')
 
+        self._run_config_ = self.run_config()
+        self._generation_ = self.parent().generation.current()
+
+        self._pending_key_ = self.cache_key(fn)
+        cached = self.parent().results.get(self._pending_key_) if self._pending_key_ else None
+        if cached is not None:
+            logging.info("%s: input and config unchanged, reusing result" % self.__class__.__name__)
+            self.progress.emit(1)
+            self.status.emit('complete')
+            self.set_result(cached)  # Already post-processed
+            self.plot()
+            self.finished()
+            return True
+
         spc = self.get_previous_spc()
 
         self._worker_thread_lock_ = True
+        self._cancel_token_ = CancelToken()
 
-        print(self.config.as_dict())
-        self._worker_thread_ = Worker(fn = fn, **{
-            'spc': deepcopy(spc),
+        kwargs = {
+            # Copy-on-write; tools detach the arrays they modify
+            'spc': spc.view() if spc is not None else None,
             'config': self.config.as_dict(),
             'progress_callback': self.progress.emit,
-        })
+            'cancel_token': self._cancel_token_,
+        }
+        if self.is_row_parallel:
+            kwargs['executor'] = self.parent().executor
+
+        print(self.config.as_dict())
+        self._worker_thread_ = Worker(fn = partial(self.process, fn, self.parent().store, self.__class__.__name__, self.get_previous_stage()), **kwargs)
 
         self._worker_thread_.signals.finished.connect(self.finished)
+        self._worker_thread_.signals.cancelled.connect(self.cancelled)
         self._worker_thread_.signals.result.connect(self.result)
         self._worker_thread_.signals.error.connect(self.error)
 
@@ -242,21 +355,51 @@ class ToolBase(QObject):
         logging.error(error)
         self._worker_thread_lock_ = False
 
+        # Don't carry on re-running later tools on this tool's previous output
+        self.parent().stop_auto_run()
+
+    def cancelled(self):
+        logging.info("%s: cancelled" % self.__class__.__name__)
+        self.progress.emit(0)
+        self.status.emit('stale' if self.is_stale else 'ready')
+
     def result(self, result):
+        if self.is_stale and not self.parent().generation.is_current(self._generation_):
+            # Config changed while running; the result is out of date before it is stored
+            logging.info("%s: discarding result of out of date run" % self.__class__.__name__)
+            self.status.emit('stale')
+            return
+
         self.progress.emit(1)
         self.status.emit('complete')
 
-        # Apply post-processing
-        if 'spc' in result:
-            result['spc'] = self.post_process_spc(result['spc'])
+        self.set_result(result)  # Already post-processed, in the worker
+        self.plot()
+
+    def set_result(self, result):
+        # Results that can't be reused still get a unique fingerprint for tools downstream
+        self._result_key_ = self._pending_key_ or uuid.uuid4().hex
+        if self._pending_key_:
+            self.parent().results.put(self._pending_key_, result)
+        self._pending_key_ = None
+        self.is_stale = False
 
         self.data = result
-        self.plot()
+        self.parent().update_memory_status()
+        self.parent().enforce_budget()
 
     def finished(self):
         # Cleanup
         self._worker_thread_lock_ = False
 
+        if self._pending_fn_ is not None:
+            fn, self._pending_fn_ = self._pending_fn_, None
+            self.run(fn)
+            return
+
+        # Continue re-running out of date tools, once back in the event loop
+        QTimer.singleShot(0, self.parent().run_stale)
+
 
     def progress_callback(self, progress):
         self.current_progress = progress
@@ -266,6 +409,36 @@ class ToolBase(QObject):
         self.current_status = status
         self.item.setData(Qt.UserRole + 3, status)
 
+    def process(self, fn, store=None, stage=None, source=None, **kwargs):
+        '''
+        Run the tool function, then post-process the result, prepare its plot and prepare it
+        for the stage store (see StageStore.prepare). Runs in the worker thread, so the GUI
+        thread only has to store and draw the result. If the input stage (source) has been
+        spilled to disk it is paged back into memory here first.
+        '''
+        if store is not None and source in store.spilled:
+            paged = store.page_in(source)
+            if paged is not None and paged.get('spc') is not None:
+                kwargs['spc'] = paged['spc'].view()
+
+        result = fn(**kwargs)
+
+        if 'spc' in result:
+            result['spc'] = self.post_process_spc(result['spc'])
+            result['plot'] = self.prepare_plot(result)
+
+        if store is not None:
+            store.prepare(stage, result)
+
+        return result
+
+    def prepare_plot(self, result):
+        '''
+        Return the plot buffers for a result (see processing.plotting.plot_buffers), by
+        name of the array they are for. Called in the worker thread; must not touch Qt.
+        '''
+        return {'spc': plot_buffers(result['spc'])}
+
     def post_process_spc(self, spc):
         '''
         Apply post-processing to the spectra before loading into the data store, e.g. for outlier
@@ -3,6 +3,8 @@ import numpy as np
 from ..qt import *
 from ..ui import ConfigPanel
 from .base import ToolBase
+from ..processing.baseline_correction import baseline
+from ..processing.plotting import downsample_rows
 
 
 class BaselineCorrectionConfig(ConfigPanel):
@@ -127,6 +129,7 @@ class BaselineCorrection(ToolBase):
     name = "Baseline correction"
     description = "Baseline correct NMR spectra"
     icon = "baseline.png"
+    is_row_parallel = True
 
     def __init__(self, *args, **kwargs):
         super(BaselineCorrection, self).__init__(*args, **kwargs)
@@ -157,111 +160,13 @@ class BaselineCorrection(ToolBase):
     def run_manual(self):
         self.run(self.baseline)
 
-    @staticmethod
-    def baseline(spc, config, progress_callback):
-        import numpy as np
-        import scipy as sp
-        import scipy.signal
-        import scipy.sparse.linalg
+    baseline = staticmethod(baseline)
 
-        def baseline_als(y, lam, p, niter=10):
-            L = len(y)
-            D = sp.sparse.csc_matrix(np.diff(np.eye(L), 2))
-            w = np.ones(L)
-
-            for i in range(niter):
-                W = sp.sparse.spdiags(w, 0, L, L)
-                Z = W + lam * D.dot(D.transpose())
-                z = sp.sparse.linalg.spsolve(Z, w * y)
-                w = p * (y > z) + (1 - p) * (y < z)
-
-            return z
-
-        import nmrglue as ng
-
-        algorithm = config.get("algorithm")
-
-        # Medium algorithm vars
-        med_mw = config.get("med_mw")
-        med_sf = config.get("med_sf")
-        med_sigma = config.get("med_sigma")
-
-        # Cbf pc algorithm vars
-        cbf_last_pc = config.get("cbf_last_pc")
-
-        # Cbf explicit algorithm vars
-        cbf_explicit_start = config.get("cbf_explicit_start")
-        cbf_explicit_end = config.get("cbf_explicit_start")
-
-        total_n = spc.data.shape[0]
-
-        # Remove imaginaries
-        spc.data = np.real(spc.data)
-        bls = []
-        bls_points = []
-
-        # Calculate points for ALS
-        if algorithm == "als":
-            # FIXME: This should be
-            point_step_size = 256
-            # Find the indices of the smallest values in the sum of all spectra
-            idx = np.arange(0, spc.data.shape[1], point_step_size)
-
-            # Skip water region
-            def locate_nearest(array, value):
-                idx = (np.abs(array - value)).argmin()
-                return idx
-
-            start_idx = locate_nearest(spc.ppm, 4.5)
-            end_idx = locate_nearest(spc.ppm, 5)
-
-            if start_idx > end_idx:
-                start_idx, end_idx = end_idx, start_idx
-
-            print(idx, start_idx, end_idx)
-
-            MASK_UP = idx > end_idx
-            MASK_DOWN = idx < start_idx
-            idx = idx[MASK_UP | MASK_DOWN]
-
-            print(idx)
-
-        for n, di in enumerate(spc.data):
-            if algorithm == "median":
-                dr = ng.process.proc_bl.med(di, mw=med_mw, sf=med_sf, sigma=med_sigma)
-
-            elif algorithm == "cbf_pc":
-                dr = ng.process.proc_bl.cbf(di, last=cbf_last_pc)
-
-            elif algorithm == "cbf_explicit":
-                dr = ng.process.proc_bl.cbf_explicit(
-                    di, calc=slice(cbf_explicit_start, cbf_explicit_end)
-                )
-
-            elif algorithm == "als":
-                # Find n minima in the spectra; using 0.05 threshold + filtering to step size 64
-                bl = baseline_als(di[idx], lam=10**5, p=0.01)
-                bls_points.append(bl)
-                # Interpolate the line back to the correct size using spline function
-                tck = sp.interpolate.splrep(spc.ppm[idx][::-1], bl[::-1], s=0)
-                bl = sp.interpolate.splev(spc.ppm, tck, der=0)
-
-                # fn = sp.interpolate.interp1d(spc.ppm[idx], bl, kind='slinear', bounds_error=False)
-                # bl = fn(spc.ppm)
-                dr = di - bl
-                bls.append(bl)  # For visualisation
-
-            spc.data[n, :] = dr
-
-            progress_callback(float(n) / total_n)
-
-        print(np.mean(np.array(bls_points), axis=0))
-        return {
-            "spc": spc,
-            "baseline": np.array(bls),
-            "baseline_point_idx": idx,
-            "baseline_point_y": np.mean(np.array(bls_points), axis=0),
-        }
+    def prepare_plot(self, result):
+        buffers = super(BaselineCorrection, self).prepare_plot(result)
+        if "baseline" in result:
+            buffers["baseline"] = downsample_rows(result["spc"].ppm, result["baseline"])
+        return buffers
 
     def plot(self, **kwargs):
         super(BaselineCorrection, self).plot(**kwargs)
@@ -270,8 +175,11 @@ class BaselineCorrection(ToolBase):
             canvas = self.parent().spectraViewer.spectraViewer
             pen = QPen(QColor(0, 0, 255, 100))
             pen.setWidth(0)
-            for n, spc in enumerate(self.data["baseline"]):
-                canvas.plot(self.data["spc"].ppm, spc, pen=pen)
+            ppm, baselines = self.data.get("plot", {}).get("baseline") or downsample_rows(
+                self.data["spc"].ppm, self.data["baseline"]
+            )
+            for bl in baselines:
+                canvas.plot(ppm, bl, pen=pen)
 
         if (
             "baseline_point_idx" in self.data
@@ -280,7 +188,6 @@ class BaselineCorrection(ToolBase):
             idx = self.data["baseline_point_idx"]
             canvas = self.parent().spectraViewer.spectraViewer
 
-            mean_spc = np.mean(self.data["spc"].data, axis=0)
             canvas.plot(
                 self.data["spc"].ppm[idx],
                 self.data["baseline_point_y"],
@@ -3,6 +3,7 @@ import pyqtgraph as pg
 from ..qt import *
 from ..ui import ConfigPanel, QListWidgetAddRemove
 from .base import ToolBase
+from ..processing.exclude_regions import exclude
 
 
 class ExcludeRegionsConfig(ConfigPanel):
@@ -97,48 +98,7 @@ class ExcludeRegions(ToolBase):
     def run_manual(self):
         self.run(self.exclude)
 
-    @staticmethod
-    def exclude(spc, config, progress_callback):
-        import numpy as np
-
-        max_ppm = max(spc.ppm)
-        min_ppm = min(spc.ppm)
-
-        regions = []
-        index_mask = np.arange(spc.data.shape[1])
-
-        def locate_nearest(array, value):
-            idx = (np.abs(array - value)).argmin()
-            return idx
-
-        for region in config["selected_data_regions"]:
-            _, start_ppm, end_ppm = region
-
-            if start_ppm < min_ppm:
-                start_ppm = min_ppm
-
-            if end_ppm > max_ppm:
-                end_ppm = max_ppm
-
-            if start_ppm < end_ppm:
-                start_ppm, end_ppm = end_ppm, start_ppm
-
-            # Convert ppm to nearest index
-            start_idx = locate_nearest(spc.ppm, start_ppm)
-            end_idx = locate_nearest(spc.ppm, end_ppm)
-
-            if start_idx > end_idx:
-                start_idx, end_idx = end_idx, start_idx
-
-            index_mask = index_mask[
-                ~np.logical_and(index_mask > start_idx, index_mask < end_idx)
-            ]
-            regions.append((start_ppm, end_ppm))
-
-        spc.ppm = spc.ppm[index_mask]
-        spc.data = spc.data[:, index_mask]
-
-        return {"spc": spc, "regions": regions}
+    exclude = staticmethod(exclude)
 
     def add_region(self, name, x1, x2):
         canvas = self.parent().spectraViewer.spectraViewer
@@ -3,6 +3,7 @@ from ..ui import ConfigPanel, QFolderLineEdit
 from ..globals import settings
 from ..qt import *
 from .. import utils
+from ..processing.export_spectra import export
 
 class ExportSpectraConfig(ConfigPanel):
 
@@ -18,6 +19,7 @@ class ExportSpectra(ToolBase):
     is_auto_runnable = False
     is_auto_rerunnable = False
     is_disableable = False
+    is_cacheable = False
 
     def __init__(self, *args, **kwargs):
         super(ExportSpectra, self).__init__(*args, **kwargs)
@@ -51,20 +53,7 @@ class ExportSpectra(ToolBase):
             self.config.set('format', os.path.splitext(filename)[1])
             self.run( self.export )
 
-    @staticmethod
-    def export(spc, config, progress_callback):
-        import numpy as np
-
-        if config['format'] in ['.tsv', '.txt']:
-            delimiter = '\t'
-        else:
-            delimiter = ','
-
-        out = np.vstack([spc.ppm, spc.data])
-
-        np.savetxt(config.get('filename'), out, delimiter=delimiter)
-
-        return {'spc': spc}
+    export = staticmethod(export)
 
     def activate(self):
         # Auto-import to output; we don't do anything
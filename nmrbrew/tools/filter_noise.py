@@ -3,6 +3,7 @@ from ..ui import ConfigPanel
 from ..globals import settings
 from ..qt import *
 from .. import utils
+from ..processing.filter_noise import noise
 
 
 class FilterNoiseConfig(ConfigPanel):
@@ -53,30 +54,4 @@ class FilterNoise(ToolBase):
     def run_manual(self):
         self.run( self.noise )
 
-    @staticmethod
-    def noise(spc, config, progress_callback):
-        import numpy as np
-        import scipy as sp
-        import scipy.signal
-        import math
-
-        def estimate_noise(s):
-
-            h, w = s.shape
-
-            m = [[1, -2, 1],
-               [-2, 4, -2],
-               [1, -2, 1]]
-
-            sigma = np.sum(np.sum(np.absolute(sp.signal.convolve2d(s, m))))
-            sigma = sigma * math.sqrt(0.5 * math.pi) / (6 * (w-2) * (h-2))
-
-            return sigma
-
-        noise = estimate_noise(spc.data)
-
-        spc.data[ spc.data < noise ] = 0
-
-
-
-        return {'spc':spc}
+    noise = staticmethod(noise)
@@ -3,9 +3,22 @@ from ..ui import ConfigPanel, QFolderLineEdit
 from ..globals import settings
 from ..qt import *
 from .. import utils
+from ..processing.import_spectra import row_metadata, spectra_store, load_bruker, load_bruker_new
+from ..header_index import HeaderIndex
+
+import os
 
 class ImportSpectraConfig(ConfigPanel):
 
+    sources = {
+        'Raw FID': 'fid',
+        'Processed (pdata)': 'pdata',
+    }
+
+    precisions = {
+        'Double (64 bit)': 'double',
+        'Single (32 bit)': 'single',
+    }
 
     def __init__(self, parent, *args, **kwargs):
         super(ImportSpectraConfig, self).__init__(parent, *args, **kwargs)
@@ -19,6 +32,11 @@ class ImportSpectraConfig(ConfigPanel):
         gd.addWidget(pathfreg_le, 1, 1)
         self.config.add_handler('path_filter_regexp', pathfreg_le)
 
+        expfreg_le = QLineEdit()
+        gd.addWidget(QLabel('Experiment filter (regexp)'), 6, 0)
+        gd.addWidget(expfreg_le, 6, 1)
+        self.config.add_handler('exp_filter_regexp', expfreg_le)
+
         cb_sampleidfrom = QComboBox()
         cb_sampleidfrom.addItems(['Scan number', 'Experiment (regexp)', 'Path (regexp)'])
         gd.addWidget(QLabel('Sample ID from'), 2, 0)
@@ -45,6 +63,30 @@ class ImportSpectraConfig(ConfigPanel):
         self.addBottomSpacer(gd)
         self.layout.addWidget(gb)
 
+        gb = QGroupBox('Source')
+        gd = QGridLayout()
+
+        cb_source = QComboBox()
+        cb_source.addItems(self.sources.keys())
+        gd.addWidget(QLabel('Import from'), 1, 0)
+        gd.addWidget(cb_source, 1, 1)
+        self.config.add_handler('source', cb_source, self.sources)
+
+        sp_pdata = QSpinBox()
+        sp_pdata.setRange(1, 999)
+        gd.addWidget(QLabel('Processed data number'), 2, 0)
+        gd.addWidget(sp_pdata, 2, 1)
+        self.config.add_handler('pdata_number', sp_pdata)
+
+        cb_pdata_imag = QCheckBox()
+        gd.addWidget(QLabel('Include imaginary (1i)'), 3, 0)
+        gd.addWidget(cb_pdata_imag, 3, 1)
+        self.config.add_handler('pdata_imaginary', cb_pdata_imag)
+
+        gb.setLayout(gd)
+        self.addBottomSpacer(gd)
+        self.layout.addWidget(gb)
+
         gb = QGroupBox('Advanced')
         gd = QGridLayout()
 
@@ -69,6 +111,155 @@ class ImportSpectraConfig(ConfigPanel):
         gd.addWidget(sp_zf_to, 4, 1)
         self.config.add_handler('zero_fill_to', sp_zf_to)
 
+        cb_parallel = QCheckBox()
+        gd.addWidget(QLabel('Parallel import'), 5, 0)
+        gd.addWidget(cb_parallel, 5, 1)
+        self.config.add_handler('parallel_import', cb_parallel)
+
+        sp_processes = QSpinBox()
+        sp_processes.setRange(0, 256)
+        sp_processes.setSpecialValueText('Auto')
+        gd.addWidget(QLabel('Processes'), 6, 0)
+        gd.addWidget(sp_processes, 6, 1)
+        self.config.add_handler('import_processes', sp_processes)
+
+        cb_batch = QCheckBox()
+        gd.addWidget(QLabel('Batch transform'), 7, 0)
+        gd.addWidget(cb_batch, 7, 1)
+        self.config.add_handler('batch_transform', cb_batch)
+
+        sp_batch_size = QSpinBox()
+        sp_batch_size.setRange(1, 4096)
+        sp_batch_size.setSingleStep(32)
+        gd.addWidget(QLabel('Batch size'), 8, 0)
+        gd.addWidget(sp_batch_size, 8, 1)
+        self.config.add_handler('batch_size', sp_batch_size)
+
+        cb_cache = QCheckBox()
+        cb_cache.setToolTip('Keep processed spectra on disk (in the cache folder, up to the cache size) to speed up re-importing')
+        gd.addWidget(QLabel('Cache processed spectra'), 9, 0)
+        gd.addWidget(cb_cache, 9, 1)
+        self.config.add_handler('use_cache', cb_cache)
+
+        sp_cache_size = QSpinBox()
+        sp_cache_size.setRange(0, 1024 * 1024)
+        sp_cache_size.setSingleStep(512)
+        sp_cache_size.setSuffix('MB')
+        gd.addWidget(QLabel('Cache size'), 10, 0)
+        gd.addWidget(sp_cache_size, 10, 1)
+        self.config.add_handler('cache_size', sp_cache_size)
+
+        cb_resample = QCheckBox()
+        gd.addWidget(QLabel('Resample to common axis'), 11, 0)
+        gd.addWidget(cb_resample, 11, 1)
+        self.config.add_handler('resample_to_common_axis', cb_resample)
+
+        cb_index = QCheckBox()
+        cb_index.setToolTip('Keep an index of experiment headers (%s) in the data folder to speed up rescanning' % HeaderIndex.filename)
+        gd.addWidget(QLabel('Index experiment headers'), 12, 0)
+        gd.addWidget(cb_index, 12, 1)
+        self.config.add_handler('use_header_index', cb_index)
+
+        cb_read_ahead = QCheckBox()
+        gd.addWidget(QLabel('Read ahead'), 13, 0)
+        gd.addWidget(cb_read_ahead, 13, 1)
+        self.config.add_handler('read_ahead', cb_read_ahead)
+
+        sp_read_ahead_threads = QSpinBox()
+        sp_read_ahead_threads.setRange(1, 64)
+        gd.addWidget(QLabel('Read ahead threads'), 14, 0)
+        gd.addWidget(sp_read_ahead_threads, 14, 1)
+        self.config.add_handler('read_ahead_threads', sp_read_ahead_threads)
+
+        cb_precision = QComboBox()
+        cb_precision.addItems(self.precisions.keys())
+        gd.addWidget(QLabel('Precision'), 15, 0)
+        gd.addWidget(cb_precision, 15, 1)
+        self.config.add_handler('precision', cb_precision, self.precisions)
+
+        cb_out_of_core = QCheckBox()
+        gd.addWidget(QLabel('Store spectra on disk'), 16, 0)
+        gd.addWidget(cb_out_of_core, 16, 1)
+        self.config.add_handler('out_of_core', cb_out_of_core)
+
+        gb.setLayout(gd)
+
+        self.addBottomSpacer(gd)
+        self.layout.addWidget(gb)
+
+        gb = QGroupBox('Quality control')
+        gd = QGridLayout()
+
+        cb_qc = QCheckBox()
+        gd.addWidget(QLabel('Calculate SNR, linewidth, truncation'), 1, 0)
+        gd.addWidget(cb_qc, 1, 1)
+        self.config.add_handler('qc', cb_qc)
+
+        cb_qc_exclude = QCheckBox()
+        gd.addWidget(QLabel('Exclude failed spectra'), 2, 0)
+        gd.addWidget(cb_qc_exclude, 2, 1)
+        self.config.add_handler('qc_exclude', cb_qc_exclude)
+
+        sp_min_snr = QDoubleSpinBox()
+        sp_min_snr.setDecimals(1)
+        sp_min_snr.setRange(0, 100000)
+        gd.addWidget(QLabel('Minimum SNR'), 3, 0)
+        gd.addWidget(sp_min_snr, 3, 1)
+        self.config.add_handler('qc_min_snr', sp_min_snr)
+
+        sp_max_lw = QDoubleSpinBox()
+        sp_max_lw.setDecimals(2)
+        sp_max_lw.setRange(0.01, 100)
+        sp_max_lw.setSuffix('Hz')
+        sp_max_lw.setSingleStep(0.1)
+        gd.addWidget(QLabel('Maximum TMSP linewidth'), 4, 0)
+        gd.addWidget(sp_max_lw, 4, 1)
+        self.config.add_handler('qc_max_linewidth', sp_max_lw)
+
+        sp_max_trunc = QDoubleSpinBox()
+        sp_max_trunc.setDecimals(3)
+        sp_max_trunc.setRange(0, 1)
+        sp_max_trunc.setSingleStep(0.01)
+        gd.addWidget(QLabel('Maximum FID truncation'), 5, 0)
+        gd.addWidget(sp_max_trunc, 5, 1)
+        self.config.add_handler('qc_max_truncation', sp_max_trunc)
+
+        sp_noise_start = QDoubleSpinBox()
+        sp_noise_start.setDecimals(2)
+        sp_noise_start.setRange(-50, 50)
+        sp_noise_start.setSuffix('ppm')
+        gd.addWidget(QLabel('Noise region from'), 6, 0)
+        gd.addWidget(sp_noise_start, 6, 1)
+        self.config.add_handler('qc_noise_start', sp_noise_start)
+
+        sp_noise_end = QDoubleSpinBox()
+        sp_noise_end.setDecimals(2)
+        sp_noise_end.setRange(-50, 50)
+        sp_noise_end.setSuffix('ppm')
+        gd.addWidget(QLabel('Noise region to'), 7, 0)
+        gd.addWidget(sp_noise_end, 7, 1)
+        self.config.add_handler('qc_noise_end', sp_noise_end)
+
+        gb.setLayout(gd)
+
+        self.addBottomSpacer(gd)
+        self.layout.addWidget(gb)
+
+        gb = QGroupBox('Watch folder')
+        gd = QGridLayout()
+
+        cb_watch = QCheckBox()
+        gd.addWidget(QLabel('Import new experiments'), 1, 0)
+        gd.addWidget(cb_watch, 1, 1)
+        self.config.add_handler('watch_folder', cb_watch)
+
+        sp_watch_interval = QSpinBox()
+        sp_watch_interval.setRange(5, 3600)
+        sp_watch_interval.setSuffix('s')
+        gd.addWidget(QLabel('Check every'), 2, 0)
+        gd.addWidget(sp_watch_interval, 2, 1)
+        self.config.add_handler('watch_interval', sp_watch_interval)
+
         gb.setLayout(gd)
 
         self.addBottomSpacer(gd)
@@ -89,23 +280,56 @@ class ImportSpectra(ToolBase):
     is_auto_runnable = False
     is_auto_rerunnable = False
     is_disableable = False
+    is_cacheable = False
 
     def __init__(self, *args, **kwargs):
         super(ImportSpectra, self).__init__(*args, **kwargs)
 
         self.config.set_defaults({
             'filename': '',
+            'source': 'fid',  # or 'pdata'
+            'pdata_number': 1,
+            'pdata_imaginary': False,
+
             'remove_digital_filter': True,
             'reverse_spectra': True,
             'zero_fill': True,
             'zero_fill_to': 32768,
+            'precision': 'double',  # or 'single'; kept by every tool downstream
+
+            'parallel_import': False,
+            'import_processes': 0,  # 0 = one per CPU
+            'batch_transform': True,
+            'batch_size': 128,
+
+            'use_cache': False,  # Writes to the cache folder
+            'cache_dir': '',  # Default to ~/.nmrbrew/cache
+            'cache_size': 2048,  # MB
+
+            'resample_to_common_axis': False,
+            'use_header_index': False,  # Writes an index file into the data folder
+            'read_ahead': False,
+            'read_ahead_threads': 4,
+            'out_of_core': False,  # Fill a memory-mapped file rather than an in-memory array
 
             'path_filter_regexp': '',
+            'exp_filter_regexp': '',
             'sample_id_from': 'Scan number',  # Experiment name, Path regexp,
             'sample_id_regexp': '',
 
             'class_from': 'None',  # Experiment name, Path regexp,
             'class_regexp': '',
+
+            'qc': False,
+            'qc_exclude': False,
+            'qc_min_snr': 10.0,
+            'qc_max_linewidth': 2.0,  # Hz
+            'qc_max_truncation': 0.05,  # FID tail / maximum
+            'qc_noise_start': 9.5,  # ppm
+            'qc_noise_end': 10.5,
+
+            'watch_folder': False,
+            'watch_interval': 30,  # seconds
         })
 
         self.addConfigPanel(ImportSpectraConfig)
@@ -114,230 +338,77 @@ class ImportSpectra(ToolBase):
         load_bruker.setToolTip('Load Bruker format NMR spectra')
         load_bruker.pressed.connect(self.onImportBruker)
 
-        self.addButtonBar( [load_bruker] )
-
-    def result(self,*args, **kwargs):
-        self.parent().setTitle(data_filename=self.config.get('filename'))
-        super(ImportSpectra, self).result(*args, **kwargs)
-
-    def onImportBruker(self):
-        """ Open a data file"""
-        folder = QFileDialog.getExistingDirectory(self.parent(), 'Open parent folder for your Bruker NMR experiments')
-        if folder:
-            self.config.set('filename', folder)
-            self.run( self.load_bruker )
-
-    @staticmethod
-    def load_bruker(spc, config, progress_callback):
-        import nmrglue as ng
-        import numpy as np
-        from ..spectra import Spectra
-
+        load_archive = QPushButton(QIcon(os.path.join(utils.scriptdir, 'icons', 'bruker.png')), 'Import archive')
+        load_archive.setToolTip('Load Bruker format NMR spectra from a zip or tar archive, without extracting it')
+        load_archive.pressed.connect(self.onImportArchive)
 
-        def load_bruker_fid(fn, config={}):
+        load_new = QPushButton(QIcon(os.path.join(utils.scriptdir, 'icons', 'arrow-turn.png')), 'Import new')
+        load_new.setToolTip('Add experiments not yet loaded from the current folder')
+        load_new.pressed.connect(self.onImportNew)
 
-            try:
-                print("Reading %s" % fn)
-                # read in the bruker formatted data
-                dic, data = ng.bruker.read(fn) #, read_prog=False)
-            except Exception as e:
-                print(e)
-                return None, None
-            else:
+        self.addButtonBar( [load_bruker, load_archive, load_new, self.cancelButton()] )
 
-                # remove the digital filter
-                if config.get('remove_digital_filter'):
-                    data = ng.bruker.remove_digital_filter(dic, data)
+        # Poll the import folder for new experiments while watching is enabled
+        self._watch_timer_ = QTimer()
+        self._watch_timer_.timeout.connect(self.onWatchTimeout)
+        self.config.updated.connect(self.update_watch_timer)
 
-                # process the spectrum
-                original_size = data.shape[-1]
+    def result(self, result, *args, **kwargs):
+        if result.get('new') == 0:
+            # Incremental import found nothing new; keep the current spectra, noting any
+            # experiments that failed to load so they aren't read again on the next poll
+            if 'metadata' in result and self.data.get('spc') is not None:
+                self.data['spc'].metadata = result['metadata']
+            self.progress.emit(1)
+            self.status.emit('complete')
+            return
 
-                print(config.get('zero_fill_to'), type(config.get('zero_fill_to')))
-
-                if config.get('zero_fill'):
-                    data = ng.proc_base.zf_size(data, config.get('zero_fill_to'))    # zero fill to 32768 points
-
-                #data = ng.process.proc_bl.sol_boxcar(data, w=16, mode='same')  # Solvent removal
-
-                data = ng.proc_base.fft(data)               # Fourier transform
-
-                # data = ng.proc_base.di(data)                # discard the imaginaries
-
-                if config.get('reverse_spectra'):
-                    data = ng.proc_base.rev(data)               # reverse the data
-
-                #data = data / 10000000.
-                #dic['PATHOMX_PHASE_CORRECT'] = pc
-                #dic['PATHOMX_ORIGINAL_SIZE'] = original_size
-                return dic, data
-
-
-
-        if config['path_filter_regexp']:
-            path_filter_regexp = re.compile(config['path_filter_regexp'])
-        else:
-            path_filter_regexp = None
-
-        if config['sample_id_regexp']:
-            sample_id_regexp = re.compile(config['sample_id_regexp'])
-        else:
-            sample_id_regexp = None
-
-        if config['class_regexp']:
-            class_regexp = re.compile(config['class_regexp'])
+        self.parent().setTitle(data_filename=self.config.get('filename'))
+        super(ImportSpectra, self).result(result, *args, **kwargs)
+
+    def get_previous_stage(self):
+        # Incremental imports only append to the spectra already loaded, which can be done
+        # as held; no need to page them back in first (see ToolBase.process)
+        return None
+
+    def get_previous_spc(self):
+        # Import has no upstream tool; incremental imports extend the spectra already loaded
+        return self.data.get('spc')
+
+    def update_watch_timer(self):
+        if self.config.get('watch_folder') and self.config.get('filename'):
+            interval = self.config.get('watch_interval') * 1000
+            if self._watch_timer_.interval() != interval:
+                self._watch_timer_.setInterval(interval)
+            if not self._watch_timer_.isActive():
+                self._watch_timer_.start()
         else:
-            class_regexp = None
-
-        # We should have a folder name; so find all files named fid underneath it (together with path)
-        # Extract the path, and the parent folder name (for sample label)
-        nmr_data = []
-        nmr_dic = []
-        sample_labels = []
-        sample_classes = []
-
-        _ppm_real_scan_folder = False
-        fids = []
-        print("Searching for Bruker files in: %s" % config['filename'])
-        for r, d, files in os.walk(config['filename']):  # filename contains a folder for Bruker data
-            if 'fid' in files:
-                scan = os.path.basename(r)
-                print('Found Bruker:', r, scan)
-                if scan == '99999' or scan == '9999':  # Dummy Bruker thing
-                    continue
-
-                if path_filter_regexp:
-                    m = path_filter_regexp.search(r)
-                    if not m:
-                        continue
-
-                # The following is a hack; need some interface for choosing between processed/raw data
-                # and for various formats of NMR data input- but simple
-                fids.append(r)
-
-        total_fids = len(fids)
-        pc_init = None
-        pc_history = []
-        for n, fid in enumerate(fids):
-            print("Loading %d/%d" % (n+1, total_fids))
-            dic, data = load_bruker_fid(fid, config)
-
-            if data is not None:
-
-                # Generate sample id for this spectra
-                # ['Scan number', 'Experiment name', 'Experiment (regexp)', 'Path (regexp)']
-                if config['sample_id_from'] == 'Scan number':
-                    label = os.path.basename(fid)
-
-                elif config['sample_id_from'] == 'Sequential':
-                    label = str(n + 1)
-
-                elif config['sample_id_from'] == 'Experiment (regexp)':
-                    if sample_id_regexp is None:
-                        label = dic['acqus']['EXP']
-
-                    else:
-                        m = sample_id_regexp.search(dic['acqus']['EXP'])
-                        if m:
-                            label = m.group(0) if m.lastindex is None else m.group(m.lastindex)
-
-                        else:  # Fallback
-                            label = dic['acqus']['EXP']
-
-                elif config['sample_id_from'] == 'Path (regexp)':
-                    if sample_id_regexp is None:
-                        label = os.path.basename(fid)
-
-                    else:
-                        m = sample_id_regexp.search(fid)
-                        if m:
-                            label = m.group(0) if m.lastindex is None else m.group(m.lastindex)
-
-                        else:  # Fallback
-                            label = fid
-
-                else:
-                    label = os.path.basename(fid)
-
-
-                # Generate sample id for this spectra
-                # ['Scan number', 'Experiment name', 'Experiment (regexp)', 'Path (regexp)']
-                if config['class_from'] == 'None':
-                    classn = ''
-
-                elif config['class_from'] == 'Experiment (regexp)':
-                    if class_regexp is None:
-                        classn = dic['acqus']['EXP']
-
-                    else:
-                        m = class_regexp.search(dic['acqus']['EXP'])
-                        if m:
-                            classn = m.group(0) if m.lastindex is None else m.group(m.lastindex)
+            self._watch_timer_.stop()
 
-                        else:  # Fallback
-                            classn = dic['acqus']['EXP']
+    def onWatchTimeout(self):
+        if not self._worker_thread_lock_:
+            self.run( self.load_bruker_new )
 
-                elif config['class_from'] == 'Path (regexp)':
-                    if class_regexp is None:
-                        classn = os.path.basename(fid)
+    def onImportNew(self):
+        if self.config.get('filename'):
+            self.run( self.load_bruker_new )
 
-                    else:
-                        m = class_regexp.search(fid)
-                        if m:
-                            classn = m.group(0) if m.lastindex is None else m.group(m.lastindex)
-
-                        else:  # Fallback
-                            classn = fid
-
-                else:
-                    classn = ''
-                #if 'AUTOPOS' in dic['acqus']:
-                #    label = label + " %s" % dic['acqus']['AUTOPOS']
-
-                sample_labels.append(label)
-                sample_classes.append(classn)
-
-                nmr_data.append(data)
-                nmr_dic.append(dic)
-                _ppm_real_scan_folder = fid
-
-            progress_callback(float(n) / total_fids)  # Emit progress update
-
-        if _ppm_real_scan_folder:
-            # Nothing worked
-
-            # Generate the ppm for these spectra
-            # read in the bruker formatted data// use latest
-            dic, data_unp = ng.bruker.read(_ppm_real_scan_folder) #
-            # Calculate ppms
-            # SW total ppm 11.9877
-            # SW_h total Hz 7194.244
-            # SF01 Hz of 0ppm 600
-            # TD number of data points 32768
-
-            # Offset (not provided but we have:
-            # O1 Hz offset (shift) of spectra 2822.5 centre!
-            # BF ? 600Mhz
-            # O1/BF = centre of the spectra
-            # OFFSET = (SW/2) - (O1/BF)
-
-            # What we need to calculate is start, end, increment
-            offset = (float(dic['acqus']['SW']) / 2) - (float(dic['acqus']['O1']) / float(dic['acqus']['BF1']))
-            start = float(dic['acqus']['SW']) - offset
-            end = -offset
-            step = float(dic['acqus']['SW']) / 32768
-
-            nmr_ppms = np.arange(start, end, -step)[:32768]
-
-
-            spectra = Spectra(data=np.array(nmr_data), ppm=nmr_ppms, labels=sample_labels, classes=sample_classes)
-
-            spectra.metadata = {
-                'experiment_name': '%s (%s)' % (dic['acqus']['EXP'], config['filename']),
-
-            }
-
-            return {'spc': spectra }
+    def onImportBruker(self):
+        """ Open a data file"""
+        folder = QFileDialog.getExistingDirectory(self.parent(), 'Open parent folder for your Bruker NMR experiments')
+        if folder:
+            self.config.set('filename', folder)
+            self.run( self.load_bruker )
 
+    def onImportArchive(self):
+        """ Open an archive of experiments"""
+        from ..archive import ARCHIVE_FILTER
+        filename, _ = QFileDialog.getOpenFileName(self.parent(), 'Open archive of your Bruker NMR experiments', '', ARCHIVE_FILTER + ";;All files (*.*)")
+        if filename:
+            self.config.set('filename', filename)
+            self.run( self.load_bruker )
 
-        else:
-            raise Exception("No valid data found")
+    row_metadata = staticmethod(row_metadata)
+    spectra_store = staticmethod(spectra_store)
+    load_bruker = staticmethod(load_bruker)
+    load_bruker_new = staticmethod(load_bruker_new)
@@ -2,6 +2,7 @@ from .base import ToolBase
 from ..ui import ConfigPanel, QFolderLineEdit, QNoneDoubleSpinBox
 from ..globals import settings, config, SPECTRUM_COLOR, OUTLIER_COLOR, CLASS_COLORS
 from ..qt import *
+from ..processing.pca import pca
 
 import numpy as np
 
@@ -43,21 +44,7 @@ class PCA(ToolBase):
         super(PCA, self).activate()
         self.parent().viewStack.setCurrentWidget(self.parent().pcaViewer)
 
-    @staticmethod
-    def pca(spc, config, progress_callback):
-        from sklearn.decomposition import PCA
-
-        number_of_components = 2 # No way to view > 2
-
-        pca = PCA(n_components=number_of_components)
-        pca.fit(spc.data)
-
-        pca = {
-            'scores': pca.transform(spc.data),
-            'weights': pca.components_
-        }
-
-        return {'spc': spc, 'pca': pca}
+    pca = staticmethod(pca)
 
     def plot(self, autofit=True, **kwargs):
         if 'spc' in self.data and 'pca' in self.data:
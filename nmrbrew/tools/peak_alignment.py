@@ -3,6 +3,7 @@ from ..ui import ConfigPanel, QFolderLineEdit
 from ..globals import settings
 from ..qt import *
 from .. import utils
+from ..processing.peak_alignment import shift
 
 class PeakAlignmentConfig(ConfigPanel):
 
@@ -84,6 +85,7 @@ class PeakAlignment(ToolBase):
     name = "Align to reference peak"
     description = "Align by peak (e.g. TMSP)"
     icon = 'peak_alignment.png'
+    is_row_parallel = True
 
 
     def __init__(self, *args, **kwargs):
@@ -105,63 +107,4 @@ class PeakAlignment(ToolBase):
         self.run( self.shift )
 
 
-    @staticmethod
-    def shift(spc, config, progress_callback):
-
-        import nmrglue as ng
-        import numpy as np
-
-        # Get the target region from the spectra (will be using this for all calculations;
-        # then applying the result to the original data)
-
-        # Remove imaginaries
-        spc.data = np.real(spc.data)
-
-        scale = spc.ppm
-
-        target_ppm = config.get('peak_target_ppm')
-        tolerance_ppm = config.get('peak_target_ppm_tolerance')
-        start_ppm = target_ppm - tolerance_ppm
-        end_ppm = target_ppm + tolerance_ppm
-
-        start = min(list(range(len(scale))), key=lambda i: abs(scale[i]-start_ppm))
-        end = min(list(range(len(scale))), key=lambda i: abs(scale[i]-end_ppm))
-
-        # Shift first; then scale
-        d = 1 if end>start else -1
-        data = spc.data[:,start:end:d]
-        region_scales = scale[start:end:d]
-
-        pcentre = min(list(range(len(region_scales))), key=lambda i: abs(region_scales[i]-target_ppm))  # Base centre point to shift all spectra to
-
-
-        reference_peaks = []
-        for sdata in data:
-            baseline = sdata.max() * .9 # 90% baseline of maximum peak within target region
-            locations, scales, amps = ng.analysis.peakpick.pick(sdata, pthres=baseline, algorithm='connected', est_params = True, cluster=False, table=False)
-            if len(locations) > 0:
-                reference_peaks.append({
-                    'location':locations[0][0], #FIXME: better behaviour when >1 peak
-                    'scale':scales[0][0],
-                    'amplitude':amps[0],
-                })
-            else:
-                reference_peaks.append(None)
-
-        # Take a np array for speed on shifting
-        shift_array = spc.data
-        # Now shift the original spectra to fi
-        for n,refp in enumerate(reference_peaks):
-            if refp:
-                # Shift the spectra
-                shift = (pcentre-refp['location']) * d
-                # FIXME: This is painfully slow
-                if shift > 0:
-                    shift_array[n, shift:-1] = shift_array[n, 0:-(shift+1)]
-                elif shift < 0:
-                    shift_array[n, 0:shift-1] = shift_array[n, abs(shift):-1]
-
-        spc.data = shift_array
-
-
-        return {'spc': spc}
+    shift = staticmethod(shift)
@@ -1,6 +1,7 @@
 from ..qt import *
 from ..ui import ConfigPanel
 from .base import ToolBase
+from ..processing.peak_scaling import scale
 
 
 class PeakScalingConfig(ConfigPanel):
@@ -69,6 +70,7 @@ class PeakScaling(ToolBase):
     name = "Scale to reference peak"
     description = "Scale by peak (e.g. TMSP)"
     icon = "peak_scaling.png"
+    is_row_parallel = True
 
     def __init__(self, *args, **kwargs):
         super(PeakScaling, self).__init__(*args, **kwargs)
@@ -89,73 +91,4 @@ class PeakScaling(ToolBase):
     def run_manual(self):
         self.run(self.scale)
 
-    @staticmethod
-    def scale(spc, config, progress_callback):
-        import nmrglue as ng
-        import numpy as np
-
-        # Get the target region from the spectra (will be using this for all calculations;
-        # then applying the result to the original data)
-
-        # Remove imaginaries
-        spc.data = np.real(spc.data)
-
-        scale = spc.ppm
-
-        target_ppm = config.get("peak_target_ppm")
-        tolerance_ppm = config.get("peak_target_ppm_tolerance")
-        start_ppm = target_ppm - tolerance_ppm
-        end_ppm = target_ppm + tolerance_ppm
-
-        start = min(list(range(len(scale))), key=lambda i: abs(scale[i] - start_ppm))
-        end = min(list(range(len(scale))), key=lambda i: abs(scale[i] - end_ppm))
-
-        # Shift first; then scale
-        d = 1 if end > start else -1
-        data = spc.data[:, start:end:d]
-        region_scales = scale[start:end:d]
-
-        pcentre = min(
-            list(range(len(region_scales))),
-            key=lambda i: abs(region_scales[i] - target_ppm),
-        )  # Base centre point to shift all spectra to
-
-        reference_peaks = []
-        for sdata in data:
-            baseline = (
-                sdata.max() * 0.9
-            )  # 90% baseline of maximum peak within target region
-            locations, scales, amps = ng.analysis.peakpick.pick(
-                sdata,
-                pthres=baseline,
-                algorithm="connected",
-                est_params=True,
-                cluster=False,
-                table=False,
-            )
-            if len(locations) > 0:
-                reference_peaks.append(
-                    {
-                        "location": locations[0][
-                            0
-                        ],  # FIXME: better behaviour when >1 peak
-                        "scale": scales[0][0],
-                        "amplitude": amps[0],
-                    }
-                )
-            else:
-                reference_peaks.append(None)
-
-        # Get mean reference peak size
-        reference_peak_mean = np.mean([r["scale"] for r in reference_peaks if r])
-        print("Reference peak mean %s" % reference_peak_mean)
-
-        # Now scale; using the same peak regions & information (so we don't have to worry about something
-        # being shifted out of the target region in the first step)
-        for n, refp in enumerate(reference_peaks):
-            if refp:
-                # Scale the spectra
-                amplitude = reference_peak_mean / refp["amplitude"]
-                spc.data[n] *= amplitude
-
-        return {"spc": spc}
+    scale = staticmethod(scale)
@@ -3,6 +3,7 @@ from ..ui import ConfigPanel
 from ..globals import settings
 from ..qt import *
 from .. import utils
+from ..processing.remove_solvent import solvent
 
 
 class RemoveSolventConfig(ConfigPanel):
@@ -54,29 +55,5 @@ class RemoveSolvent(ToolBase):
         self.run( self.solvent )
 
 
-    @staticmethod
-    def solvent(spc, config, progress_callback):
-        import numpy as np
-        import scipy as sp
-        import nmrglue as ng
-
-        fn = {
-            'boxcar': ng.process.proc_bl.sol_boxcar,
-            'sine': ng.process.proc_bl.sol_sine,
-            'sine2': ng.process.proc_bl.sol_sine2,
-            'gaussian': ng.process.proc_bl.sol_gaussian,
-        }[config['algorithm']]
-
-        def locate_nearest(array, value):
-            idx = (np.abs(array-value)).argmin()
-            return idx
-
-        # Locate the water region by ppm 4.75..4.65
-        start, end = locate_nearest(spc.ppm, 4.75), locate_nearest(spc.ppm, 4.65)
-        print("Removing water from %d:%d" % (start, end ))
-        spc.data[:,start:end] = fn(spc.data[:,start:end], w=16, mode='same')
-
-        print(spc.data[start:end, :])
-
-        return {'spc': spc}
+    solvent = staticmethod(solvent)
 
@@ -3,6 +3,7 @@ from ..ui import ConfigPanel
 from ..globals import settings
 from ..qt import *
 from .. import utils
+from ..processing.variance_stabilisation import variance
 
 
 class VarianceStabilisationConfig(ConfigPanel):
@@ -146,26 +147,5 @@ class VarianceStabilisation(ToolBase):
         self.run(self.variance)
 
 
-    @staticmethod
-    def variance(spc, config, progress_callback):
-        import numpy as np
-        import scipy as sp
-
-        algorithm = config.get('algorithm')
-        if algorithm == 'glog':
-            lam = 10**-13
-            spc.data = np.log(spc.data + np.sqrt(spc.data** + lam))
-
-        elif algorithm == 'autoscale':
-            spc.data = spc.data / np.std(spc.data)
-
-        elif algorithm == 'pareto':
-            spc.data = spc.data / np.sqrt( np.std(spc.data) )
-
-        # Clean up numeric extremities in data
-        spc.data[np.isnan(spc.data)] = 0
-        spc.data[np.isinf(spc.data)] = 0
-        spc.data[np.isneginf(spc.data)] = 0
-
-        return {'spc': spc}
+    variance = staticmethod(variance)
 
@@ -1154,6 +1154,12 @@ class Preferences(GenericDialog):
 
     """
 
+    executors = {
+        "In turn": "serial",
+        "In parallel (threads)": "thread",
+        "In parallel (processes)": "process",
+    }
+
     def __init__(self, parent, config=None, *args, **kwargs):
         super(Preferences, self).__init__(parent, *args, **kwargs)
 
@@ -1163,6 +1169,78 @@ class Preferences(GenericDialog):
             self.config.hooks.update(custom_pyqtconfig_hooks.items())
             self.config.set_defaults(config)
 
+        self.setWindowTitle(tr("Preferences"))
+
+        gb = QGroupBox(tr("Memory"))
+        grid = QGridLayout()
+
+        budget = QSpinBox()
+        budget.setRange(0, 1024 * 1024)
+        budget.setSingleStep(256)
+        budget.setSuffix(" MB")
+        budget.setSpecialValueText(tr("Unlimited"))
+        grid.addWidget(QLabel(tr("Memory budget")), 0, 0)
+        grid.addWidget(budget, 0, 1)
+        self.config.add_handler("memory/budget", budget)
+
+        scratch_dir = QFolderLineEdit(description=tr("Select scratch folder"))
+        grid.addWidget(QLabel(tr("Scratch folder")), 1, 0)
+        grid.addWidget(scratch_dir, 1, 1)
+        self.config.add_handler("memory/scratch_dir", scratch_dir)
+
+        hint = QLabel(
+            tr(
+                "Over budget, the least recently viewed tool outputs are moved to the scratch folder "
+                "(default: system temporary folder) and loaded back when needed."
+            )
+        )
+        hint.setWordWrap(True)
+        grid.addWidget(hint, 2, 0, 1, 2)
+
+        result_cache = QSpinBox()
+        result_cache.setRange(0, 1024 * 1024)
+        result_cache.setSingleStep(128)
+        result_cache.setSuffix(" MB")
+        result_cache.setSpecialValueText(tr("Off"))
+        result_cache.setToolTip(
+            tr("Earlier results are reused when a tool is re-run on unchanged input and settings")
+        )
+        grid.addWidget(QLabel(tr("Result cache")), 3, 0)
+        grid.addWidget(result_cache, 3, 1)
+        self.config.add_handler("memory/result_cache", result_cache)
+
+        gb.setLayout(grid)
+        self.layout.addWidget(gb)
+
+        gb = QGroupBox(tr("Processing"))
+        grid = QGridLayout()
+
+        executor = QComboBox()
+        executor.addItems(self.executors.keys())
+        executor.setToolTip(
+            tr("How tools that work spectrum by spectrum (phase, baseline, alignment, scaling, binning) are run")
+        )
+        grid.addWidget(QLabel(tr("Run per-spectrum tools")), 0, 0)
+        grid.addWidget(executor, 0, 1)
+        self.config.add_handler("processing/executor", executor, self.executors)
+
+        workers = QSpinBox()
+        workers.setRange(0, 256)
+        workers.setSpecialValueText(tr("One per CPU"))
+        grid.addWidget(QLabel(tr("Workers")), 1, 0)
+        grid.addWidget(workers, 1, 1)
+        self.config.add_handler("processing/workers", workers)
+
+        shared_memory = QCheckBox(tr("Keep spectra in shared memory"))
+        shared_memory.setToolTip(
+            tr("Tool outputs are held where worker processes can use them directly, rather than be sent a copy")
+        )
+        grid.addWidget(shared_memory, 2, 0, 1, 2)
+        self.config.add_handler("processing/shared_memory", shared_memory)
+
+        gb.setLayout(grid)
+        self.layout.addWidget(gb)
+
         self.dialogFinalise()
 
 
@@ -37,6 +37,9 @@ setup(
     entry_points={
         'gui_scripts': [
             'NMRBrew = nmrbrew.NMRBrew:main',
+        ],
+        'console_scripts': [
+            'nmrbrew-batch = nmrbrew.batch:main',
         ]
     },
 
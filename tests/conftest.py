@@ -0,0 +1,85 @@
+import os
+import sys
+
+import numpy as np
+import nmrglue as ng
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+
+def write_experiment(folder, n, td=4096, sw=12.0, o1=2820.0, phase=0.0):
+    '''
+    Write a synthetic Bruker experiment (two decaying signals) to folder/exp/<n * 10>.
+    '''
+    path = os.path.join(folder, 'exp', '%d' % (n * 10))
+    os.makedirs(path)
+
+    t = np.arange(td // 2)
+    fid = (
+        np.exp(2j * np.pi * 0.1 * t) * np.exp(-t / 300.) * 1e6 * (1 + n * 0.1) +
+        np.exp(2j * np.pi * 0.3 * t) * np.exp(-t / 200.) * 3e5
+    ) * np.exp(1j * np.deg2rad(phase))
+
+    acqus = {
+        'TD': td, 'SW': sw, 'O1': o1, 'BF1': 600.13, 'SFO1': 600.13, 'SW_h': sw * 600.13,
+        'DECIM': 1680, 'DSPFVS': 20, 'GRPDLY': 76.0, 'BYTORDA': 0, 'DTYPA': 0, 'AQ_mod': 3,
+        'EXP': 'sample_%d_cls%d' % (n, n % 2),
+    }
+    dic = ng.bruker.create_dic(ng.bruker.guess_udic({'acqus': acqus}, fid))
+    dic['acqus'].update(acqus)
+    ng.bruker.write(path, dic, np.round(fid.real) + 1j * np.round(fid.imag), overwrite=True)
+    return path
+
+
+@pytest.fixture
+def bruker_folder(tmp_path):
+    folder = str(tmp_path / 'data')
+    for n in range(1, 5):
+        write_experiment(folder, n)
+    return folder
+
+
+@pytest.fixture
+def import_config(bruker_folder, tmp_path):
+    '''
+    ImportSpectra config for bruker_folder, with nothing written outside tmp_path.
+    '''
+    return {
+        'filename': bruker_folder,
+        'source': 'fid',
+        'pdata_number': 1,
+        'pdata_imaginary': False,
+        'remove_digital_filter': True,
+        'reverse_spectra': True,
+        'zero_fill': True,
+        'zero_fill_to': 8192,
+        'precision': 'double',
+        'parallel_import': False,
+        'import_processes': 0,
+        'batch_transform': True,
+        'batch_size': 128,
+        'use_cache': False,
+        'cache_dir': str(tmp_path / 'cache'),
+        'cache_size': 64,
+        'resample_to_common_axis': False,
+        'use_header_index': False,
+        'read_ahead': False,
+        'read_ahead_threads': 2,
+        'out_of_core': False,
+        'path_filter_regexp': '',
+        'exp_filter_regexp': '',
+        'sample_id_from': 'Scan number',
+        'sample_id_regexp': '',
+        'class_from': 'None',
+        'class_regexp': '',
+        'qc': False,
+        'qc_exclude': False,
+        'qc_min_snr': 10.0,
+        'qc_max_linewidth': 2.0,
+        'qc_max_truncation': 0.05,
+        'qc_noise_start': 9.5,
+        'qc_noise_end': 10.5,
+        'watch_folder': False,
+        'watch_interval': 30,
+    }
@@ -0,0 +1,75 @@
+import tarfile
+import tempfile
+import threading
+
+import numpy as np
+import pytest
+from multiprocessing.pool import ThreadPool
+
+from nmrbrew.archive import BrukerArchive
+from nmrbrew.bruker import bounded_imap
+from nmrbrew.processing.import_spectra import load_bruker
+
+
+def progress(p):
+    pass
+
+
+@pytest.fixture
+def bruker_tar(bruker_folder, tmp_path):
+    path = str(tmp_path / 'data.tar.gz')
+    with tarfile.open(path, 'w:gz') as tf:
+        tf.add(bruker_folder, arcname='data')
+    return path
+
+
+def test_bounded_imap_window():
+    lock = threading.Lock()
+    state = {'taken': 0, 'returned': 0, 'max_ahead': 0}
+
+    def items():
+        for n in range(50):
+            with lock:
+                state['taken'] += 1
+                state['max_ahead'] = max(state['max_ahead'], state['taken'] - state['returned'])
+            yield n
+
+    pool = ThreadPool(2)
+    try:
+        results = []
+        for r in bounded_imap(pool, lambda n: n * 2, items(), 4):
+            with lock:
+                state['returned'] += 1
+            results.append(r)
+    finally:
+        pool.terminate()
+
+    assert results == [n * 2 for n in range(50)]
+    assert state['max_ahead'] <= 4
+
+
+@pytest.mark.parametrize('parallel', [False, True])
+def test_tar_import_streams_archive(bruker_tar, import_config, monkeypatch, parallel):
+    expected = load_bruker(None, import_config, progress)['spc']
+
+    passes = []
+    members = BrukerArchive.members
+
+    def counted(self):
+        passes.append(self.path)
+        return members(self)
+
+    monkeypatch.setattr(BrukerArchive, 'members', counted)
+
+    def spool(*args, **kwargs):
+        raise AssertionError("Archive contents written to a temporary file")
+
+    monkeypatch.setattr(tempfile, 'TemporaryFile', spool)
+    monkeypatch.setattr(tempfile, 'NamedTemporaryFile', spool)
+
+    config = dict(import_config, filename=bruker_tar, parallel_import=parallel, import_processes=2)
+    spc = load_bruker(None, config, progress)['spc']
+
+    # One pass for the headers and one for the fids, with nothing written to disk
+    assert passes == [bruker_tar, bruker_tar]
+    assert np.allclose(spc.data, expected.data)
@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+import pytest
+
+from nmrbrew import batch
+from nmrbrew.batch import load_configuration, main, run_pipeline
+
+
+def save_configuration(path, import_config, **tools):
+    # As written by MainWindow.onSaveConfig
+    tools['ImportSpectra'] = dict(import_config, filename='')
+    with open(path, 'w') as f:
+        json.dump({'tools': tools}, f)
+    return path
+
+
+@pytest.fixture
+def configuration(import_config, tmp_path):
+    return save_configuration(
+        str(tmp_path / 'config.nmrbrew'), import_config,
+        Binning={'is_active': True, 'bin_size': 0.01, 'bin_offset': 0},
+        Normalisation={'is_active': False, 'algorithm': 'TSA'},
+    )
+
+
+def test_batch_exports_configured_pipeline(configuration, bruker_folder, tmp_path, monkeypatch):
+    def not_run(spc, config, progress_callback, cancel_token=None):
+        raise AssertionError("Inactive tool run")
+
+    pipeline = [(name, not_run if name == 'Normalisation' else kernel) for name, kernel in batch.PIPELINE]
+    monkeypatch.setattr(batch, 'PIPELINE', pipeline)
+
+    output = str(tmp_path / 'out.csv')
+    assert main([configuration, bruker_folder, '-o', output]) == 0
+
+    out = np.loadtxt(output, delimiter=',')
+    ppm, data = out[0], out[1:]
+    assert data.shape[0] == 4
+    assert np.allclose(np.diff(ppm), 0.01)
+
+
+@pytest.mark.parametrize('extension, delimiter', [('.csv', ','), ('.tsv', '\t'), ('.txt', '\t')])
+def test_batch_format_from_extension(configuration, bruker_folder, tmp_path, extension, delimiter):
+    output = str(tmp_path / ('out' + extension))
+    spc = run_pipeline(load_configuration(configuration), bruker_folder, output)
+
+    with open(output) as f:
+        assert f.readline().count(delimiter) == len(spc.ppm) - 1
+
+    out = np.loadtxt(output, delimiter=delimiter)
+    assert np.allclose(out[0], spc.ppm)
+    assert np.allclose(out[1:], spc.data)
+
+
+def test_batch_skips_inactive_tools(import_config, bruker_folder, tmp_path):
+    configuration = load_configuration(save_configuration(
+        str(tmp_path / 'config.nmrbrew'), import_config,
+        Binning={'is_active': False, 'bin_size': 0.01, 'bin_offset': 0},
+    ))
+    spc = run_pipeline(configuration, bruker_folder, str(tmp_path / 'out.csv'))
+
+    # Neither binned nor normalised (which is not in the configuration at all)
+    assert spc.data.shape == (4, import_config['zero_fill_to'])
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+
+import nmrglue as ng
+import numpy as np
+import pytest
+
+from conftest import write_experiment
+from nmrbrew import bruker
+
+
+TRANSFORM = {'remove_digital_filter': True, 'zero_fill': True, 'zero_fill_to': 8192, 'reverse_spectra': True}
+
+
+def read_experiments(folder, tds):
+    return [bruker.read_bruker_fid(write_experiment(folder, n, td=td)) for n, td in enumerate(tds, 1)]
+
+
+def write_pdata(path, real, imag, nc_proc, offset=11.0, sw_p=7200.0, sf=600.0):
+    '''
+    Write processed data (stored scaled down by 2**nc_proc) to path/pdata/1.
+    '''
+    pdata = os.path.join(path, 'pdata', '1')
+    os.makedirs(pdata)
+    procs = {'NC_proc': nc_proc, 'DTYPP': 0, 'BYTORDP': 0, 'OFFSET': offset, 'SW_p': sw_p, 'SF': sf, 'SI': len(real), '_coreheader': [], '_comments': []}
+    ng.bruker.write_jcamp(procs, os.path.join(pdata, 'procs'))
+    for name, data in [('1r', real), ('1i', imag)]:
+        np.asarray(data, dtype='<i4').tofile(os.path.join(pdata, name))
+
+
+def test_read_ahead_order_and_bound(monkeypatch):
+    lock = threading.Lock()
+    state = {'started': 0, 'max_ahead': 0}
+    yielded = []
+
+    def read(fid):
+        with lock:
+            state['started'] += 1
+            state['max_ahead'] = max(state['max_ahead'], state['started'] - len(yielded))
+        if fid == 0:
+            time.sleep(0.3)  # One slow read holds up everything after it
+        return {'fid': fid}, np.zeros(4)
+
+    monkeypatch.setattr(bruker, 'read_bruker_fid_mmap', read)
+
+    for dic, data in bruker.read_ahead(list(range(40)), threads=4, buffer_size=5):
+        yielded.append(dic['fid'])
+
+    assert yielded == list(range(40))
+    assert state['max_ahead'] <= 5
+
+
+def test_read_ahead_stops_readers_when_closed(monkeypatch):
+    monkeypatch.setattr(bruker, 'read_bruker_fid_mmap', lambda fid: ({'fid': fid}, None))
+    before = threading.active_count()
+
+    reads = bruker.read_ahead(list(range(100)), threads=4, buffer_size=2)
+    next(reads)
+    reads.close()
+
+    assert threading.active_count() == before
+
+
+def test_batched_transform_matches_per_fid(tmp_path):
+    # Two TDs, so two blocks, interleaved with an unreadable experiment
+    raw = read_experiments(str(tmp_path), [4096, 2048, 4096, 4096, 2048])
+    raw.insert(2, (None, None))
+
+    single = bruker.transform_fids([(dic and dict(dic), data) for dic, data in raw], dict(TRANSFORM, batch_transform=False))
+    batched = bruker.transform_fids([(dic and dict(dic), data) for dic, data in raw], dict(TRANSFORM, batch_transform=True))
+
+    assert batched[2] == (None, None) and single[2] == (None, None)
+    for (sdic, sdata), (bdic, bdata) in zip(single, batched):
+        if sdata is None:
+            continue
+        assert bdata.shape == sdata.shape == (8192,)
+        assert np.allclose(bdata, sdata, rtol=1e-9, atol=1e-6 * np.abs(sdata).max())
+        assert np.isclose(bdic['qc']['truncation'], sdic['qc']['truncation'])
+
+
+def test_ppm_axis_matches_acquisition_parameters():
+    dic = {'acqus': {'SW': 11.9877, 'O1': 2822.5, 'BF1': 600.13}}
+    size = 32768
+
+    # As previously calculated for every import, which assumed 32768 points
+    offset = (11.9877 / 2) - (2822.5 / 600.13)
+    expected = np.arange(11.9877 - offset, -offset, -11.9877 / size)[:size]
+
+    ppm = bruker.ppm_axis(dic, size)
+    assert ppm.shape == (size,)
+    assert np.allclose(ppm, expected)
+
+    assert np.allclose(bruker.ppm_axis(dic, size, reverse=False), expected[::-1])
+    assert np.allclose(np.diff(bruker.ppm_axis(dic, 8192)), -11.9877 / 8192)
+
+
+def test_resample_onto_target_axis():
+    target = np.linspace(10, 0, 1001)
+    shifted = np.linspace(10.5, 0.5, 2001)  # Offset, finer, and not covering the low end of target
+
+    # Linear in ppm, so interpolation is exact
+    data = [2 * shifted + n for n in range(3)] + [target.copy()]
+    axes = [shifted, shifted, shifted, target]
+
+    out = bruker.resample_to_axis(data, axes, target)
+
+    assert out[3] is data[3]  # Already on target
+    covered = target >= 0.5
+    for n in range(3):
+        assert out[n].shape == target.shape
+        assert np.allclose(out[n][covered], 2 * target[covered] + n)
+        assert np.all(out[n][~covered] == 0)
+
+    # The block precision is kept
+    block = bruker.resample_block(np.array(data[:3], dtype=np.complex64), shifted, target)
+    assert block.dtype == np.complex64
+
+
+def test_pdata_scaled_by_nc_proc(tmp_path):
+    rs = np.random.RandomState(0)
+    real, imag = rs.randint(-1000, 1000, (2, 4096))
+    paths = []
+    for n, nc_proc in enumerate([2, -1, 0], 1):
+        paths.append(write_experiment(str(tmp_path), n))
+        write_pdata(paths[-1], real * n, imag * n, nc_proc)
+
+    config = {'pdata_number': 1, 'pdata_imaginary': True}
+    spectra = list(bruker.load_bruker_pdatas(paths + [str(tmp_path / 'missing')], config))
+
+    assert [fid for fid, dic, data in spectra] == paths + [str(tmp_path / 'missing')]
+    assert spectra[-1][1:] == (None, None)
+    for (fid, dic, data), n, scale in zip(spectra, [1, 2, 3], [4.0, 0.5, 1.0]):
+        assert np.allclose(data, (real + 1j * imag) * n * scale)
+
+    # Only the real part unless asked for
+    fid, dic, data = next(bruker.load_bruker_pdatas(paths, {'pdata_number': 1}))
+    assert np.isrealobj(data) and np.allclose(data, real * 4.0)
+
+    ppm = bruker.pdata_axis(dic, 4096)
+    assert ppm[0] == 11.0
+    assert np.allclose(np.diff(ppm), -7200.0 / 600.0 / 4096)
+
+
+
+@pytest.mark.parametrize('precision, dtype, real_dtype', [('single', np.complex64, np.float32), ('double', np.complex128, np.float64)])
+def test_precision(tmp_path, precision, dtype, real_dtype):
+    paths = [write_experiment(str(tmp_path), n) for n in range(1, 3)]
+    raw = [bruker.read_bruker_fid(path) for path in paths]
+    for batch_transform in [False, True]:
+        config = dict(TRANSFORM, batch_transform=batch_transform, precision=precision)
+        for dic, data in bruker.transform_fids([(dict(dic), data) for dic, data in raw], config):
+            assert data.dtype == dtype
+
+    for path in paths:
+        write_pdata(path, np.arange(4096), np.arange(4096), 1)
+    for pdata_imaginary, expected in [(True, dtype), (False, real_dtype)]:
+        config = {'pdata_number': 1, 'pdata_imaginary': pdata_imaginary, 'precision': precision}
+        for fid, dic, data in bruker.load_bruker_pdatas(paths, config):
+            assert data.dtype == expected
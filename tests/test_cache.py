@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+
+from nmrbrew.cache import FidCache
+
+from conftest import write_experiment
+
+
+def test_fid_cache_key(tmp_path):
+    path = write_experiment(str(tmp_path / 'data'), 1)
+    cache = FidCache(str(tmp_path / 'cache'))
+    config = {'zero_fill_to': 8192}
+
+    key = cache.key(path, config)
+    assert key == cache.key(path, dict(config, qc=True))  # Doesn't affect the transform
+    assert key != cache.key(path, dict(config, zero_fill_to=16384))
+
+    st = os.stat(os.path.join(path, 'fid'))
+    os.utime(os.path.join(path, 'fid'), (st.st_atime, st.st_mtime + 10))
+    assert key != cache.key(path, config)
+
+    assert cache.key(str(tmp_path / 'missing'), config) is None
+
+
+def test_fid_cache_put_get(tmp_path):
+    cache = FidCache(str(tmp_path))
+    data = np.arange(100, dtype=complex)
+
+    assert 'a' not in cache and cache.get('a') is None
+    cache.put('a', {'acqus': {'TD': 200}}, data)
+    assert 'a' in cache
+
+    dic, cached = cache.get('a')
+    assert dic == {'acqus': {'TD': 200}}
+    assert np.array_equal(cached, data)
+    assert not [fn for fn in os.listdir(str(tmp_path)) if fn.endswith('.tmp')]
+
+
+def test_fid_cache_evicts_least_recently_used(tmp_path):
+    cache = FidCache(str(tmp_path))
+    data = np.zeros(1000)
+    for n, key in enumerate(['a', 'b', 'c']):
+        cache.put(key, {}, data)
+        os.utime(cache.filename(key), (n, n))
+
+    cache.get('a')  # Used since; now the most recent
+    cache.max_size = os.path.getsize(cache.filename('a')) * 2
+    cache.evict()
+
+    assert 'a' in cache and 'c' in cache
+    assert 'b' not in cache
+
+
+def test_fid_cache_from_config(tmp_path):
+    assert FidCache.from_config({'use_cache': False}) is None
+
+    cache = FidCache.from_config({'use_cache': True, 'cache_dir': str(tmp_path), 'cache_size': 1})
+    assert cache.path == str(tmp_path)
+    assert cache.max_size == 1024 * 1024
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+from nmrbrew import bruker
+from nmrbrew.processing import binning
+from nmrbrew.processing.cancel import CancelToken, Cancelled, Generation
+from nmrbrew.processing.import_spectra import load_bruker
+from nmrbrew.processing.spectra import Spectra
+
+
+def spectra(n=200, m=2000):
+    return Spectra(ppm=np.linspace(10, 0, m), data=np.random.RandomState(0).rand(n, m))
+
+
+def test_cancel_stops_chunked_kernel(monkeypatch):
+    token = CancelToken()
+    chunks = []
+    bin_rows = binning.bin_rows
+
+    def counted(rows, scale, bins):
+        chunks.append(len(rows))
+        return bin_rows(rows, scale, bins)
+
+    monkeypatch.setattr(binning, 'bin_rows', counted)
+
+    def progress(p):
+        if len(chunks) == 3:
+            token.cancel()
+
+    spc = spectra()
+    with pytest.raises(Cancelled):
+        binning.binning(spc.view(), {'bin_size': 0.1, 'bin_offset': 0}, progress, cancel_token=token)
+
+    # Stopped at the check after the next chunk, long before all 200 rows were binned
+    assert len(chunks) == 4 and sum(chunks) < len(spc)
+
+    # An uncancelled token lets it run to the end
+    out = binning.binning(spc.view(), {'bin_size': 0.1, 'bin_offset': 0}, lambda p: None, cancel_token=CancelToken())['spc']
+    assert out.data.shape[0] == len(spc)
+
+
+def test_cancel_stops_import(import_config, monkeypatch):
+    token = CancelToken()
+    reads = []
+    read_bruker_fid = bruker.read_bruker_fid
+
+    def counted(fn):
+        reads.append(fn)
+        return read_bruker_fid(fn)
+
+    monkeypatch.setattr(bruker, 'read_bruker_fid', counted)
+
+    def progress(p):
+        token.cancel()
+
+    config = dict(import_config, batch_size=1)
+    with pytest.raises(Cancelled):
+        load_bruker(None, config, progress, cancel_token=token)
+
+    assert 0 < len(reads) < 4
+
+
+def test_out_of_date_result_discarded():
+    generation = Generation()
+
+    # A run is started, then the config is changed before it finishes
+    started = generation.current()
+    generation.advance()
+    assert not generation.is_current(started)
+
+    # The re-run, started after the change, is kept, until the next change
+    rerun = generation.current()
+    assert generation.is_current(rerun)
+    generation.advance()
+    assert not generation.is_current(rerun)
@@ -0,0 +1,14 @@
+import os
+import runpy
+import sys
+
+SCRIPT = os.path.join(os.path.dirname(__file__), '..', 'NMRbrew.py')
+
+
+def test_entry_point_is_guarded():
+    # Spawned worker processes run the main script as __mp_main__; that must not start
+    # the application or load Qt
+    runpy.run_path(SCRIPT, run_name='__mp_main__')
+
+    assert 'nmrbrew.nmrbrew' not in sys.modules
+    assert 'PyQt5' not in sys.modules
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from nmrbrew.processing import shared
+from nmrbrew.processing.cancel import CancelToken, Cancelled
+from nmrbrew.processing.executor import Executor, map_rows, row_chunks
+
+
+def double(rows, k):
+    return rows * k
+
+
+def total(rows):
+    return rows.sum(axis=1, keepdims=True)
+
+
+def offset(rows, k, offsets):
+    return rows * k + offsets
+
+
+@pytest.fixture
+def data():
+    return np.random.RandomState(0).rand(300, 50)
+
+
+def test_row_chunks():
+    chunks = row_chunks(130)
+    assert chunks[0][0] == 0 and chunks[-1][1] == 130
+    assert all(a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
+    assert row_chunks(0) == []
+
+
+@pytest.mark.parametrize('backend', ['serial', 'thread', 'process'])
+def test_map_rows_backends(backend, data):
+    out = map_rows(double, data, (2.0, ), backend=backend, workers=2)
+    assert np.allclose(out, data * 2)
+
+    # The shape and dtype of the output follow the function
+    out = map_rows(total, data, backend=backend, workers=2)
+    assert out.shape == (300, 1)
+    assert np.allclose(out[:, 0], data.sum(axis=1))
+
+
+@pytest.mark.parametrize('backend', ['serial', 'thread', 'process'])
+def test_map_rows_row_args(backend, data):
+    offsets = np.arange(300, dtype=float)[:, None]
+    out = map_rows(offset, data, (2.0, ), backend=backend, workers=2, row_args=(offsets, ))
+    assert np.allclose(out, data * 2 + offsets)
+
+
+def test_map_rows_process_result_is_shared(data):
+    out = map_rows(double, data, (2.0, ), backend='process', workers=2)
+    assert shared.is_shared(out)
+
+    # Shared views are passed to workers without a copy
+    out2 = map_rows(double, out[:, ::2], (2.0, ), backend='process', workers=2)
+    assert np.allclose(out2, data[:, ::2] * 4)
+
+
+def test_map_rows_cancel(data):
+    token = CancelToken()
+    calls = []
+
+    def progress(p):
+        calls.append(p)
+        if len(calls) == 2:
+            token.cancel()
+
+    with pytest.raises(Cancelled):
+        map_rows(double, data, (2.0, ), backend='thread', workers=2, progress_callback=progress, cancel_token=token)
+    assert len(calls) == 2
+
+
+def test_executor_reuses_pool(data):
+    executor = Executor('process', 2)
+    try:
+        assert np.allclose(executor.map_rows(double, data, (2.0, )), data * 2)
+        pool = executor.pool()
+        assert np.allclose(executor.map_rows(double, data, (3.0, )), data * 3)
+        assert executor.pool() is pool
+    finally:
+        executor.close()
+
+    assert executor._pool_ is None
+
+
+def test_executor_restarts_pool_after_cancel(data):
+    executor = Executor('thread', 2)
+    token = CancelToken()
+    token.cancel()
+    try:
+        pool = executor.pool()
+        with pytest.raises(Cancelled):
+            executor.map_rows(double, data, (2.0, ), cancel_token=token)
+        assert executor.pool() is not pool
+        assert np.allclose(executor.map_rows(double, data, (2.0, )), data * 2)
+    finally:
+        executor.close()
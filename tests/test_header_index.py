@@ -0,0 +1,63 @@
+import os
+
+from nmrbrew import header_index
+from nmrbrew.bruker import find_bruker_fids
+from nmrbrew.header_index import HeaderIndex, read_acqus_header
+
+from conftest import write_experiment
+
+
+def headers(folder):
+    index = HeaderIndex(folder)
+    try:
+        return index.headers(find_bruker_fids(folder))
+    finally:
+        index.close()
+
+
+def test_header_index(bruker_folder, monkeypatch):
+    first = headers(bruker_folder)
+    assert os.path.exists(os.path.join(bruker_folder, HeaderIndex.filename))
+    assert len(first) == 4
+
+    for header in first:
+        expected = read_acqus_header(header['path'])
+        assert all(header[k] == expected[k] for k in expected)
+
+    reads = []
+
+    def counted(path):
+        reads.append(path)
+        return read_acqus_header(path)
+
+    monkeypatch.setattr(header_index, 'read_acqus_header', counted)
+
+    # Unchanged experiments come from the index
+    assert headers(bruker_folder) == first
+    assert reads == []
+
+    # Only new or changed ones are read
+    new = write_experiment(bruker_folder, 5)
+    changed = first[0]['path']
+    with open(os.path.join(changed, 'acqus'), 'a') as f:
+        f.write('\n')
+
+    second = headers(bruker_folder)
+    assert len(second) == 5
+    assert sorted(reads) == sorted([new, changed])
+
+
+def test_header_index_forgets_removed(bruker_folder):
+    headers(bruker_folder)
+
+    removed = find_bruker_fids(bruker_folder)[0]
+    os.remove(os.path.join(removed, 'fid'))
+    headers(bruker_folder)
+
+    index = HeaderIndex(bruker_folder)
+    try:
+        stored = [row[0] for row in index.db.execute('SELECT path FROM experiments')]
+    finally:
+        index.close()
+    assert len(stored) == 3
+    assert os.path.relpath(removed, bruker_folder) not in stored
@@ -0,0 +1,161 @@
+import gc
+import glob
+import os
+import shutil
+import time
+
+import numpy as np
+
+from nmrbrew import bruker
+from nmrbrew.processing.import_spectra import load_bruker, load_bruker_new
+from nmrbrew.store import array_root
+
+from conftest import write_experiment
+
+
+def progress(p):
+    pass
+
+
+def test_load_bruker(import_config):
+    spc = load_bruker(None, import_config, progress)['spc']
+
+    assert spc.data.shape == (4, 8192)
+    assert spc.ppm.shape == (8192,)
+    assert len(spc.row_metadata['path']) == 4
+
+
+def test_load_bruker_single_precision(bruker_folder, import_config):
+    expected = load_bruker(None, import_config, progress)['spc']
+
+    config = dict(import_config, precision='single')
+    spc = load_bruker(None, config, progress)['spc']
+    assert spc.data.dtype == np.complex64
+    assert np.allclose(spc.data, expected.data, rtol=1e-4, atol=1e-4 * np.abs(expected.data).max())
+
+    # Kept when appending new experiments
+    write_experiment(bruker_folder, 5)
+    assert load_bruker_new(spc, config, progress)['spc'].data.dtype == np.complex64
+
+
+def test_load_bruker_new_appends(bruker_folder, import_config):
+    spc = load_bruker(None, import_config, progress)['spc']
+
+    write_experiment(bruker_folder, 5)
+    write_experiment(bruker_folder, 6)
+    result = load_bruker_new(spc, import_config, progress)
+
+    assert result['new'] == 2
+    new = result['spc']
+    assert new.data.shape == (6, 8192)
+    assert np.array_equal(new.data[:4], spc.data)
+    assert len(new.labels) == len(new.class_codes) == len(new.outliers) == 6
+    assert list(new.row_metadata['path'][:4]) == list(spc.row_metadata['path'])
+    assert len(set(new.row_metadata['path'])) == 6
+
+
+def test_load_bruker_new_nothing_new(import_config):
+    spc = load_bruker(None, import_config, progress)['spc']
+    result = load_bruker_new(spc, import_config, progress)
+
+    # No spectra in the result, so nothing is post-processed or stored
+    assert result == {'new': 0}
+
+
+def test_load_bruker_new_skips_failed_until_changed(bruker_folder, import_config, monkeypatch):
+    spc = load_bruker(None, import_config, progress)['spc']
+
+    broken = write_experiment(bruker_folder, 5)
+    with open(os.path.join(broken, 'fid'), 'wb') as f:
+        f.write(b'\0' * 7)  # Still being acquired
+
+    reads = []
+    read = bruker.read_bruker_fid_mmap
+
+    def counted(fn):
+        reads.append(fn)
+        return read(fn)
+
+    monkeypatch.setattr(bruker, 'read_bruker_fid_mmap', counted)
+
+    result = load_bruker_new(spc, import_config, progress)
+    assert result['new'] == 0 and 'spc' not in result
+    assert list(result['metadata']['load_failed']) == [broken]
+    spc.metadata = result['metadata']  # As ImportSpectra keeps it
+
+    reads[:] = []
+    result = load_bruker_new(spc, import_config, progress)
+    assert result == {'new': 0}
+    assert reads == []
+
+    # Retried once the experiment has changed
+    time.sleep(0.01)
+    shutil.rmtree(broken)
+    write_experiment(bruker_folder, 5)
+    result = load_bruker_new(spc, import_config, progress)
+    assert result['new'] == 1
+    assert result['spc'].metadata['load_failed'] == {}
+
+
+def test_load_bruker_new_grows_in_place(bruker_folder, import_config):
+    spc = load_bruker(None, import_config, progress)['spc']
+
+    write_experiment(bruker_folder, 5)
+    first = load_bruker_new(spc, import_config, progress)['spc']
+    write_experiment(bruker_folder, 6)
+    second = load_bruker_new(first.view(), import_config, progress)['spc']
+
+    assert array_root(second.data) is array_root(first.data)
+    assert first.data.shape == (5, 8192)
+    assert second.data.shape == (6, 8192)
+    assert np.array_equal(second.data[:5], first.data)
+
+    # Appending to an earlier import again leaves the later one untouched
+    previous = second.data.copy()
+    write_experiment(bruker_folder, 7)
+    third = load_bruker_new(first.view(), import_config, progress)['spc']
+    assert array_root(third.data) is not array_root(second.data)
+    assert np.array_equal(second.data, previous)
+    assert third.data.shape == (7, 8192)
+
+
+def test_load_bruker_new_qc_turned_on(bruker_folder, import_config):
+    spc = load_bruker(None, import_config, progress)['spc']
+
+    write_experiment(bruker_folder, 5)
+    import_config['qc'] = True
+    new = load_bruker_new(spc, import_config, progress)['spc']
+
+    # Measures missing for the spectra loaded before are NaN
+    assert np.isnan(new.row_metadata['snr'][:4]).all()
+    assert not np.isnan(new.row_metadata['snr'][4])
+
+
+def test_parallel_import_matches_serial(import_config):
+    serial = load_bruker(None, import_config, progress)['spc']
+
+    import_config['parallel_import'] = True
+    import_config['import_processes'] = 2
+    parallel = load_bruker(None, import_config, progress)['spc']
+
+    assert np.allclose(parallel.data, serial.data)
+    assert list(parallel.row_metadata['path']) == list(serial.row_metadata['path'])
+
+
+def test_out_of_core_store_removed_when_released(import_config):
+    import_config['out_of_core'] = True
+    spc = load_bruker(None, import_config, progress)['spc']
+    stores = glob.glob(os.path.join(import_config['cache_dir'], 'spectra', '*.npy'))
+
+    assert len(stores) == 1
+    assert isinstance(array_root(spc.data), np.memmap)
+    assert spc.data.shape == (4, 8192)
+
+    view = spc.view()
+    del spc
+    gc.collect()
+    assert os.path.exists(stores[0])  # Still mapped by the view
+
+    del view
+    gc.collect()
+    assert not os.path.exists(stores[0])
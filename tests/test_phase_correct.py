@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+from nmrbrew.processing.executor import Executor
+from nmrbrew.processing.phase_correct import autophase, autophase_rows
+from nmrbrew.processing.spectra import Spectra
+
+
+def progress(p):
+    pass
+
+
+def dephased_spectra(n=80, size=512):
+    '''
+    Spectra of two Lorentzian peaks with a slowly drifting zero order phase error.
+    '''
+    x = np.arange(size)
+    peaks = sum(h / (1 + 1j * (x - c) / w) for h, c, w in [(1.0, 150, 4.0), (0.6, 350, 6.0)])
+    phases = np.deg2rad(np.linspace(10, 60, n))
+    return Spectra(ppm=np.linspace(10, 0, size), data=peaks[None, :] * np.exp(1j * phases)[:, None])
+
+
+@pytest.mark.parametrize('algorithm', ['acme'])
+def test_autophase_backends_agree(algorithm):
+    spc = dephased_spectra()
+    serial = autophase(spc.view(), {'algorithm': algorithm}, progress)['spc'].data
+
+    executor = Executor('process', workers=2)
+    try:
+        parallel = autophase(spc.view(), {'algorithm': algorithm}, progress, executor=executor)['spc'].data
+    finally:
+        executor.close()
+
+    assert np.allclose(parallel, serial)
+
+    # Chunks start warm, so the result is close to phasing every spectrum in one run
+    single = autophase_rows(spc.data, algorithm)
+    scale = np.abs(single).max()
+    assert np.abs(serial - single).max() / scale < 0.05
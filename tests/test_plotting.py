@@ -0,0 +1,57 @@
+import numpy as np
+
+from nmrbrew.processing.plotting import MAX_PLOT_POINTS, downsample_rows, plot_buffers, visible_bounds
+from nmrbrew.processing.spectra import Spectra
+
+
+def spectra(n=3, m=20000):
+    data = np.random.RandomState(0).rand(n, m)
+    data[:, m // 3] = 10.0  # A single point peak
+    return Spectra(ppm=np.linspace(10, 0, m), data=data)
+
+
+def test_downsample_rows_keeps_peaks():
+    spc = spectra()
+    ppm, data = downsample_rows(spc.ppm, spc.data)
+
+    assert data.shape == (3, len(ppm))
+    assert len(ppm) <= MAX_PLOT_POINTS + 2
+    assert np.allclose(data.max(axis=1), 10.0)
+    assert np.allclose(data.min(axis=1), spc.data.min(axis=1))
+
+
+def test_downsample_rows_small_unchanged():
+    spc = spectra(m=1000)
+    ppm, data = downsample_rows(spc.ppm, spc.data)
+
+    assert np.array_equal(ppm, spc.ppm)
+    assert np.array_equal(data, spc.data.astype(np.float32))
+
+
+def test_plot_buffers():
+    buffers = plot_buffers(spectra())
+
+    assert buffers['mean'].shape == buffers['ppm'].shape
+    assert buffers['ylim'][1] > 10.0
+
+
+def test_visible_bounds_descending_axis():
+    ppm = np.linspace(10, 0, 1001)  # 0.01 ppm per point
+
+    start, stop = visible_bounds(ppm, 4.0, 5.0, margin=0)
+    assert (start, stop) == (500, 601)
+    assert ppm[start] == 5.0 and ppm[stop - 1] == 4.0
+
+    start, stop = visible_bounds(ppm, 4.0, 5.0)
+    assert (start, stop) == (475, 626)
+
+    assert visible_bounds(ppm, 20.0, 30.0) == (0, 0)
+
+
+def test_zoomed_range_at_full_resolution():
+    spc = spectra()
+    start, stop = visible_bounds(spc.ppm, 3.5, 4.0)
+    ppm, data = downsample_rows(spc.ppm[start:stop], spc.data[:, start:stop])
+
+    assert stop - start < MAX_PLOT_POINTS
+    assert np.array_equal(ppm, spc.ppm[start:stop])
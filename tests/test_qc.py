@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+
+from nmrbrew.qc import snr, linewidth, qc_pass
+
+SF = 600.0  # MHz
+PHASES = [0, 30, 60, 90, 150, 210, 300]
+
+
+def lorentzian_spectra(phases, fwhm_hz=1.0, noise=0.0, seed=0):
+    '''
+    Complex spectra of a TMSP peak (at 0 ppm) of fwhm_hz plus a larger peak at 3 ppm, each
+    row with a zero order phase error (degrees) from phases.
+    '''
+    ppm = np.linspace(11, -1, 2 ** 16)
+    gamma = fwhm_hz / 2 / SF  # Half width, ppm
+
+    def peak(centre, height):
+        return height * gamma / (gamma - 1j * (ppm - centre))
+
+    rng = np.random.RandomState(seed)
+    block = np.array([
+        (peak(0, 1.0) + peak(3, 5.0)) * np.exp(1j * np.deg2rad(p)) +
+        noise * (rng.randn(len(ppm)) + 1j * rng.randn(len(ppm)))
+        for p in phases
+    ])
+    return block, ppm
+
+
+def test_linewidth_independent_of_phase():
+    block, ppm = lorentzian_spectra(PHASES)
+    lw = linewidth(block, ppm, [SF] * len(PHASES))
+
+    assert np.allclose(lw, 1.0, atol=0.05)
+
+
+def test_linewidth_real_spectra():
+    block, ppm = lorentzian_spectra([0, 180])
+    lw = linewidth(np.real(block), ppm, [SF, SF])
+
+    assert np.allclose(lw, 1.0, atol=0.05)
+
+
+def test_snr_independent_of_phase():
+    block, ppm = lorentzian_spectra(PHASES, noise=0.01)
+    measured = snr(block, ppm, (9.5, 10.5))
+
+    # Signal is the 3 ppm peak: 5 over twice the noise
+    assert np.allclose(measured, 5 / 0.02, rtol=0.1)
+    assert measured.max() / measured.min() < 1.1
+
+
+def test_qc_pass_dephased_spectra_pass():
+    block, ppm = lorentzian_spectra(PHASES, noise=0.01)
+    qc = {
+        'snr': snr(block, ppm, (9.5, 10.5)),
+        'linewidth': linewidth(block, ppm, [SF] * len(PHASES)),
+        'truncation': [np.nan] * len(PHASES),
+    }
+    config = {'qc_min_snr': 10.0, 'qc_max_linewidth': 2.0, 'qc_max_truncation': 0.05}
+
+    assert qc_pass(qc, config).all()
+
+
+def test_qc_pass_rejects_broad_lines():
+    block, ppm = lorentzian_spectra([0, 90], fwhm_hz=3.0)
+    qc = {
+        'snr': [100, 100],
+        'linewidth': linewidth(block, ppm, [SF, SF]),
+        'truncation': [np.nan, np.nan],
+    }
+    config = {'qc_min_snr': 10.0, 'qc_max_linewidth': 2.0, 'qc_max_truncation': 0.05}
+
+    assert not qc_pass(qc, config).any()
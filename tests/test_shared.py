@@ -0,0 +1,50 @@
+import gc
+
+import numpy as np
+import pytest
+
+from nmrbrew.processing import shared
+
+pytestmark = pytest.mark.skipif(not shared.is_available(), reason='Shared memory is not available')
+
+
+def test_share_and_attach():
+    data = np.random.RandomState(0).rand(10, 20)
+    a = shared.share(data)
+
+    assert shared.is_shared(a) and not shared.is_shared(data)
+    assert shared.share(a) is a
+    assert shared.share(None) is None
+
+    # Views attach to the same memory, at their offset
+    view = a[3:6, 5:]
+    shm, attached = shared.attach(shared.spec(view))
+    try:
+        assert np.array_equal(attached, data[3:6, 5:])
+        attached[0, 0] = -1
+        assert a[3, 5] == -1
+    finally:
+        del attached
+        shm.close()
+
+
+def test_share_keeps_read_only():
+    data = np.zeros(5)
+    data.flags.writeable = False
+    assert not shared.share(data).flags.writeable
+
+
+def test_block_released_with_array():
+    a = shared.empty((100, ), float)
+    name = shared.spec(a)[0]
+    view = a[10:]
+    assert name in shared._blocks
+
+    del a
+    gc.collect()
+    assert name in shared._blocks  # Still held by the view
+
+    del view
+    gc.collect()
+    shared.collect()
+    assert name not in shared._blocks
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from nmrbrew.processing.compress_bins import exclude as compress_bins
+from nmrbrew.processing.spectra import Spectra
+
+
+def progress(p):
+    pass
+
+
+def spectra(n=6, m=200):
+    return Spectra(
+        ppm=np.linspace(10, 0, m),
+        data=np.random.RandomState(0).rand(n, m),
+        labels=['s%d' % i for i in range(n)],
+        classes=['A', 'B', 'A', 'C', 'B', 'A'][:n],
+        outliers=np.arange(n) / 10.,
+        row_metadata={'path': ['exp/%d' % i for i in range(n)], 'snr': np.arange(n) * 2.},
+    )
+
+
+def test_view_is_copy_on_write():
+    spc = spectra()
+    data, ppm = spc.data.copy(), spc.ppm.copy()
+
+    view = spc.view()
+    assert np.shares_memory(view.data, spc.data)
+    with pytest.raises(ValueError):
+        view.data[0, 0] = -1
+
+    view.detach('data', 'ppm')
+    view.data[:] = -1
+    view.ppm[:] = -1
+    view.labels[0] = 'changed'
+    view.outliers[0] = 1.0
+    view.row_metadata['snr'][0] = -1
+
+    assert np.array_equal(spc.data, data) and np.array_equal(spc.ppm, ppm)
+    assert spc.labels[0] == 's0' and spc.outliers[0] == 0 and spc.row_metadata['snr'][0] == 0
+    assert spc.data.flags.writeable  # The original is still writeable by its owner
+
+
+def test_kernel_on_view_leaves_parent():
+    spc = spectra()
+    data, ppm = spc.data.copy(), spc.ppm.copy()
+
+    out = compress_bins(spc.view(), {'selected_data_regions': [['Region', 4.0, 5.0]]}, progress)['spc']
+
+    assert out.data.shape[1] < data.shape[1]
+    assert np.array_equal(spc.data, data) and np.array_equal(spc.ppm, ppm)
+
+
+@pytest.mark.parametrize('mask', [
+    np.array([True, False, True, True, False, True]),
+    np.array([5, 0, 3]),
+])
+def test_select_keeps_rows_aligned(mask):
+    spc = spectra()
+    sel = spc.select(mask)
+    rows = np.arange(6)[mask]
+
+    assert len(sel) == len(rows)
+    for n, row in enumerate(rows):
+        assert np.array_equal(sel.data[n], spc.data[row])
+        assert sel.labels[n] == 's%d' % row
+        assert sel.classes[n] == spc.classes[row]
+        assert sel.outliers[n] == row / 10.
+        assert sel.row_metadata['path'][n] == 'exp/%d' % row
+        assert sel.row_metadata['snr'][n] == row * 2.
+
+    assert sel.ppm is spc.ppm and sel.classmap is spc.classmap
+
+
+def test_classes_are_categorical():
+    spc = spectra()
+
+    assert list(spc.classmap) == ['A', 'B', 'C']
+    assert list(spc.class_codes) == [0, 1, 0, 2, 1, 0]
+    assert list(spc.classes) == ['A', 'B', 'A', 'C', 'B', 'A']
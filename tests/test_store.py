@@ -0,0 +1,129 @@
+import os
+
+import numpy as np
+import pytest
+
+from nmrbrew.processing.spectra import Spectra
+from nmrbrew.store import StageStore, ResultCache, array_root, is_resident
+
+
+def result(data):
+    return {'spc': Spectra(ppm=np.linspace(10, 0, data.shape[1]), data=data)}
+
+
+def put(store, stage, r):
+    # As a tool does: prepared in its worker, then stored
+    store.put(stage, store.prepare(stage, r))
+
+
+@pytest.fixture
+def data():
+    return np.random.RandomState(0).rand(20, 100)
+
+
+def test_result_cache_unchanged_by_stage_store(data, tmp_path):
+    store = StageStore(budget=1, scratch_dir=str(tmp_path))
+    cache = ResultCache(max_size=1 << 30)
+
+    r = result(data)
+    cache.put('key', r)
+    put(store, 'a', r)
+    put(store, 'b', result(data + 1))
+    store.enforce_budget()  # Spills 'a'
+
+    assert isinstance(store.stages['a']['spc'].data, np.memmap)
+    cached = cache.get('key')
+    assert cached['spc'].data is data
+    assert not isinstance(cached['spc'].data, np.memmap)
+
+    # Nor does storing a result from the cache change the cached result
+    put(store, 'a', cached)
+    put(store, 'c', result(data + 2))
+    assert cache.get('key')['spc'].data is data
+
+
+def test_stage_store_dedupe(data):
+    store = StageStore()
+    put(store, 'a', result(data))
+    put(store, 'b', result(data.copy()))
+
+    a, b = store.get('a')['spc'].data, store.get('b')['spc'].data
+    assert array_root(b) is array_root(a)
+    assert not b.flags.writeable
+    assert store.sizes()['b'] == 0  # Data and ppm are both held by 'a'
+
+    put(store, 'c', result(data + 1))
+    assert array_root(store.get('c')['spc'].data) is not array_root(a)
+
+
+def test_stage_store_put_only_stores(data):
+    store = StageStore(shared=True)
+    put(store, 'a', result(data))
+
+    # Nothing is compared or copied by put itself
+    r = result(data.copy())
+    spc = r['spc']
+    a = spc.data
+    store.put('b', r)
+    assert store.get('b') is r and store.get('b')['spc'] is spc
+    assert spc.data is a
+
+
+def test_stage_store_spill_and_page_in(data, tmp_path):
+    store = StageStore(budget=data.nbytes + 4096, scratch_dir=str(tmp_path))
+    put(store, 'a', result(data))
+    put(store, 'b', result(data + 1))
+    assert not store.spilled  # Only spilled by enforce_budget, e.g. in the background
+
+    store.enforce_budget()
+
+    # The least recently used stage is spilled, the latest kept
+    assert 'a' in store.spilled and 'b' not in store.spilled
+    assert isinstance(array_root(store.stages['a']['spc'].data), np.memmap)
+    filenames = list(store.spilled['a'])
+    assert all(os.path.exists(fn) for fn in filenames)
+    assert store.resident_size() <= store.budget
+
+    # Reading it leaves it mapped; paging it in reads it back (and spilling again the other)
+    assert not is_resident(store.get('a')['spc'].data)
+    a = store.page_in('a')['spc']
+    store.enforce_budget()
+    assert is_resident(a.data)
+    assert np.array_equal(a.data, data)
+    assert 'a' not in store.spilled and 'b' in store.spilled
+    assert not any(os.path.exists(fn) for fn in filenames)
+
+    store.close()
+    assert not os.listdir(str(tmp_path))
+
+
+def test_stage_store_spill_keeps_shared_arrays(data, tmp_path):
+    store = StageStore(budget=1, scratch_dir=str(tmp_path))
+    put(store, 'a', result(data))
+    put(store, 'b', result(data.copy()))  # Deduplicated against 'a'
+    store.enforce_budget()
+
+    # Spilling 'a' would free nothing while 'b' holds its data
+    assert is_resident(store.stages['a']['spc'].data)
+
+
+def test_stage_store_spill_of_replaced_stage(data, tmp_path, monkeypatch):
+    store = StageStore(budget=1, scratch_dir=str(tmp_path))
+    put(store, 'a', result(data))
+    put(store, 'b', result(data + 1))
+
+    # The stage is re-run while its old output is being written out
+    new = result(data + 2)
+    save = np.save
+
+    def replaced(f, a):
+        store.put('a', new)
+        save(f, a)
+
+    monkeypatch.setattr(np, 'save', replaced)
+    store.spill('a')
+
+    assert store.get('a') is new
+    assert is_resident(new['spc'].data)
+    assert 'a' not in store.spilled
+    assert not os.listdir(store.scratch())